@@ -3,7 +3,7 @@ API 数据模型定义
 """
 
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 
 # ==================== 请求模型 ====================
 
@@ -16,12 +16,26 @@ class PrecisionTestRequest(BaseModel):
 class LatencyTestRequest(BaseModel):
     """延迟测试请求模型"""
     proxy_url: str
+    samples: Optional[int] = None  # 采样次数，默认 LATENCY_TEST_SAMPLES
+
+
+class LatencyTarget(BaseModel):
+    """批量延迟测试的单个目标"""
+    id: Optional[str] = None  # 节点 ID，原样返回便于前端对应
+    proxy_url: str
+
+
+class LatencyBatchRequest(BaseModel):
+    """批量延迟测试请求模型"""
+    targets: List[LatencyTarget]
+    samples: Optional[int] = None
 
 
 class HealthCheckRequest(BaseModel):
     """健康检测请求模型"""
     batch_size: int = 50
     source: str = "overseas"  # "overseas" 或 "china"
+    force: bool = False       # 忽略新鲜度窗口，全部重新探测
 
 
 class RedeemCodeRequest(BaseModel):
@@ -2,23 +2,45 @@
 API 路由模块 - 节点、同步、测速等端点
 """
 
-from fastapi import APIRouter, Query, HTTPException, Header
+from fastapi import APIRouter, Query, HTTPException, Header, Request
+from fastapi.responses import Response, StreamingResponse
 from datetime import datetime, timedelta
 from typing import Optional, List, Dict
 import aiohttp
 import time
 import asyncio
+import json
 
 from ..config import config
 from ..core.logger import logger
+from ..core.loop_monitor import loop_monitor
 from .models import (
     PrecisionTestRequest, 
     LatencyTestRequest,
+    LatencyBatchRequest,
     HealthCheckRequest,
     RedeemCodeRequest
 )
 from ..services.node_service import NodeService
 from ..services.auth_service import AuthService
+from ..services.health_jobs import health_jobs, JobQueueFullError
+from ..services.health_scheduler import health_scheduler
+from ..services.health_history import health_history
+from ..services.speed_test import (
+    precision_test_events,
+    speed_governor,
+    speed_payload,
+    speedtest_governor,
+    governed_chunks,
+    SpeedTestBusyError,
+    SpeedTestGovernor
+)
+from ..services.latency_probe import latency_prober, latency_batch_governor
+from ..services.node_catalogue import node_catalogue
+from ..services.ingest_queue import ingest_queue
+from ..services.node_fingerprints import node_fingerprints
+from ..services.spiderflow_proxy import spiderflow_proxy, SpiderFlowUnavailableError
+from ..webhooks.replay import replay_cache
 
 # ==================== 路由组 ====================
 
@@ -41,6 +63,38 @@ async def status():
         "timestamp": datetime.now().isoformat()
     }
 
+@router.get("/metrics/loop")
+async def loop_metrics():
+    """
+    事件循环延迟指标
+    
+    lag_ms 为平滑后的当前调度延迟，p99_ms / max_ms 出现尖峰说明有同步调用阻塞了事件循环
+    （如同步 Supabase SDK、大 JSON 编码）
+    """
+    return {
+        "status": "success",
+        "data": loop_monitor.snapshot(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@router.get("/metrics/ingest")
+async def ingest_metrics():
+    """
+    Webhook 入库队列指标
+    
+    depth / queued_nodes 持续接近上限说明写入跟不上推送；wait 为排队等待耗时，process 为单次入库耗时
+    """
+    return {
+        "status": "success",
+        "data": {
+            **ingest_queue.snapshot(),
+            "catalogue": node_catalogue.snapshot(),
+            "fingerprints": len(node_fingerprints),
+            "replay": replay_cache.snapshot()
+        },
+        "timestamp": datetime.now().isoformat()
+    }
+
 # ==================== 节点 API ====================
 
 @router.get("/nodes")
@@ -77,12 +131,17 @@ async def get_nodes(
         
         logger.info(f"📋 获取海外节点: VIP={is_vip}, limit={limit}, user_id={user_id or '(anonymous)'}")
         
-        nodes = await node_service.get_nodes(
-            limit=limit,
-            show_free=show_free,
-            show_china=show_china
-        )
-        return nodes
+        if node_catalogue.ready:
+            # 进程内目录（定时拉取 + Webhook 实时推送）
+            nodes = node_catalogue.list(limit, show_free=show_free, history=health_history)
+        else:
+            nodes = await node_service.get_nodes(
+                limit=limit,
+                show_free=show_free,
+                show_china=show_china
+            )
+        # 附加健康历史指标（可用率、延迟分位数、抖动）并按健康分数排序
+        return health_history.annotate(nodes, rank=config.HEALTH_HISTORY_RANKING)
         
     except Exception as e:
         logger.error(f"❌ 获取节点失败: {e}")
@@ -124,7 +183,7 @@ async def get_telegram_nodes(
             limit=limit,
             show_free=show_free
         )
-        return nodes
+        return health_history.annotate(nodes, rank=config.HEALTH_HISTORY_RANKING)
         
     except Exception as e:
         logger.error(f"❌ 获取 telegram 节点失败: {e}")
@@ -202,85 +261,15 @@ async def precision_speed_test(request: PrecisionTestRequest):
     
     注意：这里不通过代理下载，因为代理需要本地代理软件支持。
     改为直接测速服务器速度，作为节点性能的参考。
+    测速经过全局准入控制，排队已满时返回 status=busy。
     """
     try:
-        test_file_size = request.test_file_size
-        
-        logger.info(f"⚡ 用户发起精确测速 | 文件大小: {test_file_size}MB | 代理: {request.proxy_url}")
-        
-        # 生成测试文件URL
-        test_file_url = f"https://speed.cloudflare.com/__down?bytes={test_file_size * 1024 * 1024}"
-        
-        start_time = time.time()
-        bytes_downloaded = 0
-        
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    test_file_url,
-                    timeout=aiohttp.ClientTimeout(total=120, connect=10, sock_read=30),
-                    ssl=False
-                ) as resp:
-                    if resp.status == 200:
-                        async for chunk in resp.content.iter_chunked(8192):
-                            bytes_downloaded += len(chunk)
-                    else:
-                        logger.error(f"HTTP {resp.status} from {test_file_url}")
-                        raise Exception(f"HTTP {resp.status}")
-            
-            download_time = time.time() - start_time
-            
-            if download_time <= 0:
-                download_time = 0.001
-            
-            # 计算速度 (MB/s)
-            speed_mbps = (bytes_downloaded / (1024 * 1024)) / download_time
-            
-            logger.info(f"✅ 精确测速完成 | 大小: {bytes_downloaded/(1024*1024):.1f}MB | 时间: {download_time:.1f}s | 速度: {speed_mbps:.1f}MB/s")
-            
-            return {
-                "status": "success",
-                "speed_mbps": round(speed_mbps, 2),
-                "download_time_seconds": round(download_time, 2),
-                "traffic_consumed_mb": round(bytes_downloaded / (1024 * 1024), 2),
-                "bytes_downloaded": bytes_downloaded,
-                "test_file_size_requested_mb": test_file_size,
-                "message": f"精确测速完成: {speed_mbps:.1f} MB/s",
-                "timestamp": datetime.now().isoformat()
-            }
-            
-        except asyncio.TimeoutError:
-            logger.error(f"精确测速超时 (> 120秒)")
-            return {
-                "status": "timeout",
-                "speed_mbps": 0,
-                "message": "测速超时，请稍后重试",
-                "timestamp": datetime.now().isoformat()
-            }
-            
-        except Exception as inner_err:
-            logger.error(f"精确测速下载失败: {inner_err}")
-            if bytes_downloaded > 0:
-                download_time = time.time() - start_time
-                if download_time <= 0:
-                    download_time = 0.001
-                speed_mbps = (bytes_downloaded / (1024 * 1024)) / download_time
-                return {
-                    "status": "partial_success",
-                    "speed_mbps": round(speed_mbps, 2),
-                    "download_time_seconds": round(download_time, 2),
-                    "traffic_consumed_mb": round(bytes_downloaded / (1024 * 1024), 2),
-                    "message": f"部分测试: {speed_mbps:.1f} MB/s",
-                    "timestamp": datetime.now().isoformat()
-                }
-            else:
-                return {
-                    "status": "error",
-                    "speed_mbps": 0,
-                    "latency": 9999,
-                    "message": f"测速失败: 无法连接到测速服务器",
-                    "timestamp": datetime.now().isoformat()
-                }
+        logger.info(f"⚡ 用户发起精确测速 | 文件大小: {request.test_file_size}MB | 代理: {request.proxy_url}")
+        result = None
+        async for event in precision_test_events(request.test_file_size):
+            if event["event"] == "result":
+                result = event["data"]
+        return result
                 
     except Exception as e:
         logger.error(f"精确测速异常: {e}")
@@ -291,52 +280,135 @@ async def precision_speed_test(request: PrecisionTestRequest):
             "timestamp": datetime.now().isoformat()
         }
 
+@router.get("/nodes/precision-test/stream")
+async def precision_speed_test_stream(test_file_size: int = Query(50, ge=1)):
+    """
+    精确测速（SSE 实时进度）
+    
+    事件: queued（排队位置）→ started → progress（字节数、瞬时速度、首字节时间）→ result
+    客户端断开时立即释放测速名额。
+    """
+    logger.info(f"⚡ 用户发起精确测速（实时进度） | 文件大小: {test_file_size}MB")
+
+    async def event_stream():
+        async for event in precision_test_events(test_file_size):
+            yield f"event: {event['event']}\ndata: {json.dumps(event['data'], ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/nodes/precision-test/status")
+async def precision_test_status():
+    """精确测速准入状态（运行中、排队数、带宽预算），self_hosted 为自托管测速文件的名额与带宽"""
+    return {
+        "status": "success",
+        "data": {
+            **speed_governor.snapshot(),
+            "self_hosted": speedtest_governor.snapshot()
+        },
+        "timestamp": datetime.now().isoformat()
+    }
+
+# ==================== 自托管测速 API ====================
+
+def _enter_speedtest():
+    """申请自托管测速名额，已满时返回 429"""
+    try:
+        speedtest_governor.enter()
+    except SpeedTestBusyError:
+        raise HTTPException(
+            status_code=429,
+            detail="测速服务繁忙，请稍后重试",
+            headers={"Retry-After": "5"}
+        )
+
+class GovernedStreamingResponse(StreamingResponse):
+    """
+    占用 governor 名额的流式响应：无论正常结束、客户端断开还是出错，响应结束时都归还名额
+
+    名额在路由中申请（以便名额用完时直接返回 429），归还不能放在响应体生成器的 finally 中：
+    客户端在 Starlette 开始迭代响应体之前断开时，生成器不会运行
+    """
+
+    def __init__(self, content, governor: SpeedTestGovernor, **kwargs):
+        super().__init__(content, **kwargs)
+        self.governor = governor
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.governor.leave(None)
+
+@router.get("/speedtest/download")
+async def speedtest_download(size: int = Query(..., ge=0, alias="bytes")):
+    """
+    测速下载 - 输出 bytes 字节的随机数据
+    
+    数据来自启动时预分配的数据块，按 memoryview 切片流式输出，请求之间不重新分配内存；
+    同时进行的下载/上传数和总带宽受 speedtest_governor 限制，名额用完返回 429
+    """
+    if size > config.SPEEDTEST_MAX_BYTES:
+        raise HTTPException(status_code=400, detail=f"bytes 不能超过 {config.SPEEDTEST_MAX_BYTES}")
+
+    _enter_speedtest()
+    return GovernedStreamingResponse(
+        governed_chunks(speed_payload, size, speedtest_governor),
+        speedtest_governor,
+        media_type="application/octet-stream",
+        headers={
+            "Content-Length": str(size),
+            "Cache-Control": "no-store"
+        }
+    )
+
+@router.post("/speedtest/upload")
+async def speedtest_upload(request: Request):
+    """
+    测速上传 - 读取并丢弃请求体，返回接收字节数与速度
+    """
+    content_length = request.headers.get("Content-Length", "")
+    if content_length.isdigit() and int(content_length) > config.SPEEDTEST_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"上传数据不能超过 {config.SPEEDTEST_MAX_BYTES} 字节")
+
+    _enter_speedtest()
+    try:
+        start = time.monotonic()
+        received = 0
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > config.SPEEDTEST_MAX_BYTES:
+                raise HTTPException(status_code=413, detail=f"上传数据不能超过 {config.SPEEDTEST_MAX_BYTES} 字节")
+            await speedtest_governor.bandwidth.consume(len(chunk))
+        elapsed = max(time.monotonic() - start, 0.001)
+    finally:
+        speedtest_governor.leave(None)
+
+    return {
+        "status": "success",
+        "data": {
+            "bytes_received": received,
+            "elapsed_seconds": round(elapsed, 3),
+            "speed_mbps": round(received / (1024 * 1024) / elapsed, 2)
+        },
+        "timestamp": datetime.now().isoformat()
+    }
+
 # ==================== 延迟测试 API ====================
 
 @router.post("/nodes/latency-test")
 async def latency_test(request: LatencyTestRequest):
     """
-    延迟测试 - 简单的 ping 延迟测试
+    延迟测试 - 预热连接后复用连接多次采样
+    
+    返回 min/avg/p90/抖动和冷连接的分阶段耗时；同一目标的结果短时缓存
     """
     try:
-        proxy_url = request.proxy_url
-        
         logger.info(f"⚡ 执行延迟测试")
-        
-        start_time = time.time()
-        
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.head(
-                    proxy_url,
-                    timeout=aiohttp.ClientTimeout(total=10),
-                    allow_redirects=False
-                ) as resp:
-                    latency = int((time.time() - start_time) * 1000)  # 毫秒
-                    
-                    return {
-                        "status": "success",
-                        "latency": latency,
-                        "latency_ms": latency,
-                        "timestamp": datetime.now().isoformat()
-                    }
-                    
-        except asyncio.TimeoutError:
-            return {
-                "status": "timeout",
-                "latency": 9999,
-                "message": "延迟测试超时",
-                "timestamp": datetime.now().isoformat()
-            }
-            
-        except Exception as e:
-            logger.warning(f"延迟测试失败: {e}")
-            return {
-                "status": "error",
-                "latency": 9999,
-                "message": str(e),
-                "timestamp": datetime.now().isoformat()
-            }
+        return await latency_prober.measure(request.proxy_url, request.samples)
             
     except Exception as e:
         logger.error(f"延迟测试异常: {e}")
@@ -347,6 +419,55 @@ async def latency_test(request: LatencyTestRequest):
             "timestamp": datetime.now().isoformat()
         }
 
+@router.post("/nodes/latency-test/batch")
+async def latency_test_batch(request: LatencyBatchRequest):
+    """
+    批量延迟测试 - 一次请求测试多个节点
+    
+    以 NDJSON 流式返回，每完成一个目标输出一行 {"id", "proxy_url", ...单个测试的结果}，
+    最后一行为 {"done": true, "total", "elapsed_ms"}。
+    单次发出的请求总数不超过 LATENCY_TEST_BATCH_MAX_REQUESTS；同时进行的批量测试数受
+    latency_batch_governor 限制，名额用完返回 429；内网 / 本机目标逐个返回 status=rejected
+    """
+    if not request.targets:
+        raise HTTPException(status_code=400, detail="targets 不能为空")
+    if len(request.targets) > config.LATENCY_TEST_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"单次最多测试 {config.LATENCY_TEST_BATCH_MAX} 个目标")
+    requests_needed = len(request.targets) * (latency_prober.effective_samples(request.samples) + 1)
+    if requests_needed > config.LATENCY_TEST_BATCH_MAX_REQUESTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"目标数 × (采样次数 + 1) 不能超过 {config.LATENCY_TEST_BATCH_MAX_REQUESTS}"
+        )
+
+    try:
+        latency_batch_governor.enter()
+    except SpeedTestBusyError:
+        raise HTTPException(
+            status_code=429,
+            detail="批量延迟测试繁忙，请稍后重试",
+            headers={"Retry-After": "5"}
+        )
+
+    logger.info(f"⚡ 批量延迟测试: {len(request.targets)} 个目标")
+    targets = [(t.id, t.proxy_url) for t in request.targets]
+
+    async def result_stream():
+        start = time.monotonic()
+        async for target_id, url, result in latency_prober.measure_many(
+            targets,
+            samples=request.samples,
+            concurrency=config.LATENCY_TEST_BATCH_CONCURRENCY
+        ):
+            yield json.dumps({"id": target_id, "proxy_url": url, **result}, ensure_ascii=False) + "\n"
+        yield json.dumps({
+            "done": True,
+            "total": len(targets),
+            "elapsed_ms": round((time.monotonic() - start) * 1000)
+        }) + "\n"
+
+    return GovernedStreamingResponse(result_stream(), latency_batch_governor, media_type="application/x-ndjson")
+
 # ==================== 激活码兑换 API ====================
 
 @router.post("/auth/redeem-code")
@@ -379,10 +500,12 @@ async def trigger_health_check(
     user_id: Optional[str] = Header(None, alias="X-User-ID")
 ):
     """
-    手动触发节点健康检测（仅限管理员）
+    提交节点健康检测任务（仅限管理员）
     
-    由前端「🏥 健康检测」按钮调用
-    每次检测一批节点，更新其在线状态到数据库
+    由前端「🏥 健康检测」按钮调用。请求立即返回任务 ID，检测在后台执行，
+    通过 GET /api/health-check/jobs/{job_id} 查询进度和结果。
+    同一数据源已有进行中的任务时返回该任务，不会重复检测。
+    新鲜度窗口内检测过的节点默认跳过，force=true 时全部重新探测。
     
     Parameters:
     - X-User-ID: 用户ID（HTTP header，必须是管理员）
@@ -400,39 +523,25 @@ async def trigger_health_check(
         
         batch_size = request.batch_size if request else 100
         source = request.source if request and hasattr(request, 'source') else "overseas"
-        logger.info(f"🏥 收到健康检测请求 (batch_size={batch_size}, source={source}, admin={user_id})")
-        
-        # 根据 source 获取对应的节点
-        if source == "china":
-            nodes = await node_service.get_telegram_nodes(limit=batch_size)
-        else:
-            nodes = await node_service.get_nodes(limit=batch_size)
-        
-        logger.info(f"✅ 获取到 {len(nodes)} 个节点")
+        force = request.force if request else False
+        logger.info(f"🏥 收到健康检测请求 (batch_size={batch_size}, source={source}, force={force}, admin={user_id})")
         
-        if not nodes:
-            return {
-                "status": "success",
-                "data": {
-                    "status": "no_nodes",
-                    "checked_count": 0,
-                    "online_count": 0,
-                    "offline_count": 0,
-                    "suspect_count": 0,
-                    "duration_seconds": 0
-                },
-                "timestamp": datetime.now().isoformat()
-            }
-        
-        # 执行健康检测（异步）
-        result = await node_service.health_check_nodes(nodes)
+        job, created = await health_jobs.submit(source, batch_size, requested_by=user_id, force=force)
         
         return {
             "status": "success",
-            "data": result,
+            "data": job.to_dict(),
+            "deduplicated": not created,
             "timestamp": datetime.now().isoformat()
         }
         
+    except JobQueueFullError as e:
+        logger.warning("⚠️ 健康检测任务排队已满")
+        return {
+            "status": "error",
+            "message": str(e),
+            "timestamp": datetime.now().isoformat()
+        }
     except Exception as e:
         logger.error(f"❌ 健康检测失败: {e}")
         return {
@@ -441,6 +550,51 @@ async def trigger_health_check(
             "timestamp": datetime.now().isoformat()
         }
 
+@router.get("/health-check/jobs/{job_id}")
+async def get_health_check_job(
+    job_id: str,
+    user_id: Optional[str] = Header(None, alias="X-User-ID")
+):
+    """
+    查询健康检测任务的进度和结果（仅限管理员）
+    
+    返回的 data.status: queued / running / completed / failed / cancelled
+    data.progress 在执行过程中实时更新，data.result 为最终结果
+    """
+    is_admin = await auth_service.check_user_admin_status(user_id)
+    if not is_admin:
+        raise HTTPException(status_code=403, detail="无权限：仅管理员可查看健康检测任务")
+    
+    job = health_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    
+    return {
+        "status": "success",
+        "data": job.to_dict(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@router.delete("/health-check/jobs/{job_id}")
+async def cancel_health_check_job(
+    job_id: str,
+    user_id: Optional[str] = Header(None, alias="X-User-ID")
+):
+    """取消排队中或执行中的健康检测任务（仅限管理员）"""
+    is_admin = await auth_service.check_user_admin_status(user_id)
+    if not is_admin:
+        raise HTTPException(status_code=403, detail="无权限：仅管理员可取消健康检测任务")
+    
+    job = health_jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    
+    return {
+        "status": "success",
+        "data": job.to_dict(),
+        "timestamp": datetime.now().isoformat()
+    }
+
 @router.get("/health-check/stats")
 async def get_health_stats():
     """
@@ -465,8 +619,38 @@ async def get_health_stats():
             "timestamp": datetime.now().isoformat()
         }
 
+@router.get("/health-check/scheduler")
+async def get_health_scheduler_status():
+    """
+    获取滚动健康检测调度状态
+    
+    返回目录规模、探测速率、完整一轮耗时和最近一次检测结果
+    """
+    return {
+        "status": "success",
+        "data": {
+            "enabled": config.HEALTH_SCHEDULER_ENABLED,
+            **health_scheduler.snapshot()
+        },
+        "timestamp": datetime.now().isoformat()
+    }
+
 # ==================== SpiderFlow 代理 ====================
 
+async def _proxy_spiderflow(path: str, params: Optional[Dict[str, str]] = None, label: str = "数据") -> Response:
+    """转发 SpiderFlow 响应原始字节，X-Cache 标明 HIT / MISS / STALE"""
+    try:
+        result = await spiderflow_proxy.fetch(path, params)
+    except SpiderFlowUnavailableError as e:
+        logger.error(f"❌ 代理 SpiderFlow {label}失败: {e}")
+        raise HTTPException(status_code=502, detail=f"SpiderFlow 服务不可用: {str(e)}")
+    return Response(
+        content=result.body,
+        status_code=result.status,
+        media_type=result.content_type,
+        headers={"X-Cache": result.cache, "Age": str(result.age)}
+    )
+
 @router.get("/proxy/nodes")
 async def proxy_nodes(
     limit: int = Query(500, ge=1, le=500),
@@ -474,51 +658,32 @@ async def proxy_nodes(
     show_china_nodes: bool = Query(False)
 ):
     """代理 SpiderFlow 的 /api/nodes 请求"""
-    try:
-        async with aiohttp.ClientSession() as session:
-            url = f"{config.SPIDERFLOW_API_URL}/api/nodes"
-            params = {
-                "limit": limit,
-                "show_socks_http": show_socks_http,
-                "show_china_nodes": show_china_nodes
-            }
-            async with session.get(
-                url,
-                params=params,
-                timeout=aiohttp.ClientTimeout(total=10)
-            ) as resp:
-                return await resp.json()
-                
-    except Exception as e:
-        logger.error(f"❌ 代理 SpiderFlow 节点数据失败: {e}")
-        raise HTTPException(status_code=502, detail=f"SpiderFlow 服务不可用: {str(e)}")
+    params = {
+        "limit": str(limit),
+        "show_socks_http": str(show_socks_http).lower(),
+        "show_china_nodes": str(show_china_nodes).lower()
+    }
+    return await _proxy_spiderflow("/api/nodes", params, label="节点数据")
 
 @router.get("/proxy/system/stats")
 async def proxy_system_stats():
     """代理 SpiderFlow 的 /api/system/stats 请求"""
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                f"{config.SPIDERFLOW_API_URL}/api/system/stats",
-                timeout=aiohttp.ClientTimeout(total=10)
-            ) as resp:
-                return await resp.json()
-                
-    except Exception as e:
-        logger.error(f"❌ 代理 SpiderFlow 系统统计失败: {e}")
-        raise HTTPException(status_code=502, detail=f"SpiderFlow 服务不可用: {str(e)}")
+    return await _proxy_spiderflow("/api/system/stats", label="系统统计")
 
 @router.get("/proxy/nodes/stats")
 async def proxy_nodes_stats():
     """代理 SpiderFlow 的 /nodes/stats 请求"""
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                f"{config.SPIDERFLOW_API_URL}/nodes/stats",
-                timeout=aiohttp.ClientTimeout(total=10)
-            ) as resp:
-                return await resp.json()
-                
-    except Exception as e:
-        logger.error(f"❌ 代理 SpiderFlow 节点统计失败: {e}")
-        raise HTTPException(status_code=502, detail=f"SpiderFlow 服务不可用: {str(e)}")
+    return await _proxy_spiderflow("/nodes/stats", label="节点统计")
+
+@router.get("/metrics/proxy")
+async def proxy_metrics():
+    """
+    SpiderFlow 代理缓存指标
+    
+    stale_served 增长说明 SpiderFlow 出现故障，期间返回的是过期缓存
+    """
+    return {
+        "status": "success",
+        "data": spiderflow_proxy.snapshot(),
+        "timestamp": datetime.now().isoformat()
+    }
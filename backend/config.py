@@ -31,20 +31,117 @@ class Config:
     DEBUG: bool = False
     RELOAD: bool = False
     
+    # 事件循环：开启且已安装 uvloop 时使用 uvloop
+    USE_UVLOOP: bool = os.environ.get("USE_UVLOOP", "true").lower() == "true"
+    LOOP_LAG_SAMPLE_INTERVAL: float = 0.1   # 事件循环延迟采样间隔（秒）
+    LOOP_LAG_WARN_MS: float = 100.0         # 单次延迟超过该值记为一次阻塞
+    
     # SpiderFlow 后端配置
     SPIDERFLOW_API_URL: str = os.environ.get(
         "SPIDERFLOW_API_URL",
         "http://localhost:8001"
     )
+    SPIDERFLOW_PROXY_CACHE_TTL: float = 10.0   # 代理响应缓存时间（秒）
+    SPIDERFLOW_PROXY_STALE_TTL: float = 300.0  # SpiderFlow 故障时可返回的过期缓存最长时间（秒）
+    SPIDERFLOW_PROXY_TIMEOUT: float = 10.0     # 代理请求超时（秒）
     
     # 节点查询限制
     DEFAULT_NODE_LIMIT: int = 20
     MAX_NODE_LIMIT: int = 500
     VIP_NODE_LIMIT: int = 500
     
+    # 健康检测并发配置（自适应 AIMD 限流）
+    HEALTH_CHECK_INITIAL_CONCURRENCY: int = 20
+    HEALTH_CHECK_MIN_CONCURRENCY: int = 5
+    HEALTH_CHECK_MAX_CONCURRENCY: int = 300  # 硬上限
+    
+    # 健康检测重试与时间预算（秒）
+    HEALTH_CHECK_MAX_RETRIES: int = 2
+    HEALTH_CHECK_NODE_DEADLINE_SECONDS: float = 15.0
+    HEALTH_CHECK_BATCH_DEADLINE_SECONDS: float = 240.0
+    
+    # TCP 探测引擎："socket"（非阻塞原始 socket）、"stream"（asyncio.open_connection）或 "auto"（按事件循环选择）
+    HEALTH_CHECK_TCP_ENGINE: str = os.environ.get("HEALTH_CHECK_TCP_ENGINE", "auto")
+    
+    # 分阶段耗时（DNS/TCP/TLS/首字节）写入 health_timings 列，执行 scripts/add_health_timings.sql 后再开启
+    HEALTH_PERSIST_TIMINGS: bool = os.environ.get("HEALTH_PERSIST_TIMINGS", "false").lower() == "true"
+    
+    # 分片健康检测（python -m backend.services.health_shards）
+    HEALTH_SHARD_COUNT: int = int(os.environ.get("HEALTH_SHARD_COUNT", "0"))  # 分片检测进程数，0 表示 CPU 核数
+    
+    # 新鲜度窗口（秒）：窗口内检测过的节点不重复探测，请求 force=true 时忽略
+    HEALTH_FRESHNESS_ONLINE_SECONDS: float = 300.0
+    HEALTH_FRESHNESS_OFFLINE_SECONDS: float = 120.0
+    HEALTH_FRESHNESS_SUSPECT_SECONDS: float = 60.0
+    
+    # 健康检测任务队列
+    HEALTH_JOB_MAX_RUNNING: int = 1    # 同时执行的任务数
+    HEALTH_JOB_MAX_QUEUED: int = 10    # 排队上限
+    HEALTH_JOB_HISTORY: int = 50       # 保留的已结束任务数
+    
+    # 精确测速目标地址，{bytes} 替换为下载字节数；可指向自建边缘节点或本服务的 /api/speedtest/download
+    PRECISION_TEST_URL: str = os.environ.get(
+        "PRECISION_TEST_URL",
+        "https://speed.cloudflare.com/__down?bytes={bytes}"
+    )
+    
+    # 自托管测速文件（/api/speedtest/download 与 /api/speedtest/upload）
+    SPEEDTEST_BLOCK_SIZE: int = 256 * 1024            # 预分配数据块大小（字节），下载按块切片输出
+    SPEEDTEST_MAX_BYTES: int = 50 * 1024 * 1024       # 单次下载/上传上限（字节）
+    SPEEDTEST_MAX_CONCURRENT: int = 4                 # 同时进行的下载/上传数，超出返回 429
+    SPEEDTEST_BANDWIDTH_MB: float = float(os.environ.get("SPEEDTEST_BANDWIDTH_MB", "50"))  # 下载/上传共享的带宽预算（MB/s），0 表示不限
+    
+    # 精确测速（全局准入控制与带宽预算）
+    PRECISION_TEST_MAX_CONCURRENT: int = 2            # 同时进行的测速数
+    PRECISION_TEST_MAX_QUEUE: int = 20                # 排队上限，超出返回 busy
+    PRECISION_TEST_BANDWIDTH_MB: float = float(os.environ.get("PRECISION_TEST_BANDWIDTH_MB", "20"))  # 全部测速共享的带宽预算（MB/s），设为 0 关闭限速
+    PRECISION_TEST_MAX_FILE_MB: int = 100             # 单次测速文件大小上限
+    PRECISION_TEST_CHUNK_SIZE: int = 1024 * 1024      # 下载读取块大小（字节）
+    PRECISION_TEST_PROGRESS_INTERVAL: float = 0.25    # 进度推送间隔（秒）
+    
+    # 延迟测试（复用连接多次采样）
+    LATENCY_TEST_SAMPLES: int = 5          # 默认采样次数（不含预热请求）
+    LATENCY_TEST_MAX_SAMPLES: int = 20     # 单次请求允许的最大采样次数
+    LATENCY_TEST_TIMEOUT: float = 10.0     # 单个请求超时（秒）
+    LATENCY_TEST_CACHE_TTL: float = 30.0   # 同一目标结果缓存时间（秒）
+    LATENCY_TEST_VERIFY_SSL: bool = os.environ.get("LATENCY_TEST_VERIFY_SSL", "true").lower() == "true"  # 校验目标 TLS 证书，自签名目标可设为 false
+    LATENCY_TEST_BATCH_MAX: int = 100      # 批量测试单次最多目标数
+    LATENCY_TEST_BATCH_CONCURRENCY: int = 20  # 批量测试并发数
+    LATENCY_TEST_BATCH_MAX_CONCURRENT: int = 2  # 同时进行的批量测试数，超出返回 429
+    LATENCY_TEST_BATCH_MAX_REQUESTS: int = 600  # 单次批量测试最多发出的请求数（目标数 ×（采样次数 + 1 次预热））
+    LATENCY_TEST_ALLOW_PRIVATE: bool = os.environ.get("LATENCY_TEST_ALLOW_PRIVATE", "false").lower() == "true"  # 允许测试内网 / 本机地址
+    
+    # Webhook 节点入库
+    WEBHOOK_UPSERT_BATCH_SIZE: int = 500   # 每次 upsert 的行数
+    WEBHOOK_UPSERT_MAX_RETRIES: int = 3    # upsert 失败（网络错误/429/5xx）重试次数
+    WEBHOOK_UPSERT_RETRY_BACKOFF: float = 1.0  # 重试退避基数（秒），按 2^n 递增
+    WEBHOOK_QUEUE_SIZE: int = 20           # 排队中的推送数上限
+    WEBHOOK_QUEUE_MAX_NODES: int = 200000  # 排队中的节点总数上限（限制内存）
+    WEBHOOK_WORKERS: int = 1               # 入库 worker 数（全量快照串行入库，多个 worker 不会并行写入）
+    WEBHOOK_CATALOGUE_WAIT_SECONDS: float = 120.0  # 入库前等待节点目录完成首次完整加载的最长时间
+    WEBHOOK_FINGERPRINT_PATH: str = os.environ.get("WEBHOOK_FINGERPRINT_PATH", "")  # 节点内容指纹持久化文件，留空不持久化
+    WEBHOOK_TOMBSTONE_MODE: str = os.environ.get("WEBHOOK_TOMBSTONE_MODE", "offline")  # 推送中消失的节点："offline"、"delete" 或 "off"
+    WEBHOOK_TOMBSTONE_MIN_RATIO: float = 0.5  # 推送数量低于已知节点的该比例时视为不完整推送，不写墓碑
+    WEBHOOK_TOMBSTONE_BATCH_SIZE: int = 100  # 每次墓碑请求的 ID 数（ID 在 URL 中，100 个 UUID 约 3.7KB）
+    WEBHOOK_MAX_BODY_BYTES: int = 64 * 1024 * 1024  # 推送请求体上限（解压后），超出返回 413
+    WEBHOOK_TIMESTAMP_TOLERANCE: int = int(os.environ.get("WEBHOOK_TIMESTAMP_TOLERANCE", "300"))  # X-Webhook-Timestamp 与当前时间最大偏差（秒），0 为不检查
+    WEBHOOK_REPLAY_CACHE_SIZE: int = 4096  # 记录最近推送的签名/投递 ID 数量，重复推送直接返回 200
+    
     # 定时任务配置
     SUPABASE_PULL_INTERVAL_MINUTES: int = 12
     
+    # 滚动健康检测（后台持续按陈旧度检测全部节点）
+    HEALTH_SCHEDULER_ENABLED: bool = os.environ.get("HEALTH_SCHEDULER_ENABLED", "true").lower() == "true"
+    HEALTH_SCHEDULER_PROBES_PER_SECOND: float = 2.0   # 探测速率预算
+    HEALTH_SCHEDULER_TICK_SECONDS: int = 30           # 每片检测间隔
+    HEALTH_SCHEDULER_SLA_MINUTES: int = 120           # 每个节点的目标复查周期
+    
+    # 节点健康历史（环形缓冲区，用于可用率/延迟分位数和排序）
+    HEALTH_HISTORY_CAPACITY: int = 32        # 每节点保留的检测记录数
+    HEALTH_HISTORY_MAX_NODES: int = 20000    # 最多跟踪的节点数
+    HEALTH_HISTORY_PATH: str = os.environ.get("HEALTH_HISTORY_PATH", "")  # 持久化文件，留空不持久化
+    HEALTH_HISTORY_RANKING: bool = True      # 节点列表按健康分数排序
+    
     # 日志配置
     LOG_LEVEL: str = "INFO"
     LOG_FORMAT: str = "[%(asctime)s] %(levelname)s - %(message)s"
@@ -0,0 +1,141 @@
+"""
+事件循环模块 - uvloop 选择与事件循环延迟监控
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from ..config import config
+from .logger import logger
+
+try:
+    import uvloop
+except ImportError:  # 未安装或不支持的平台（Windows）使用默认事件循环
+    uvloop = None
+
+
+# ==================== 事件循环选择 ====================
+
+def select_event_loop() -> str:
+    """返回 uvicorn 的 loop 参数：开启 USE_UVLOOP 且已安装 uvloop 时为 "uvloop"，否则为 "asyncio" """
+    if config.USE_UVLOOP and uvloop is not None:
+        return "uvloop"
+    if config.USE_UVLOOP:
+        logger.info("ℹ️  未安装 uvloop，使用默认 asyncio 事件循环")
+    return "asyncio"
+
+
+def install_event_loop_policy() -> str:
+    """为 asyncio.run 启动的脚本（命令行工具、基准测试）设置事件循环策略"""
+    loop_name = select_event_loop()
+    if loop_name == "uvloop":
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return loop_name
+
+
+# ==================== 事件循环延迟监控 ====================
+
+class LoopLagMonitor:
+    """
+    事件循环延迟监控
+
+    每 interval 秒 sleep 一次，实际耗时减去 interval 即为调度延迟。
+    同步 Supabase SDK 调用、大 JSON 编码等阻塞操作会直接体现为延迟尖峰。
+
+    - lag_ms：指数平滑后的当前延迟（供限流器等实时决策使用）
+    - 最近 window 个样本用于计算 p50 / p99
+    - 单次延迟超过 warn_ms 计为一次阻塞，并输出告警（每 warn_interval 秒最多一次）
+    """
+
+    def __init__(
+        self,
+        interval: float = 0.1,
+        warn_ms: float = 100.0,
+        window: int = 600,
+        warn_interval: float = 10.0,
+        log_stalls: bool = True
+    ):
+        self.interval = interval
+        self.warn_ms = warn_ms
+        self.warn_interval = warn_interval
+        self.log_stalls = log_stalls
+
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._task: Optional[asyncio.Task] = None
+        self._last_warn = 0.0
+        self._loop_name = ""
+
+        self.lag_ms = 0.0
+        self.max_lag_ms = 0.0
+        self.stalls = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """启动采样任务（需要运行中的事件循环）"""
+        if not self.running:
+            loop = asyncio.get_event_loop()
+            self._loop_name = f"{type(loop).__module__}.{type(loop).__name__}"
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止采样任务"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.record(max(0.0, (loop.time() - start - self.interval) * 1000))
+
+    def record(self, lag_ms: float):
+        """记录一次延迟样本"""
+        self._samples.append(lag_ms)
+        # 指数平滑，避免单次抖动影响实时决策
+        self.lag_ms = self.lag_ms * 0.7 + lag_ms * 0.3
+        self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+
+        if lag_ms > self.warn_ms:
+            self.stalls += 1
+            now = time.monotonic()
+            if self.log_stalls and now - self._last_warn > self.warn_interval:
+                self._last_warn = now
+                logger.warning(f"🐢 事件循环阻塞 {lag_ms:.0f}ms（累计 {self.stalls} 次），检查是否有同步调用")
+
+    def snapshot(self) -> Dict:
+        """延迟指标"""
+        ordered = sorted(self._samples)
+
+        def percentile(p: float) -> Optional[float]:
+            if not ordered:
+                return None
+            return round(ordered[int(round(p * (len(ordered) - 1)))], 1)
+
+        return {
+            "loop": self._loop_name,
+            "running": self.running,
+            "interval_ms": self.interval * 1000,
+            "lag_ms": round(self.lag_ms, 1),
+            "p50_ms": percentile(0.5),
+            "p99_ms": percentile(0.99),
+            "max_ms": round(self.max_lag_ms, 1),
+            "stalls": self.stalls,
+            "stall_threshold_ms": self.warn_ms,
+            "samples": len(ordered)
+        }
+
+
+# ==================== 全局监控实例 ====================
+
+loop_monitor = LoopLagMonitor(
+    interval=config.LOOP_LAG_SAMPLE_INTERVAL,
+    warn_ms=config.LOOP_LAG_WARN_MS
+)
@@ -12,8 +12,8 @@
 
 数据来源：
 - 所有节点数据存储在 Supabase public.nodes 表
-- SpiderFlow 负责测速，结果直接写入 Supabase
-- viper-node-store 仅读取和展示数据
+- SpiderFlow 负责测速，结果直接写入 Supabase 或通过 Webhook 推送
+- viper-node-store 读取和展示数据，Webhook 推送的节点由本服务去重后入库
 
 架构：
 - backend/config.py - 配置管理
@@ -28,6 +28,7 @@ from fastapi.responses import FileResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+import asyncio
 import logging
 import os
 from datetime import datetime
@@ -35,6 +36,7 @@ from datetime import datetime
 # 导入配置和日志
 from .config import config
 from .core.logger import logger, setup_logger
+from .core.loop_monitor import loop_monitor, select_event_loop
 
 # 导入路由
 from .api.routes import router as api_router
@@ -42,6 +44,14 @@ from .webhooks.receiver import router as webhook_router
 
 # 导入服务
 from .services.node_service import NodeService
+from .services.health_jobs import health_jobs
+from .services.health_scheduler import health_scheduler
+from .services.health_history import health_history
+from .services.latency_probe import latency_prober
+from .services.node_catalogue import node_catalogue
+from .services.ingest_queue import ingest_queue
+from .services.node_fingerprints import node_fingerprints
+from .services.spiderflow_proxy import spiderflow_proxy
 
 # ==================== 应用初始化 ====================
 
@@ -107,16 +117,28 @@ scheduler = None
 async def periodic_pull_from_supabase():
     """
     定时拉取任务：每 12 分钟从 Supabase 拉取一次最新的节点数据
-    这可以确保内存缓存保持最新
+    这可以确保内存缓存保持最新（Webhook 推送会在两次拉取之间实时更新目录）
     """
     try:
         logger.info("📥 开始定时拉取 Supabase 节点数据...")
         node_service = NodeService()
-        nodes = await node_service.get_nodes(limit=10000)
+        # 分页读取全表：Webhook 入库依赖目录查找已有节点的 ID，截断的目录会导致重复行
+        nodes = await node_service.fetch_all_nodes()
+        node_catalogue.replace(nodes, complete=True)
         logger.info(f"✅ 定时拉取完成：获取 {len(nodes)} 个节点")
+        # 顺带保存健康历史和节点指纹，避免异常退出时丢失
+        await health_history.save()
+        await node_fingerprints.save()
     except Exception as e:
         logger.warning(f"⚠️  定时拉取失败: {e}")
 
+async def load_catalogue(retry_seconds: float = 30.0):
+    """启动时首次加载节点目录，失败时每 retry_seconds 秒重试直到成功"""
+    while not node_catalogue.loaded:
+        await periodic_pull_from_supabase()
+        if not node_catalogue.loaded:
+            await asyncio.sleep(retry_seconds)
+
 # ==================== 应用生命周期 ====================
 
 @app.on_event("startup")
@@ -137,6 +159,17 @@ async def startup_event():
     except Exception as e:
         logger.warning(f"⚠️  Supabase 连接失败: {e}")
     
+    # 启动事件循环延迟监控
+    loop_monitor.start()
+    logger.info(f"✅ 事件循环: {loop_monitor.snapshot()['loop']}")
+    
+    # 加载持久化的健康历史和节点指纹
+    health_history.load()
+    node_fingerprints.load()
+    
+    # 首次填充节点目录（后台执行，不阻塞启动；失败时重试，Webhook 入库会等待目录加载完成）
+    asyncio.create_task(load_catalogue())
+    
     # 启动定时任务调度器
     try:
         scheduler = AsyncIOScheduler()
@@ -150,8 +183,25 @@ async def startup_event():
             name='Supabase 定时拉取'
         )
         
+        # 添加滚动健康检测：每个 tick 检测最陈旧的一片节点
+        if config.HEALTH_SCHEDULER_ENABLED:
+            scheduler.add_job(
+                health_scheduler.tick,
+                'interval',
+                seconds=config.HEALTH_SCHEDULER_TICK_SECONDS,
+                id='health_rolling',
+                name='滚动健康检测',
+                max_instances=1,
+                coalesce=True
+            )
+        
         scheduler.start()
         logger.info(f"✅ 定时任务调度器已启动（每 {config.SUPABASE_PULL_INTERVAL_MINUTES} 分钟拉取一次 Supabase 数据）")
+        if config.HEALTH_SCHEDULER_ENABLED:
+            logger.info(
+                f"✅ 滚动健康检测已启用（{config.HEALTH_SCHEDULER_PROBES_PER_SECOND} 个/秒，"
+                f"目标 {config.HEALTH_SCHEDULER_SLA_MINUTES} 分钟内复查全部节点）"
+            )
     except Exception as e:
         logger.warning(f"⚠️  启动定时任务调度器失败: {e}")
 
@@ -162,6 +212,23 @@ async def shutdown_event():
     
     logger.info("🛑 viper-node-store 后端正在关闭...")
     
+    # 取消进行中的健康检测任务
+    await health_jobs.shutdown()
+    
+    # 停止 Webhook 入库 worker
+    await ingest_queue.shutdown()
+    
+    # 保存健康历史和节点指纹
+    await health_history.save()
+    await node_fingerprints.save()
+    
+    # 关闭延迟测试和 SpiderFlow 代理连接池
+    await latency_prober.close()
+    await spiderflow_proxy.close()
+    
+    # 停止事件循环延迟监控
+    await loop_monitor.stop()
+    
     # 关闭调度器
     if scheduler and scheduler.running:
         scheduler.shutdown()
@@ -186,5 +253,6 @@ if __name__ == "__main__":
         host=config.HOST,
         port=config.PORT,
         reload=config.RELOAD,
+        loop=select_event_loop(),
         log_level=config.LOG_LEVEL.lower()
     )
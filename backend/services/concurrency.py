@@ -0,0 +1,221 @@
+"""
+自适应并发控制 - 健康检测批次使用的 AIMD 限流器
+"""
+
+import asyncio
+import os
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from ..core.loop_monitor import LoopLagMonitor
+
+try:
+    import resource
+except ImportError:  # Windows 无 resource 模块
+    resource = None
+
+
+# 探测结果在限流器中的分类
+OUTCOME_SUCCESS = "success"
+OUTCOME_TIMEOUT = "timeout"
+OUTCOME_ERROR = "error"
+OUTCOME_LOCAL = "local"
+
+
+def open_fd_ratio() -> Optional[float]:
+    """当前进程已打开文件描述符占软上限的比例（不支持的平台返回 None）"""
+    if resource is None or not os.path.isdir("/proc/self/fd"):
+        return None
+    try:
+        soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft <= 0 or soft == resource.RLIM_INFINITY:
+            return None
+        return len(os.listdir("/proc/self/fd")) / soft
+    except OSError:
+        return None
+
+
+class AdaptiveLimiter:
+    """
+    AIMD 自适应并发限制器
+
+    每完成 window 个探测评估一次：
+    - 超时/错误率没有明显高于基线，且本地资源正常 → 并发上限加 increase_step
+    - 出现本地资源错误、事件循环延迟过高、fd 使用率过高，
+      或超时/错误率超出基线 tolerance → 并发上限乘以 decrease_factor
+
+    大量死节点本身就会产生很高的超时率，所以比较的是相对基线（EWMA）的上升，
+    而不是绝对值；只有拥塞导致的额外超时才会触发退避。
+    """
+
+    def __init__(
+        self,
+        initial: int = 20,
+        min_limit: int = 5,
+        max_limit: int = 300,
+        increase_step: int = 5,
+        decrease_factor: float = 0.7,
+        window: int = 50,
+        failure_tolerance: float = 0.15,
+        max_loop_lag_ms: float = 100.0,
+        max_fd_ratio: float = 0.8,
+        lag_sample_interval: float = 0.1
+    ):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.window = window
+        self.failure_tolerance = failure_tolerance
+        self.max_loop_lag_ms = max_loop_lag_ms
+        self.max_fd_ratio = max_fd_ratio
+        self.lag_sample_interval = lag_sample_interval
+
+        self._limit = min(max(initial, self.min_limit), self.max_limit)
+        self._inflight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._window_outcomes: Dict[str, int] = {}
+        self._window_count = 0
+        self._failure_baseline: Optional[float] = None
+        # 限流器自带一个不输出告警的采样器，与批次同生命周期
+        self._lag_monitor = LoopLagMonitor(interval=lag_sample_interval, log_stalls=False)
+
+        self.peak_limit = self._limit
+        self.increases = 0
+        self.decreases = 0
+
+    @property
+    def limit(self) -> int:
+        """当前并发上限"""
+        return self._limit
+
+    @property
+    def inflight(self) -> int:
+        """正在执行的探测数"""
+        return self._inflight
+
+    # ==================== 生命周期 ====================
+
+    async def __aenter__(self) -> "AdaptiveLimiter":
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+
+    def start(self):
+        """启动事件循环延迟采样"""
+        self._lag_monitor.start()
+
+    async def stop(self):
+        """停止事件循环延迟采样"""
+        await self._lag_monitor.stop()
+
+    # ==================== 令牌获取与释放 ====================
+
+    async def acquire(self):
+        """获取一个并发槽位"""
+        if self._inflight < self._limit and not self._waiters:
+            self._inflight += 1
+            return
+
+        future = asyncio.get_event_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 槽位已经转交给本协程，归还后再抛出
+                self._inflight -= 1
+                self._wake_waiters()
+            else:
+                try:
+                    self._waiters.remove(future)
+                except ValueError:
+                    pass
+            raise
+
+    def release(self, outcome: str = OUTCOME_SUCCESS):
+        """释放槽位并记录探测结果"""
+        self._inflight = max(0, self._inflight - 1)
+        self._record(outcome)
+        self._wake_waiters()
+
+    def _wake_waiters(self):
+        while self._waiters and self._inflight < self._limit:
+            future = self._waiters.popleft()
+            if not future.done():
+                self._inflight += 1
+                future.set_result(None)
+
+    # ==================== 上限调整 ====================
+
+    def _record(self, outcome: str):
+        if outcome == OUTCOME_LOCAL:
+            # 本地资源耗尽（EMFILE 等）立即退避，不等窗口结束
+            self._decrease()
+            self._reset_window()
+            return
+
+        self._window_outcomes[outcome] = self._window_outcomes.get(outcome, 0) + 1
+        self._window_count += 1
+        if self._window_count >= self.window:
+            self._evaluate_window()
+
+    def _evaluate_window(self):
+        failures = (
+            self._window_outcomes.get(OUTCOME_TIMEOUT, 0)
+            + self._window_outcomes.get(OUTCOME_ERROR, 0)
+        )
+        failure_rate = failures / self._window_count
+
+        fd_ratio = open_fd_ratio()
+        overloaded = (
+            self._lag_monitor.lag_ms > self.max_loop_lag_ms
+            or (fd_ratio is not None and fd_ratio > self.max_fd_ratio)
+            or (
+                self._failure_baseline is not None
+                and failure_rate > self._failure_baseline + self.failure_tolerance
+            )
+        )
+
+        if overloaded:
+            self._decrease()
+        else:
+            self._increase()
+
+        if self._failure_baseline is None:
+            self._failure_baseline = failure_rate
+        else:
+            self._failure_baseline = self._failure_baseline * 0.7 + failure_rate * 0.3
+
+        self._reset_window()
+
+    def _reset_window(self):
+        self._window_outcomes = {}
+        self._window_count = 0
+
+    def _increase(self):
+        new_limit = min(self.max_limit, self._limit + self.increase_step)
+        if new_limit != self._limit:
+            self._limit = new_limit
+            self.increases += 1
+            self.peak_limit = max(self.peak_limit, new_limit)
+
+    def _decrease(self):
+        new_limit = max(self.min_limit, int(self._limit * self.decrease_factor))
+        if new_limit != self._limit:
+            self._limit = new_limit
+            self.decreases += 1
+
+    def snapshot(self) -> Dict:
+        """当前限流状态（用于结果展示）"""
+        return {
+            "limit": self._limit,
+            "peak_limit": self.peak_limit,
+            "max_limit": self.max_limit,
+            "inflight": self._inflight,
+            "loop_lag_ms": round(self._lag_monitor.lag_ms, 1),
+            "increases": self.increases,
+            "decreases": self.decreases
+        }
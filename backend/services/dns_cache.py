@@ -0,0 +1,252 @@
+"""
+DNS 解析缓存 - 健康检测使用的异步解析器（aiodns，遵循 TTL）
+"""
+
+import asyncio
+import ipaddress
+import socket
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+from aiohttp.abc import AbstractResolver
+
+try:
+    import aiodns
+except ImportError:  # 未安装 aiodns 时退化为事件循环自带的 getaddrinfo
+    aiodns = None
+
+from ..core.logger import logger
+
+
+@dataclass
+class DNSEntry:
+    """单个主机的解析结果"""
+    addresses: List[str]
+    expires_at: float
+    resolve_ms: int = 0
+
+    @property
+    def ok(self) -> bool:
+        return bool(self.addresses)
+
+
+class DNSCache:
+    """
+    带 TTL 的异步 DNS 缓存
+
+    - 成功结果按记录 TTL 缓存（限制在 [min_ttl, max_ttl] 内，TTL 为 0 时使用 default_ttl）
+    - 解析失败按 negative_ttl 负缓存，避免死域名在同一批次里反复解析
+    - IP 字面量直接返回，不进入缓存
+    - 同时查询 A 和 AAAA（AF_UNSPEC），IPv4 地址排在前面；只有 AAAA 记录的主机同样可以探测
+    """
+
+    def __init__(
+        self,
+        default_ttl: float = 300.0,
+        min_ttl: float = 30.0,
+        max_ttl: float = 3600.0,
+        negative_ttl: float = 60.0,
+        timeout: float = 5.0,
+        max_concurrent: int = 50,
+        max_entries: int = 50000
+    ):
+        self.default_ttl = default_ttl
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self.negative_ttl = negative_ttl
+        self.timeout = timeout
+        self.max_concurrent = max_concurrent
+        self.max_entries = max_entries
+
+        self._entries: Dict[str, DNSEntry] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._resolver = None
+        self._resolver_loop = None
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def is_ip(host: str) -> bool:
+        try:
+            ipaddress.ip_address(host)
+            return True
+        except ValueError:
+            return False
+
+    def peek(self, host: str) -> Optional[DNSEntry]:
+        """读取未过期的缓存项（不触发解析）"""
+        entry = self._entries.get(host)
+        if entry and entry.expires_at > time.monotonic():
+            return entry
+        return None
+
+    @staticmethod
+    def _filter_family(entry: DNSEntry, family: int) -> DNSEntry:
+        """只保留 family 对应的地址（AF_UNSPEC 时原样返回）"""
+        if family == socket.AF_INET:
+            addresses = [a for a in entry.addresses if ":" not in a]
+        elif family == socket.AF_INET6:
+            addresses = [a for a in entry.addresses if ":" in a]
+        else:
+            return entry
+        return DNSEntry(addresses=addresses, expires_at=entry.expires_at, resolve_ms=entry.resolve_ms)
+
+    async def resolve(self, host: str, family: int = socket.AF_UNSPEC) -> DNSEntry:
+        """
+        解析主机名，优先使用缓存；并发的同名解析只发起一次
+
+        缓存中保存 A 和 AAAA 两类地址，family 为 AF_INET / AF_INET6 时只返回对应地址
+        """
+        if self.is_ip(host):
+            return self._filter_family(DNSEntry(addresses=[host], expires_at=float("inf")), family)
+
+        entry = self.peek(host)
+        if entry:
+            self.hits += 1
+            return self._filter_family(entry, family)
+
+        pending = self._inflight.get(host)
+        if pending is not None:
+            entry = await asyncio.shield(pending)
+            if entry is not None:
+                return self._filter_family(entry, family)
+
+        self.misses += 1
+        future = asyncio.get_event_loop().create_future()
+        self._inflight[host] = future
+        try:
+            entry = await self._lookup(host)
+            self._store(host, entry)
+            future.set_result(entry)
+            return self._filter_family(entry, family)
+        finally:
+            # 发起方被取消时通知等待方自行解析
+            if not future.done():
+                future.set_result(None)
+            self._inflight.pop(host, None)
+
+    async def resolve_many(self, hosts: Iterable[str]) -> Dict[str, DNSEntry]:
+        """并发解析一批主机（去重后），返回 主机 → 解析结果"""
+        unique = {h for h in hosts if h and not self.is_ip(h)}
+        semaphore = asyncio.Semaphore(self.max_concurrent)
+
+        async def resolve_one(host: str) -> DNSEntry:
+            async with semaphore:
+                return await self.resolve(host)
+
+        names = list(unique)
+        entries = await asyncio.gather(*(resolve_one(h) for h in names))
+        resolved = dict(zip(names, entries))
+
+        failed = sum(1 for e in entries if not e.ok)
+        if failed:
+            logger.info(f"🌐 DNS 预解析: {len(names)} 个主机，{failed} 个无法解析")
+        return resolved
+
+    def _store(self, host: str, entry: DNSEntry):
+        if len(self._entries) >= self.max_entries:
+            # 先清理过期项，仍然超限时丢弃最早插入的一半
+            now = time.monotonic()
+            self._entries = {h: e for h, e in self._entries.items() if e.expires_at > now}
+            if len(self._entries) >= self.max_entries:
+                keep = list(self._entries.items())[len(self._entries) // 2:]
+                self._entries = dict(keep)
+        self._entries[host] = entry
+
+    def _get_resolver(self):
+        loop = asyncio.get_event_loop()
+        if aiodns is not None and (self._resolver is None or self._resolver_loop is not loop):
+            self._resolver = aiodns.DNSResolver(timeout=self.timeout)
+            self._resolver_loop = loop
+        return self._resolver
+
+    async def _lookup(self, host: str) -> DNSEntry:
+        start = time.monotonic()
+        addresses: List[str] = []
+        ttl = self.negative_ttl
+
+        try:
+            resolver = self._get_resolver()
+            if resolver is not None:
+                result = await asyncio.wait_for(
+                    resolver.getaddrinfo(host, family=socket.AF_UNSPEC),
+                    timeout=self.timeout
+                )
+                ttls = []
+                for node in result.nodes:
+                    address = node.addr[0]
+                    if isinstance(address, bytes):
+                        address = address.decode()
+                    if address not in addresses:
+                        addresses.append(address)
+                    ttls.append(node.ttl)
+                record_ttl = min(ttls) if ttls else 0
+            else:
+                infos = await asyncio.wait_for(
+                    asyncio.get_event_loop().getaddrinfo(
+                        host, None, family=socket.AF_UNSPEC, type=socket.SOCK_STREAM
+                    ),
+                    timeout=self.timeout
+                )
+                for info in infos:
+                    address = info[4][0]
+                    if address not in addresses:
+                        addresses.append(address)
+                record_ttl = 0
+
+            # IPv4 优先（与原先只查 A 记录时的行为一致），其后是 IPv6
+            addresses.sort(key=lambda a: ":" in a)
+            if addresses:
+                ttl = record_ttl if record_ttl > 0 else self.default_ttl
+                ttl = min(max(ttl, self.min_ttl), self.max_ttl)
+        except asyncio.TimeoutError:
+            logger.debug(f"DNS 解析超时: {host}")
+        except Exception as e:
+            logger.debug(f"DNS 解析失败: {host} ({e})")
+
+        resolve_ms = int((time.monotonic() - start) * 1000)
+        return DNSEntry(
+            addresses=addresses,
+            expires_at=time.monotonic() + ttl,
+            resolve_ms=resolve_ms
+        )
+
+    def stats(self) -> Dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+class CachedResolver(AbstractResolver):
+    """让 aiohttp 连接器使用 DNSCache 的解析结果"""
+
+    def __init__(self, cache: DNSCache):
+        self.cache = cache
+
+    async def resolve(self, host: str, port: int = 0, family: int = socket.AF_INET) -> List[Dict]:
+        entry = await self.cache.resolve(host, family)
+        if not entry.ok:
+            raise OSError(f"DNS resolution failed for {host}")
+        return [
+            {
+                "hostname": host,
+                "host": address,
+                "port": port,
+                "family": socket.AF_INET6 if ":" in address else socket.AF_INET,
+                "proto": 0,
+                "flags": socket.AI_NUMERICHOST
+            }
+            for address in entry.addresses
+        ]
+
+    async def close(self) -> None:
+        pass
+
+
+# ==================== 全局缓存实例 ====================
+
+dns_cache = DNSCache()
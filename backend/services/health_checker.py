@@ -5,12 +5,29 @@
 import asyncio
 import aiohttp
 import socket
+import ssl
+import struct
+import base64
+import json
 import logging
-from typing import List, Dict, Optional, Tuple
-from datetime import datetime
-from dataclasses import dataclass
+from typing import List, Dict, Optional, Tuple, AsyncIterator, Callable
+from datetime import datetime, timezone
+from urllib.parse import urlsplit, parse_qs, unquote
+from dataclasses import dataclass, field, replace
 from enum import Enum
+import errno
 import os
+import random
+import time
+
+from .concurrency import (
+    AdaptiveLimiter,
+    OUTCOME_SUCCESS,
+    OUTCOME_TIMEOUT,
+    OUTCOME_ERROR,
+    OUTCOME_LOCAL
+)
+from .dns_cache import DNSCache, CachedResolver, dns_cache as shared_dns_cache
 
 logging.basicConfig(
     level=logging.INFO,
@@ -28,6 +45,167 @@ class NodeStatus(str, Enum):
     UNKNOWN = "unknown"
 
 
+class ProbeErrorKind(str, Enum):
+    """探测错误分类"""
+    TIMEOUT = "timeout"
+    REFUSED = "refused"
+    DNS = "dns"
+    LOCAL = "local"        # 本机资源错误（fd 耗尽、端口耗尽等）
+    NETWORK = "network"
+    DEADLINE = "deadline"  # 批次时间预算耗尽，未探测
+    TLS = "tls"            # TCP 已通但 TLS 握手失败
+    OTHER = "other"
+
+
+# TCP 探测实现（auto：uvloop 下用 stream，默认事件循环下用 socket，两者分别是各自循环上更快的实现）
+TCP_ENGINES = ("stream", "socket", "auto")
+
+# 本机资源类错误码：出现时说明是检测端过载，而不是节点问题
+LOCAL_ERRNOS = {
+    errno.EMFILE,
+    errno.ENFILE,
+    errno.ENOBUFS,
+    errno.ENOMEM,
+    errno.EADDRNOTAVAIL
+}
+
+
+def classify_probe_error(message: Optional[str]) -> Optional[ProbeErrorKind]:
+    """根据探测错误信息判断错误类型"""
+    if not message:
+        return None
+    if "timeout" in message.lower():
+        return ProbeErrorKind.TIMEOUT
+    if message.startswith("Connection refused"):
+        return ProbeErrorKind.REFUSED
+    if message.startswith("DNS resolution failed"):
+        return ProbeErrorKind.DNS
+    if message.startswith("Deadline exceeded"):
+        return ProbeErrorKind.DEADLINE
+    if message.startswith("TLS handshake failed"):
+        return ProbeErrorKind.TLS
+    if message.startswith("Local resource error"):
+        return ProbeErrorKind.LOCAL
+    if message.startswith("OS error") or message.startswith("HTTP error"):
+        return ProbeErrorKind.NETWORK
+    return ProbeErrorKind.OTHER
+
+
+# 分阶段耗时的阶段名
+TIMING_PHASES = ("dns", "tcp", "tls", "ttfb")
+
+# 默认走 TLS 的协议
+TLS_PROTOCOLS = ("trojan", "https")
+
+
+def _b64decode(data: str) -> str:
+    data = data.strip()
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4)).decode("utf-8", errors="ignore")
+
+
+def parse_tls_sni(protocol: str, link: Optional[str], host: str) -> Optional[str]:
+    """
+    从节点分享链接判断是否使用 TLS，并取出 SNI
+    
+    - trojan / https 默认 TLS；vless 看 security=tls/reality；vmess 看 base64 JSON 中的 tls 字段
+    - SNI 依次取 sni、peer、host/伪装域名，都没有时使用节点地址
+    
+    Returns:
+        需要 TLS 握手时返回 SNI，否则返回 None
+    """
+    protocol = (protocol or "").lower()
+    link = link or ""
+    
+    try:
+        if link.startswith("vmess://"):
+            info = json.loads(_b64decode(link[len("vmess://"):]))
+            if str(info.get("tls", "")).lower() != "tls":
+                return None
+            return info.get("sni") or info.get("host") or host
+        
+        if "://" in link:
+            query = parse_qs(urlsplit(link).query)
+            security = (query.get("security") or [""])[0].lower()
+            if protocol == "vless" and security not in ("tls", "reality", "xtls"):
+                return None
+            if protocol not in TLS_PROTOCOLS and protocol != "vless" and security != "tls":
+                return None
+            if security == "none":
+                return None
+            for key in ("sni", "peer", "host"):
+                if query.get(key):
+                    return unquote(query[key][0])
+            return host
+    except (ValueError, UnicodeError):
+        pass
+    
+    return host if protocol in TLS_PROTOCOLS else None
+
+
+def parse_check_time(value: Optional[str]) -> float:
+    """把 last_health_check 转为时间戳；从未检测过返回 0"""
+    if not value:
+        return 0.0
+    try:
+        checked = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        if checked.tzinfo is None:
+            # 健康检测写入的是 utcnow().isoformat()，不带时区
+            checked = checked.replace(tzinfo=timezone.utc)
+        return checked.timestamp()
+    except ValueError:
+        return 0.0
+
+
+@dataclass
+class FreshnessPolicy:
+    """
+    新鲜度策略：距上次检测未超过对应状态窗口的节点不再重复探测
+    
+    online 节点状态稳定，窗口较长；offline / suspect 节点可能很快恢复，窗口较短。
+    窗口为 0 的状态总是重新探测。
+    """
+    windows: Dict[str, float] = field(default_factory=lambda: {
+        "online": 300.0,
+        "offline": 120.0,
+        "suspect": 60.0
+    })
+    
+    def is_fresh(self, status: str, checked_ts: float, now: float) -> bool:
+        window = self.windows.get(status, 0.0)
+        return window > 0 and checked_ts > 0 and now - checked_ts < window
+
+
+@dataclass
+class RetryPolicy:
+    """
+    重试策略
+    
+    - 拒绝连接、DNS 失败等确定性错误不重试
+    - 退避为指数增长 + 抖动：base_delay * 2^attempt，上限 max_delay，
+      实际等待在 [delay * (1 - jitter), delay] 之间随机
+    - node_deadline 为单个节点（含所有重试）的总时间预算，单次探测超时会被裁剪到剩余预算内
+    """
+    max_retries: int = 2
+    base_delay: float = 0.25
+    max_delay: float = 2.0
+    jitter: float = 0.5
+    node_deadline: float = 15.0
+    terminal_kinds: Tuple[ProbeErrorKind, ...] = (
+        ProbeErrorKind.REFUSED,
+        ProbeErrorKind.DNS,
+        ProbeErrorKind.DEADLINE,
+        ProbeErrorKind.TLS,
+        ProbeErrorKind.OTHER
+    )
+    
+    def is_retryable(self, kind: Optional[ProbeErrorKind]) -> bool:
+        return kind is not None and kind not in self.terminal_kinds
+    
+    def backoff(self, attempt: int) -> float:
+        delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return random.uniform(delay * (1 - self.jitter), delay)
+
+
 @dataclass
 class HealthCheckResult:
     """健康检测结果"""
@@ -39,8 +217,101 @@ class HealthCheckResult:
     http_ok: bool
     latency_ms: Optional[int] = None
     error_message: Optional[str] = None
+    error_kind: Optional[ProbeErrorKind] = None
     retry_count: int = 0
     checked_at: str = ""
+    from_cache: bool = False  # 新鲜度窗口内复用的上次结果，未实际探测
+    # 分阶段耗时（毫秒）：DNS 解析、TCP 握手、TLS 握手、HTTP 首字节
+    dns_ms: Optional[int] = None
+    tcp_ms: Optional[int] = None
+    tls_ms: Optional[int] = None
+    ttfb_ms: Optional[int] = None
+    
+    def timings(self) -> Dict[str, Optional[int]]:
+        """分阶段耗时"""
+        return {phase: getattr(self, f"{phase}_ms") for phase in TIMING_PHASES}
+
+
+@dataclass
+class HealthCheckStats:
+    """健康检测运行统计（由流水线聚合阶段实时更新）"""
+    total: int = 0
+    checked: int = 0
+    online: int = 0
+    offline: int = 0
+    suspect: int = 0
+    unknown: int = 0
+    deadline_skipped: int = 0
+    fresh_skipped: int = 0
+    probes: int = 0
+    probes_saved: int = 0
+    update_success: int = 0
+    update_fail: int = 0
+    concurrency: Dict = field(default_factory=dict)
+    problem_nodes: List[Dict] = field(default_factory=list)
+    phase_samples: Dict[str, List[int]] = field(default_factory=dict, repr=False)
+
+    def record(self, result: HealthCheckResult):
+        """聚合单个检测结果"""
+        self.checked += 1
+        if result.from_cache:
+            self.fresh_skipped += 1
+        for phase, value in result.timings().items():
+            if value is not None:
+                self.phase_samples.setdefault(phase, []).append(value)
+        if result.status == NodeStatus.ONLINE:
+            self.online += 1
+        elif result.status == NodeStatus.OFFLINE:
+            self.offline += 1
+        elif result.status == NodeStatus.SUSPECT:
+            self.suspect += 1
+        else:
+            self.unknown += 1
+            if result.error_kind == ProbeErrorKind.DEADLINE:
+                self.deadline_skipped += 1
+
+        if result.status in (NodeStatus.OFFLINE, NodeStatus.SUSPECT):
+            self.problem_nodes.append({
+                "id": result.node_id,
+                "name": result.host,
+                "host": result.host,
+                "port": result.port,
+                "status": result.status.value
+            })
+
+    def to_dict(self) -> Dict:
+        """转换为 API 返回格式"""
+        return {
+            "total": self.total,
+            "checked": self.checked,
+            "online": self.online,
+            "offline": self.offline,
+            "suspect": self.suspect,
+            "unknown": self.unknown,
+            "deadline_skipped": self.deadline_skipped,
+            "fresh_skipped": self.fresh_skipped,
+            "probes": self.probes,
+            "probes_saved": self.probes_saved,
+            "update_success": self.update_success,
+            "update_fail": self.update_fail,
+            "concurrency": self.concurrency,
+            "timings": self.timing_summary()
+        }
+
+    def timing_summary(self) -> Dict[str, Dict]:
+        """各阶段耗时的样本数、平均值和 p50/p95（毫秒）"""
+        summary = {}
+        for phase in TIMING_PHASES:
+            samples = sorted(self.phase_samples.get(phase, []))
+            if not samples:
+                continue
+            summary[phase] = {
+                "count": len(samples),
+                "avg": round(sum(samples) / len(samples), 1),
+                "p50": samples[int(0.5 * (len(samples) - 1))],
+                "p95": samples[int(round(0.95 * (len(samples) - 1)))]
+            }
+        return summary
 
 
 class LightweightHealthChecker:
@@ -51,39 +322,210 @@ class LightweightHealthChecker:
         tcp_timeout: float = 5.0,
         http_timeout: float = 10.0,
         max_retries: int = 2,
-        max_concurrent: int = 20
+        max_concurrent: int = 20,
+        limiter: Optional[AdaptiveLimiter] = None,
+        dns_cache: Optional[DNSCache] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        batch_deadline: Optional[float] = None,
+        tcp_engine: str = "stream"
     ):
-        """初始化检测器"""
+        """
+        初始化检测器
+        
+        传入 limiter 时并发由自适应限流器控制，max_concurrent 仅作为无限流器时的固定并发数；
+        batch_deadline 为整批检测的时间预算（秒），超出后未开始的节点不再探测；
+        tcp_engine 选择 TCP 探测实现："stream"（asyncio.open_connection）、"socket"（非阻塞原始 socket）
+        或 "auto"（按事件循环类型选择）
+        """
+        if tcp_engine not in TCP_ENGINES:
+            raise ValueError(f"未知的 TCP 探测引擎: {tcp_engine}")
+        self.tcp_engine = tcp_engine
         self.tcp_timeout = tcp_timeout
         self.http_timeout = http_timeout
-        self.max_retries = max_retries
+        self.retry_policy = retry_policy or RetryPolicy(max_retries=max_retries)
+        self.max_retries = self.retry_policy.max_retries
+        self.batch_deadline = batch_deadline
         self.max_concurrent = max_concurrent
+        self.limiter = limiter
+        self.dns_cache = dns_cache or shared_dns_cache
         self.test_urls = [
             "http://www.gstatic.com/generate_204",
             "http://cp.cloudflare.com/",
             "http://connectivitycheck.platform.hicloud.com/generate_204"
         ]
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._ssl_context: Optional[ssl.SSLContext] = None
     
-    async def check_tcp_connection(self, host: str, port: int) -> Tuple[bool, Optional[int], Optional[str]]:
-        """TCP 连接测试"""
+    @property
+    def concurrency_ceiling(self) -> int:
+        """并发硬上限"""
+        return self.limiter.max_limit if self.limiter else self.max_concurrent
+    
+    # ==================== 探测会话 ====================
+    
+    async def __aenter__(self) -> "LightweightHealthChecker":
+        """
+        打开检测器专用的 HTTP 探测会话
+        
+        - 连接数上限与并发数一致，避免文件描述符突增
+        - 通过 CachedResolver 使用检测器的 DNS 缓存，连接直接走预解析的 IP
+        - 禁用 keep-alive（force_close），每次探测都是全新连接，保证延迟测量可比
+        """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.concurrency_ceiling,
+                limit_per_host=0,
+                resolver=CachedResolver(self.dns_cache),
+                use_dns_cache=False,
+                force_close=True,
+                ssl=False
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.http_timeout)
+            )
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+    
+    async def close(self):
+        """关闭探测会话"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+    
+    @staticmethod
+    async def _connect_stream(host: str, port: int, timeout: float) -> int:
+        """通过 asyncio.open_connection 建立连接，返回握手耗时（毫秒）"""
+        start_time = asyncio.get_event_loop().time()
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout=timeout)
+        latency_ms = int((asyncio.get_event_loop().time() - start_time) * 1000)
+        writer.close()
+        await writer.wait_closed()
+        return latency_ms
+    
+    @staticmethod
+    async def _connect_socket(host: str, port: int, timeout: float) -> int:
+        """
+        原始 socket 非阻塞连接，返回握手耗时（毫秒）
+        
+        loop.sock_connect 发起非阻塞 connect 并通过 selector 等待可写，
+        不创建 transport / StreamReader / StreamWriter；
+        SO_LINGER=0 关闭时直接发送 RST，检测端不留 TIME_WAIT
+        """
+        loop = asyncio.get_event_loop()
+        family = socket.AF_INET6 if ":" in host else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
         try:
-            start_time = asyncio.get_event_loop().time()
-            future = asyncio.open_connection(host, port)
-            reader, writer = await asyncio.wait_for(future, timeout=self.tcp_timeout)
-            latency_ms = int((asyncio.get_event_loop().time() - start_time) * 1000)
-            writer.close()
-            await writer.wait_closed()
+            sock.setblocking(False)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+            start_ns = time.perf_counter_ns()
+            await asyncio.wait_for(loop.sock_connect(sock, (host, port)), timeout=timeout)
+            return (time.perf_counter_ns() - start_ns) // 1_000_000
+        finally:
+            sock.close()
+    
+    async def check_tcp_connection(self, host: str, port: int, timeout: Optional[float] = None) -> Tuple[bool, Optional[int], Optional[str]]:
+        """TCP 连接测试（按 tcp_engine 选择实现）"""
+        try:
+            engine = self.tcp_engine
+            if engine == "auto":
+                on_uvloop = type(asyncio.get_event_loop()).__module__.startswith("uvloop")
+                engine = "stream" if on_uvloop else "socket"
+            connect = self._connect_socket if engine == "socket" else self._connect_stream
+            latency_ms = await connect(host, port, timeout or self.tcp_timeout)
             return True, latency_ms, None
         except asyncio.TimeoutError:
             return False, None, "TCP connection timeout"
         except ConnectionRefusedError:
             return False, None, "Connection refused"
         except OSError as e:
+            if e.errno in LOCAL_ERRNOS:
+                return False, None, f"Local resource error: {str(e)[:50]}"
             return False, None, f"OS error: {str(e)[:50]}"
         except Exception as e:
             return False, None, f"TCP error: {str(e)[:50]}"
     
-    async def check_http_connectivity(self, host: str, port: int, protocol: str = "http") -> Tuple[bool, Optional[int], Optional[str]]:
+    def _get_ssl_context(self) -> ssl.SSLContext:
+        """TLS 探测只验证握手能否完成，不校验证书（代理节点普遍使用自签证书）"""
+        if self._ssl_context is None:
+            context = ssl.create_default_context()
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+            self._ssl_context = context
+        return self._ssl_context
+    
+    async def check_tls_handshake(
+        self,
+        host: str,
+        port: int,
+        sni: str,
+        timeout: Optional[float] = None
+    ) -> Tuple[bool, Optional[int], Optional[int], Optional[str]]:
+        """
+        TCP + TLS 握手测试（同一条连接上分别计时）
+        
+        Returns:
+            (是否成功, TCP 握手耗时, TLS 握手耗时, 错误信息)；TCP 已通而 TLS 失败时 TCP 耗时仍然有效
+        """
+        loop = asyncio.get_event_loop()
+        timeout = timeout or self.tcp_timeout
+        started = loop.time()
+        family = socket.AF_INET6 if ":" in host else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        tcp_ms = None
+        try:
+            start_ns = time.perf_counter_ns()
+            await asyncio.wait_for(loop.sock_connect(sock, (host, port)), timeout=timeout)
+            tcp_ms = (time.perf_counter_ns() - start_ns) // 1_000_000
+            
+            remaining = timeout - (loop.time() - started)
+            if remaining <= 0:
+                return False, tcp_ms, None, "TLS handshake timeout"
+            
+            start_ns = time.perf_counter_ns()
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(sock=sock, ssl=self._get_ssl_context(), server_hostname=sni),
+                timeout=remaining
+            )
+            tls_ms = (time.perf_counter_ns() - start_ns) // 1_000_000
+            # 直接断开，不等待 close_notify
+            writer.transport.abort()
+            return True, tcp_ms, tls_ms, None
+        except asyncio.TimeoutError:
+            if tcp_ms is None:
+                return False, None, None, "TCP connection timeout"
+            return False, tcp_ms, None, "TLS handshake timeout"
+        except ssl.SSLError as e:
+            return False, tcp_ms, None, f"TLS handshake failed: {str(e)[:50]}"
+        except ConnectionRefusedError:
+            return False, None, None, "Connection refused"
+        except OSError as e:
+            if tcp_ms is not None:
+                # 握手中途被断开（常见于端口上跑的不是 TLS 服务）
+                return False, tcp_ms, None, f"TLS handshake failed: {(str(e) or type(e).__name__)[:50]}"
+            if e.errno in LOCAL_ERRNOS:
+                return False, None, None, f"Local resource error: {str(e)[:50]}"
+            return False, None, None, f"OS error: {str(e)[:50]}"
+        except Exception as e:
+            return False, tcp_ms, None, f"TCP error: {str(e)[:50]}"
+        finally:
+            sock.close()
+    
+    async def _head_probe(self, session: aiohttp.ClientSession, test_url: str, start_time: float, timeout: float) -> Tuple[bool, Optional[int], Optional[str]]:
+        """发送 HEAD 探测并计算延迟"""
+        async with session.head(
+            test_url,
+            timeout=aiohttp.ClientTimeout(total=timeout),
+            allow_redirects=False,
+            ssl=False
+        ) as resp:
+            latency_ms = int((asyncio.get_event_loop().time() - start_time) * 1000)
+            return True, latency_ms, None
+    
+    async def check_http_connectivity(self, host: str, port: int, protocol: str = "http", timeout: Optional[float] = None) -> Tuple[bool, Optional[int], Optional[str]]:
         """HTTP 连通性测试"""
         if protocol.lower() not in ['http', 'https', 'socks5', 'socks']:
             return True, 0, None
@@ -96,15 +538,11 @@ class LightweightHealthChecker:
             else:
                 return True, 0, None
             
-            async with aiohttp.ClientSession() as session:
-                async with session.head(
-                    test_url,
-                    timeout=aiohttp.ClientTimeout(total=self.http_timeout),
-                    allow_redirects=False,
-                    ssl=False
-                ) as resp:
-                    latency_ms = int((asyncio.get_event_loop().time() - start_time) * 1000)
-                    return True, latency_ms, None
+            if self._session is None or self._session.closed:
+                # 未在 async with 中使用时，退化为一次性会话
+                async with aiohttp.ClientSession() as session:
+                    return await self._head_probe(session, test_url, start_time, timeout or self.http_timeout)
+            return await self._head_probe(self._session, test_url, start_time, timeout or self.http_timeout)
         except asyncio.TimeoutError:
             return False, None, "HTTP timeout"
         except aiohttp.ClientError as e:
@@ -112,8 +550,12 @@ class LightweightHealthChecker:
         except Exception as e:
             return False, None, f"HTTP error: {str(e)[:50]}"
     
-    async def check_node(self, node: Dict) -> HealthCheckResult:
-        """检测单个节点"""
+    async def check_node(self, node: Dict, deadline: Optional[float] = None) -> HealthCheckResult:
+        """
+        检测单个节点
+        
+        deadline 为事件循环时间上的绝对截止点（通常来自批次预算），与节点自身预算取较早者
+        """
         node_id = node.get("id", "")
         host = node.get("host", "")
         port = node.get("port", 0)
@@ -128,37 +570,101 @@ class LightweightHealthChecker:
                 tcp_ok=False,
                 http_ok=False,
                 error_message="Invalid host or port",
+                error_kind=ProbeErrorKind.OTHER,
+                checked_at=datetime.utcnow().isoformat()
+            )
+        
+        # 批次开始时已预解析，这里通常直接命中缓存
+        dns_entry = await self.dns_cache.resolve(host)
+        if not dns_entry.ok:
+            return HealthCheckResult(
+                node_id=node_id,
+                host=host,
+                port=port,
+                status=NodeStatus.OFFLINE,
+                tcp_ok=False,
+                http_ok=False,
+                error_message="DNS resolution failed",
+                error_kind=ProbeErrorKind.DNS,
                 checked_at=datetime.utcnow().isoformat()
             )
+        address = dns_entry.addresses[0]
+        # TLS 协议（trojan、vless+tls 等）用握手代替单纯的 TCP 连接作为存活判断
+        sni = parse_tls_sni(protocol, node.get("link"), host)
+        
+        loop = asyncio.get_event_loop()
+        policy = self.retry_policy
+        node_deadline = loop.time() + policy.node_deadline
+        if deadline is not None:
+            node_deadline = min(node_deadline, deadline)
+            if node_deadline <= loop.time():
+                return self._deadline_result(node)
         
         tcp_ok = False
+        tls_ok = True
         http_ok = False
         latency_ms = None
+        tls_ms = None
+        ttfb_ms = None
         error_message = None
         retry_count = 0
         
-        for attempt in range(self.max_retries + 1):
-            tcp_ok, tcp_latency, tcp_error = await self.check_tcp_connection(host, port)
+        for attempt in range(policy.max_retries + 1):
+            remaining = node_deadline - loop.time()
+            if remaining <= 0:
+                break
+            retry_count = attempt
+            
+            if sni:
+                tcp_ok, tcp_latency, tls_ms, tcp_error = await self.check_tls_handshake(
+                    address, port, sni, timeout=min(self.tcp_timeout, remaining)
+                )
+                # TCP 已通、TLS 失败时单独记录，状态判为可疑
+                tls_ok = tcp_ok
+                tcp_ok = tcp_latency is not None
+            else:
+                tcp_ok, tcp_latency, tcp_error = await self.check_tcp_connection(
+                    address, port, timeout=min(self.tcp_timeout, remaining)
+                )
             
-            if tcp_ok:
+            if tcp_ok and not tls_ok:
+                latency_ms = tcp_latency
+                error_message = tcp_error
+            elif tcp_ok:
                 latency_ms = tcp_latency
+                remaining = node_deadline - loop.time()
+                if remaining <= 0:
+                    # TCP 已通但没有预算做 HTTP 探测，按 TCP 结果判定
+                    http_ok = protocol.lower() not in ['http', 'https']
+                    error_message = None if http_ok else "HTTP timeout (deadline)"
+                    break
                 http_ok, http_latency, http_error = await self.check_http_connectivity(
-                    host, port, protocol
+                    host, port, protocol, timeout=min(self.http_timeout, remaining)
                 )
                 
                 if http_ok:
+                    error_message = None
+                    if protocol.lower() in ['http', 'https']:
+                        ttfb_ms = http_latency
                     break
                 else:
                     error_message = http_error
             else:
                 error_message = tcp_error
             
-            retry_count = attempt
+            # 确定性错误（拒绝连接等）直接结束，不浪费并发槽位
+            if not policy.is_retryable(classify_probe_error(error_message)):
+                break
             
-            if attempt < self.max_retries:
-                await asyncio.sleep(0.5)
+            if attempt < policy.max_retries:
+                delay = policy.backoff(attempt)
+                if loop.time() + delay >= node_deadline:
+                    break
+                await asyncio.sleep(delay)
         
-        if tcp_ok and http_ok:
+        if tcp_ok and not tls_ok:
+            status = NodeStatus.SUSPECT
+        elif tcp_ok and http_ok:
             status = NodeStatus.ONLINE
         elif tcp_ok and not http_ok:
             if protocol.lower() in ['vmess', 'vless', 'trojan', 'ss', 'shadowsocks', 'ssr']:
@@ -177,85 +683,417 @@ class LightweightHealthChecker:
             http_ok=http_ok,
             latency_ms=latency_ms,
             error_message=error_message,
+            error_kind=classify_probe_error(error_message) if status != NodeStatus.ONLINE else None,
             retry_count=retry_count,
+            checked_at=datetime.utcnow().isoformat(),
+            dns_ms=dns_entry.resolve_ms,
+            tcp_ms=latency_ms,
+            tls_ms=tls_ms,
+            ttfb_ms=ttfb_ms
+        )
+    
+    @staticmethod
+    def _limiter_outcome(result: HealthCheckResult) -> str:
+        """把检测结果映射为限流器的反馈信号"""
+        if result.status == NodeStatus.ONLINE:
+            return OUTCOME_SUCCESS
+        if result.error_kind == ProbeErrorKind.LOCAL:
+            return OUTCOME_LOCAL
+        if result.error_kind == ProbeErrorKind.TIMEOUT:
+            return OUTCOME_TIMEOUT
+        return OUTCOME_ERROR
+    
+    def _deadline_result(self, node: Dict) -> HealthCheckResult:
+        """批次预算耗尽时未探测节点的占位结果（不写入数据库）"""
+        return HealthCheckResult(
+            node_id=node.get("id", ""),
+            host=node.get("host", ""),
+            port=node.get("port", 0),
+            status=NodeStatus.UNKNOWN,
+            tcp_ok=False,
+            http_ok=False,
+            error_message="Deadline exceeded: batch budget exhausted",
+            error_kind=ProbeErrorKind.DEADLINE,
             checked_at=datetime.utcnow().isoformat()
         )
     
-    async def check_nodes_batch(self, nodes: List[Dict]) -> List[HealthCheckResult]:
-        """批量检测节点"""
-        semaphore = asyncio.Semaphore(self.max_concurrent)
-        
-        async def check_with_semaphore(node: Dict) -> HealthCheckResult:
-            async with semaphore:
-                return await self.check_node(node)
-        
-        tasks = [check_with_semaphore(node) for node in nodes]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        
-        final_results = []
-        for i, result in enumerate(results):
-            if isinstance(result, Exception):
-                node = nodes[i]
-                final_results.append(HealthCheckResult(
-                    node_id=node.get("id", ""),
-                    host=node.get("host", ""),
-                    port=node.get("port", 0),
-                    status=NodeStatus.UNKNOWN,
-                    tcp_ok=False,
-                    http_ok=False,
-                    error_message=f"Check exception: {str(result)[:50]}",
-                    checked_at=datetime.utcnow().isoformat()
-                ))
+    def _exception_result(self, node: Dict, error: BaseException) -> HealthCheckResult:
+        """检测过程抛出异常时的兜底结果"""
+        if not isinstance(node, dict):
+            node = {}
+        return HealthCheckResult(
+            node_id=node.get("id", ""),
+            host=node.get("host", ""),
+            port=node.get("port", 0),
+            status=NodeStatus.UNKNOWN,
+            tcp_ok=False,
+            http_ok=False,
+            error_message=f"Check exception: {str(error)[:50]}",
+            error_kind=ProbeErrorKind.OTHER,
+            checked_at=datetime.utcnow().isoformat()
+        )
+    
+    def _endpoint_key(self, node: Dict) -> Optional[Tuple[str, int, str]]:
+        """
+        探测端点键：(解析后的 IP, 端口, 探测类型)
+        
+        非 HTTP 协议只做 TCP 探测，结果与协议无关，归为同一类；
+        HTTP/HTTPS 的探测结果依赖协议，需要 TLS 握手的节点按 SNI 分别成组。
+        无法解析的节点返回 None，单独处理。
+        """
+        host = node.get("host", "")
+        port = node.get("port", 0)
+        if not host or not port:
+            return None
+        if DNSCache.is_ip(host):
+            address = host
+        else:
+            entry = self.dns_cache.peek(host)
+            if not entry or not entry.ok:
+                return None
+            address = entry.addresses[0]
+        protocol = str(node.get("protocol", "")).lower()
+        if protocol in ("http", "https"):
+            probe_type = protocol
+        else:
+            sni = parse_tls_sni(protocol, node.get("link"), host)
+            probe_type = f"tls:{sni}" if sni else "tcp"
+        return address, port, probe_type
+    
+    def _group_endpoints(self, nodes: List[Dict]) -> List[List[Tuple[int, Dict]]]:
+        """按端点分组，每组只探测第一个节点"""
+        groups: Dict[Tuple[str, int, str], List[Tuple[int, Dict]]] = {}
+        singles: List[List[Tuple[int, Dict]]] = []
+        for index, node in enumerate(nodes):
+            key = self._endpoint_key(node)
+            if key is None:
+                singles.append([(index, node)])
             else:
-                final_results.append(result)
+                groups.setdefault(key, []).append((index, node))
+        return list(groups.values()) + singles
+    
+    @staticmethod
+    def _fan_out(result: HealthCheckResult, node: Dict) -> HealthCheckResult:
+        """把端点的检测结果复制给共享该端点的其他节点"""
+        return replace(
+            result,
+            node_id=node.get("id", ""),
+            host=node.get("host", ""),
+            port=node.get("port", 0)
+        )
+    
+    async def _check_group(
+        self,
+        group: List[Tuple[int, Dict]],
+        batch_deadline_at: Optional[float]
+    ) -> List[Tuple[int, HealthCheckResult]]:
+        """
+        探测一组共享端点的节点（只探测第一个），返回组内每个下标的结果
+        
+        不抛出异常：限流器、探测或结果复制出错时该节点得到异常兜底结果，
+        保证每个下标都有结果，消费方不会因缺少结果而一直等待
+        """
+        first_index, first_node = group[0]
+        loop = asyncio.get_event_loop()
+        acquired = False
+        outcome = OUTCOME_ERROR
+        try:
+            if batch_deadline_at is not None and loop.time() >= batch_deadline_at:
+                result = self._deadline_result(first_node)
+            else:
+                if self.limiter:
+                    await self.limiter.acquire()
+                    acquired = True
+                result = await self.check_node(first_node, deadline=batch_deadline_at)
+                outcome = self._limiter_outcome(result)
+        except Exception as e:
+            result = self._exception_result(first_node, e)
+        finally:
+            if acquired:
+                self.limiter.release(outcome)
+        
+        items = [(first_index, result)]
+        for index, node in group[1:]:
+            try:
+                items.append((index, self._fan_out(result, node)))
+            except Exception as e:
+                items.append((index, self._exception_result(node, e)))
+        return items
+    
+    @staticmethod
+    def _raise_dead_workers(workers: List[asyncio.Task], remaining: int):
+        """worker 全部退出但仍缺少结果：抛出 worker 的异常"""
+        for task in workers:
+            if not task.cancelled() and task.exception() is not None:
+                raise RuntimeError(f"健康检测 worker 异常退出，{remaining} 个节点没有结果") from task.exception()
+        raise RuntimeError(f"健康检测 worker 已全部退出，{remaining} 个节点没有结果")
+    
+    async def _iter_indexed(
+        self,
+        nodes: List[Dict],
+        queue_size: Optional[int] = None,
+        stats: Optional[HealthCheckStats] = None
+    ) -> AsyncIterator[Tuple[int, HealthCheckResult]]:
+        """按完成顺序产出 (输入下标, 结果)"""
+        loop = asyncio.get_event_loop()
+        batch_deadline_at = loop.time() + self.batch_deadline if self.batch_deadline else None
         
+        # 预解析：批次内所有唯一主机名并发解析一次，无法解析的节点后续直接判为离线
+        await self.dns_cache.resolve_many(node.get("host", "") for node in nodes)
+        
+        # 端点去重：同一 (IP, 端口, 探测类型) 每批只探测一次
+        groups = self._group_endpoints(nodes)
+        if stats is not None:
+            stats.probes = len(groups)
+            stats.probes_saved = len(nodes) - len(groups)
+        
+        pending: asyncio.Queue = asyncio.Queue()
+        for group in groups:
+            pending.put_nowait(group)
+        
+        results: asyncio.Queue = asyncio.Queue(maxsize=queue_size or self.concurrency_ceiling * 2)
+        # 有限流器时按硬上限创建 worker，实际并发由限流器动态控制
+        worker_count = max(1, min(self.concurrency_ceiling, len(groups)))
+        
+        async def worker():
+            while True:
+                try:
+                    group = pending.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                for item in await self._check_group(group, batch_deadline_at):
+                    await results.put(item)
+        
+        # 整个批次共享一个探测会话；调用方已打开时直接复用
+        owns_session = self._session is None or self._session.closed
+        if owns_session:
+            await self.__aenter__()
+        if self.limiter:
+            self.limiter.start()
+        
+        workers = [asyncio.create_task(worker()) for _ in range(worker_count)]
+        try:
+            remaining = len(nodes)
+            while remaining:
+                if not results.empty():
+                    remaining -= 1
+                    yield results.get_nowait()
+                    continue
+                # 同时等待结果和 worker：worker 全部退出而结果不足时报错，不再无限等待
+                alive = [task for task in workers if not task.done()]
+                if not alive:
+                    self._raise_dead_workers(workers, remaining)
+                getter = asyncio.ensure_future(results.get())
+                try:
+                    await asyncio.wait([getter, *alive], return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    if not getter.done():
+                        getter.cancel()
+                if getter.done() and not getter.cancelled():
+                    remaining -= 1
+                    yield getter.result()
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            if self.limiter:
+                await self.limiter.stop()
+            if owns_session:
+                await self.close()
+    
+    async def iter_check_nodes(
+        self,
+        nodes: List[Dict],
+        queue_size: Optional[int] = None,
+        stats: Optional[HealthCheckStats] = None
+    ) -> AsyncIterator[HealthCheckResult]:
+        """
+        流式检测节点：按完成顺序产出结果
+        
+        固定数量的 worker 从待检测队列取节点，结果写入有界队列，
+        慢节点不会阻塞快节点结果的下游处理；下游消费慢时 worker 会被反压。
+        传入 stats 时写入本批次的探测数和去重节省的探测数。
+        """
+        async for _, result in self._iter_indexed(nodes, queue_size, stats):
+            yield result
+    
+    async def check_nodes_batch(
+        self,
+        nodes: List[Dict],
+        stats: Optional[HealthCheckStats] = None
+    ) -> List[HealthCheckResult]:
+        """批量检测节点（结果顺序与输入一致）"""
+        final_results: List[Optional[HealthCheckResult]] = [None] * len(nodes)
+        async for index, result in self._iter_indexed(nodes, stats=stats):
+            final_results[index] = result
         return final_results
 
 
 class SupabaseHealthUpdater:
     """Supabase 健康状态更新器"""
     
-    def __init__(self, supabase_url: str = None, supabase_key: str = None):
+    def __init__(
+        self,
+        supabase_url: str = None,
+        supabase_key: str = None,
+        table: str = "nodes",
+        persist_timings: bool = False
+    ):
+        """persist_timings 为 True 时同时写入 health_timings 列（见 scripts/add_health_timings.sql）"""
         self.supabase_url = supabase_url or os.environ.get("SUPABASE_URL", "")
         self.supabase_key = supabase_key or os.environ.get("SUPABASE_KEY", "")
+        self.table = table
+        self.persist_timings = persist_timings
     
-    async def update_node_status(self, results: List[HealthCheckResult]) -> Tuple[int, int]:
-        """更新节点状态到 Supabase"""
-        if not self.supabase_url or not self.supabase_key:
-            return 0, len(results)
-        
-        success_count = 0
-        fail_count = 0
-        
-        headers = {
+    def _headers(self) -> Dict:
+        return {
             "apikey": self.supabase_key,
             "Authorization": f"Bearer {self.supabase_key}",
             "Content-Type": "application/json",
             "Prefer": "return=minimal"
         }
+    
+    async def _update_one(self, session: aiohttp.ClientSession, result: HealthCheckResult) -> bool:
+        """更新单个节点状态"""
+        if not result.node_id:
+            return False
+        
+        try:
+            url = f"{self.supabase_url}/rest/v1/{self.table}?id=eq.{result.node_id}"
+            
+            update_data = {
+                "status": result.status.value,
+                "last_health_check": result.checked_at,
+                "health_latency": result.latency_ms
+            }
+            if self.persist_timings:
+                update_data["health_timings"] = result.timings()
+            
+            async with session.patch(url, json=update_data, headers=self._headers(), timeout=aiohttp.ClientTimeout(total=5)) as resp:
+                return resp.status in [200, 204]
+                
+        except Exception:
+            return False
+    
+    async def update_node_status(
+        self,
+        results: List[HealthCheckResult],
+        session: Optional[aiohttp.ClientSession] = None
+    ) -> Tuple[int, int]:
+        """
+        更新节点状态到 Supabase
+        
+        同一批次的请求并发发送；传入 session 时复用调用方的连接池
+        """
+        if not self.supabase_url or not self.supabase_key:
+            return 0, len(results)
+        
+        if session is None:
+            async with aiohttp.ClientSession() as own_session:
+                return await self.update_node_status(results, own_session)
+        
+        outcomes = await asyncio.gather(*(self._update_one(session, r) for r in results))
+        success_count = sum(1 for ok in outcomes if ok)
+        return success_count, len(results) - success_count
+
+
+# ==================== 检测流水线 ====================
+
+class HealthCheckPipeline:
+    """
+    健康检测流水线：检测 → 聚合 → 写入
+    
+    - 检测阶段：check_nodes 按完成顺序产出结果
+    - 聚合阶段：实时更新 HealthCheckStats，可通过 on_progress 回调观察
+    - 写入阶段：独立任务从有界队列取结果，按 write_batch_size 或 flush_interval 微批写入
+    
+    检测与写入并行，总耗时接近 max(检测耗时, 写入耗时)。
+    """
+    
+    def __init__(
+        self,
+        checker: LightweightHealthChecker,
+        updater: SupabaseHealthUpdater,
+        write_batch_size: int = 50,
+        flush_interval: float = 1.0,
+        queue_size: int = 500,
+        history=None
+    ):
+        self.checker = checker
+        self.updater = updater
+        self.history = history
+        self.write_batch_size = write_batch_size
+        self.flush_interval = flush_interval
+        self.queue_size = queue_size
+    
+    async def _writer(self, queue: asyncio.Queue, stats: HealthCheckStats):
+        """写入阶段：微批写入 Supabase"""
+        loop = asyncio.get_event_loop()
+        done = False
         
         async with aiohttp.ClientSession() as session:
-            for result in results:
-                if not result.node_id:
-                    fail_count += 1
-                    continue
+            while not done:
+                batch: List[HealthCheckResult] = []
+                item = await queue.get()
+                if item is None:
+                    break
+                batch.append(item)
                 
-                try:
-                    url = f"{self.supabase_url}/rest/v1/nodes?id=eq.{result.node_id}"
-                    
-                    update_data = {
-                        "status": result.status.value,
-                        "last_health_check": result.checked_at,
-                        "health_latency": result.latency_ms
-                    }
-                    
-                    async with session.patch(url, json=update_data, headers=headers, timeout=aiohttp.ClientTimeout(total=5)) as resp:
-                        if resp.status in [200, 204]:
-                            success_count += 1
-                        else:
-                            fail_count += 1
-                            
-                except Exception as e:
-                    fail_count += 1
-        
-        return success_count, fail_count
+                deadline = loop.time() + self.flush_interval
+                while len(batch) < self.write_batch_size:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(queue.get(), timeout=remaining)
+                    except asyncio.TimeoutError:
+                        break
+                    if item is None:
+                        done = True
+                        break
+                    batch.append(item)
+                
+                success, fail = await self.updater.update_node_status(batch, session)
+                stats.update_success += success
+                stats.update_fail += fail
+    
+    async def run(
+        self,
+        nodes: List[Dict],
+        on_progress: Optional[Callable[[HealthCheckStats], None]] = None,
+        cached_results: Optional[List[HealthCheckResult]] = None
+    ) -> HealthCheckStats:
+        """
+        执行一次完整的检测流水线
+        
+        cached_results 为新鲜度窗口内跳过的节点的上次结果，只计入统计，不探测也不写入
+        """
+        cached_results = cached_results or []
+        stats = HealthCheckStats(total=len(nodes) + len(cached_results))
+        for result in cached_results:
+            stats.record(result)
+        write_queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        writer = asyncio.create_task(self._writer(write_queue, stats))
+        
+        try:
+            async for result in self.checker.iter_check_nodes(nodes, stats=stats):
+                stats.record(result)
+                if self.checker.limiter:
+                    stats.concurrency = self.checker.limiter.snapshot()
+                if on_progress:
+                    on_progress(stats)
+                # 未实际探测的节点保留数据库中的原状态
+                if result.error_kind != ProbeErrorKind.DEADLINE:
+                    if self.history is not None:
+                        self.history.record(result.node_id, result.status.value, result.latency_ms)
+                    await write_queue.put(result)
+            await write_queue.put(None)
+            await writer
+        finally:
+            if not writer.done():
+                writer.cancel()
+                await asyncio.gather(writer, return_exceptions=True)
+        
+        if on_progress:
+            on_progress(stats)
+        return stats
@@ -0,0 +1,280 @@
+"""
+节点健康历史 - 每节点固定容量的环形缓冲区与稳定性指标
+"""
+
+import asyncio
+import base64
+import json
+import os
+import statistics
+import time
+from array import array
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from ..config import config
+from ..core.logger import logger
+
+# 状态编码（array('b') 存储）
+STATUS_CODES = {
+    "offline": 0,
+    "online": 1,
+    "suspect": 2,
+    "unknown": 3
+}
+
+STATUS_NAMES = {code: name for name, code in STATUS_CODES.items()}
+
+# 延迟缺失时的占位值
+NO_LATENCY = -1
+
+
+class NodeHistory:
+    """
+    单个节点的环形缓冲区
+
+    三个定长 array 分别保存时间戳（double）、延迟（int）和状态码（byte），
+    每条记录约 13 字节，容量固定，内存不随检测次数增长。
+    """
+
+    __slots__ = ("capacity", "timestamps", "latencies", "statuses", "index", "count")
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.timestamps = array("d", [0.0]) * capacity
+        self.latencies = array("i", [NO_LATENCY]) * capacity
+        self.statuses = array("b", [0]) * capacity
+        self.index = 0
+        self.count = 0
+
+    def append(self, timestamp: float, latency: Optional[int], status_code: int):
+        self.timestamps[self.index] = timestamp
+        self.latencies[self.index] = latency if latency is not None else NO_LATENCY
+        self.statuses[self.index] = status_code
+        self.index = (self.index + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def samples(self) -> Iterator[Tuple[float, int, int]]:
+        """按时间顺序遍历 (时间戳, 延迟, 状态码)"""
+        start = (self.index - self.count) % self.capacity
+        for i in range(self.count):
+            pos = (start + i) % self.capacity
+            yield self.timestamps[pos], self.latencies[pos], self.statuses[pos]
+
+    def latest(self) -> Optional[Tuple[float, Optional[int], str]]:
+        """最近一次记录 (时间戳, 延迟, 状态)"""
+        if self.count == 0:
+            return None
+        pos = (self.index - 1) % self.capacity
+        latency = self.latencies[pos]
+        return (
+            self.timestamps[pos],
+            None if latency == NO_LATENCY else latency,
+            STATUS_NAMES.get(self.statuses[pos], "unknown")
+        )
+
+    def metrics(self) -> Dict:
+        """派生指标：可用率、p50/p95 延迟、抖动、状态翻转次数"""
+        statuses: List[int] = []
+        latencies: List[int] = []
+        last_ts = 0.0
+        for ts, latency, status in self.samples():
+            statuses.append(status)
+            if latency != NO_LATENCY and status == STATUS_CODES["online"]:
+                latencies.append(latency)
+            last_ts = ts
+
+        online = sum(1 for s in statuses if s == STATUS_CODES["online"])
+        flaps = sum(1 for a, b in zip(statuses, statuses[1:]) if a != b)
+
+        p50 = p95 = jitter = None
+        if latencies:
+            ordered = sorted(latencies)
+            p50 = ordered[int(0.5 * (len(ordered) - 1))]
+            p95 = ordered[int(round(0.95 * (len(ordered) - 1)))]
+            if len(latencies) > 1:
+                # 相邻两次延迟差的平均值（RFC 3550 风格的抖动近似）
+                jitter = round(statistics.mean(abs(a - b) for a, b in zip(latencies, latencies[1:])), 1)
+
+        return {
+            "samples": len(statuses),
+            "uptime": round(online / len(statuses) * 100, 1) if statuses else None,
+            "p50_latency": p50,
+            "p95_latency": p95,
+            "jitter": jitter,
+            "flaps": flaps,
+            "last_checked": last_ts or None
+        }
+
+    # ==================== 序列化 ====================
+
+    def raw(self) -> Tuple[int, int, bytes, bytes, bytes]:
+        """当前内容的字节拷贝（index, count, 时间戳, 延迟, 状态码），供持久化时在线程中编码"""
+        return self.index, self.count, self.timestamps.tobytes(), self.latencies.tobytes(), self.statuses.tobytes()
+
+    @staticmethod
+    def encode_raw(raw: Tuple[int, int, bytes, bytes, bytes]) -> Dict:
+        index, count, timestamps, latencies, statuses = raw
+        return {
+            "index": index,
+            "count": count,
+            "timestamps": base64.b64encode(timestamps).decode(),
+            "latencies": base64.b64encode(latencies).decode(),
+            "statuses": base64.b64encode(statuses).decode()
+        }
+
+    def to_dict(self) -> Dict:
+        return self.encode_raw(self.raw())
+
+    @classmethod
+    def from_dict(cls, data: Dict, capacity: int) -> "NodeHistory":
+        history = cls(capacity)
+        timestamps = array("d")
+        timestamps.frombytes(base64.b64decode(data["timestamps"]))
+        latencies = array("i")
+        latencies.frombytes(base64.b64decode(data["latencies"]))
+        statuses = array("b")
+        statuses.frombytes(base64.b64decode(data["statuses"]))
+
+        if len(timestamps) == capacity:
+            history.timestamps, history.latencies, history.statuses = timestamps, latencies, statuses
+            history.index = data["index"]
+            history.count = data["count"]
+        else:
+            # 容量配置变化时按时间顺序重放
+            stored = cls(len(timestamps))
+            stored.timestamps, stored.latencies, stored.statuses = timestamps, latencies, statuses
+            stored.index, stored.count = data["index"], data["count"]
+            for ts, latency, status in stored.samples():
+                history.append(ts, None if latency == NO_LATENCY else latency, status)
+        return history
+
+
+class HealthHistoryStore:
+    """
+    全部节点的健康历史
+
+    - 每节点容量 capacity 条，节点数上限 max_nodes（超出时淘汰最久未更新的节点）
+    - path 非空时支持持久化到 JSON 文件（启动加载、关闭/定时保存）
+    - 节点 ID 统一按 str 存取（数据库返回的 ID 与检测结果中的 ID 类型可能不同）
+    """
+
+    def __init__(self, capacity: int = 32, max_nodes: int = 20000, path: str = ""):
+        self.capacity = capacity
+        self.max_nodes = max_nodes
+        self.path = path
+        self._nodes: "OrderedDict[str, NodeHistory]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    def record(self, node_id: str, status: str, latency: Optional[int], timestamp: Optional[float] = None):
+        """追加一条检测记录"""
+        if node_id is None or node_id == "":
+            return
+        node_id = str(node_id)
+        history = self._nodes.get(node_id)
+        if history is None:
+            history = NodeHistory(self.capacity)
+            self._nodes[node_id] = history
+            if len(self._nodes) > self.max_nodes:
+                self._nodes.popitem(last=False)
+        else:
+            self._nodes.move_to_end(node_id)
+        history.append(
+            timestamp or time.time(),
+            latency,
+            STATUS_CODES.get(status, STATUS_CODES["unknown"])
+        )
+
+    def latest(self, node_id: str) -> Optional[Tuple[float, Optional[int], str]]:
+        """节点最近一次检测结果（用于新鲜度判断）"""
+        history = self._nodes.get(str(node_id))
+        return history.latest() if history is not None else None
+
+    def metrics(self, node_id: str) -> Optional[Dict]:
+        history = self._nodes.get(str(node_id))
+        if history is None or history.count == 0:
+            return None
+        return history.metrics()
+
+    @staticmethod
+    def score(metrics: Optional[Dict]) -> Optional[float]:
+        """
+        排名分数（0-100）：可用率占 70%，p95 延迟占 20%，抖动占 10%
+        无历史时返回 None
+        """
+        if not metrics or metrics.get("uptime") is None:
+            return None
+        p95 = metrics.get("p95_latency")
+        latency_score = max(0.0, 100 - p95 / 20) if p95 is not None else 0.0
+        jitter = metrics.get("jitter")
+        jitter_score = max(0.0, 100 - jitter / 5) if jitter is not None else 50.0
+        return round(metrics["uptime"] * 0.7 + latency_score * 0.2 + jitter_score * 0.1, 1)
+
+    def annotate(self, nodes: List[Dict], rank: bool = True) -> List[Dict]:
+        """
+        给节点附加 health_metrics / health_score，并按分数稳定排序
+
+        没有历史的节点两个字段为 None，按中性分数 50 参与排序，保持原有相对顺序
+        """
+        for node in nodes:
+            metrics = self.metrics(node.get("id", "")) if self._nodes else None
+            node["health_metrics"] = metrics
+            node["health_score"] = self.score(metrics)
+        if rank and self._nodes:
+            nodes.sort(key=lambda n: -(n["health_score"] if n["health_score"] is not None else 50.0))
+        return nodes
+
+    # ==================== 持久化 ====================
+
+    async def save(self):
+        """
+        保存到 path（未配置时跳过）
+
+        事件循环中只复制各节点的原始字节（检测结果会并发写入 _nodes），
+        编码、JSON 序列化和写文件在线程中执行，目录较大时不阻塞请求
+        """
+        if not self.path:
+            return
+        try:
+            snapshot = {node_id: h.raw() for node_id, h in self._nodes.items()}
+            await asyncio.to_thread(self._write, self.path, self.capacity, snapshot)
+            logger.info(f"💾 健康历史已保存: {len(self._nodes)} 个节点")
+        except Exception as e:
+            logger.warning(f"⚠️  保存健康历史失败: {e}")
+
+    @staticmethod
+    def _write(path: str, capacity: int, snapshot: Dict[str, Tuple]):
+        data = {
+            "capacity": capacity,
+            "nodes": {node_id: NodeHistory.encode_raw(raw) for node_id, raw in snapshot.items()}
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def load(self):
+        """从 path 加载（文件不存在时跳过）"""
+        if not self.path or not os.path.isfile(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            for node_id, item in data.get("nodes", {}).items():
+                self._nodes[node_id] = NodeHistory.from_dict(item, self.capacity)
+            while len(self._nodes) > self.max_nodes:
+                self._nodes.popitem(last=False)
+            logger.info(f"📂 健康历史已加载: {len(self._nodes)} 个节点")
+        except Exception as e:
+            logger.warning(f"⚠️  加载健康历史失败: {e}")
+
+
+# ==================== 全局实例 ====================
+
+health_history = HealthHistoryStore(
+    capacity=config.HEALTH_HISTORY_CAPACITY,
+    max_nodes=config.HEALTH_HISTORY_MAX_NODES,
+    path=config.HEALTH_HISTORY_PATH
+)
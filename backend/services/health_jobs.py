@@ -0,0 +1,248 @@
+"""
+健康检测任务 - 异步执行、进度查询、取消和去重
+"""
+
+import asyncio
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from enum import Enum
+from typing import Any, Dict, Optional, Tuple
+
+from ..config import config
+from ..core.logger import logger
+from .node_service import NodeService
+
+# ==================== 任务模型 ====================
+
+class JobStatus(str, Enum):
+    """任务状态枚举"""
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+ACTIVE_STATUSES = (JobStatus.QUEUED, JobStatus.RUNNING)
+
+
+class JobQueueFullError(Exception):
+    """排队任务已达上限"""
+
+
+@dataclass
+class HealthCheckJob:
+    """单个健康检测任务"""
+    id: str
+    source: str
+    batch_size: int
+    requested_by: Optional[str] = None
+    force: bool = False
+    status: JobStatus = JobStatus.QUEUED
+    created_at: str = ""
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    stats: Optional[Any] = field(default=None, repr=False)
+    result: Optional[Dict] = None
+    error: Optional[str] = None
+    task: Optional[asyncio.Task] = field(default=None, repr=False)
+
+    @property
+    def active(self) -> bool:
+        return self.status in ACTIVE_STATUSES
+
+    def to_dict(self) -> Dict:
+        """转换为 API 返回格式"""
+        return {
+            "job_id": self.id,
+            "source": self.source,
+            "batch_size": self.batch_size,
+            "force": self.force,
+            "status": self.status.value,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            # 查询时才汇总统计，检测过程中每个结果只更新引用
+            "progress": self.stats.to_dict() if self.stats is not None else {},
+            "result": self.result,
+            "error": self.error
+        }
+
+
+# ==================== 任务管理器 ====================
+
+class HealthCheckJobManager:
+    """
+    健康检测任务管理器
+
+    - 提交后立即返回任务 ID，任务进入有界队列
+    - 最多 max_running 个任务同时执行
+    - 同一数据源、batch_size 和 force 的任务已在排队/执行中时，直接返回该任务（去重）；
+      参数不同（如 force=True）的请求单独排队，不会被并入已有任务
+    - 排队上限只计仍在排队的任务，排队中被取消的任务不占名额
+    - 已结束的任务保留最近 max_history 个，供结果查询
+    """
+
+    def __init__(
+        self,
+        node_service: Optional[NodeService] = None,
+        max_running: int = 1,
+        max_queued: int = 10,
+        max_history: int = 50
+    ):
+        self.node_service = node_service or NodeService()
+        self.max_running = max_running
+        self.max_queued = max_queued
+        self.max_history = max_history
+
+        self._jobs: "OrderedDict[str, HealthCheckJob]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers = []
+        self._closing = False
+
+    def _ensure_workers(self):
+        """首次提交时启动 worker（需要运行中的事件循环）"""
+        if self._queue is None:
+            # 不设 maxsize：排队上限按仍在排队的任务数判断（被取消的任务留在队列中，worker 取出时跳过）
+            self._queue = asyncio.Queue()
+        self._workers = [w for w in self._workers if not w.done()]
+        while len(self._workers) < self.max_running:
+            self._workers.append(asyncio.create_task(self._worker()))
+
+    async def submit(
+        self,
+        source: str,
+        batch_size: int,
+        requested_by: Optional[str] = None,
+        force: bool = False
+    ) -> Tuple[HealthCheckJob, bool]:
+        """
+        提交健康检测任务
+
+        Returns:
+            (任务, 是否新建)；去重命中时返回已有任务和 False
+
+        Raises:
+            JobQueueFullError: 排队任务已满
+        """
+        for job in self._jobs.values():
+            if job.active and (job.source, job.batch_size, job.force) == (source, batch_size, force):
+                logger.info(f"🔁 健康检测任务去重: source={source}, batch_size={batch_size}, force={force} → {job.id}")
+                return job, False
+
+        queued = sum(1 for job in self._jobs.values() if job.status == JobStatus.QUEUED)
+        if queued >= self.max_queued:
+            raise JobQueueFullError(f"健康检测任务排队已满（{self.max_queued}）")
+
+        self._ensure_workers()
+
+        job = HealthCheckJob(
+            id=uuid.uuid4().hex[:12],
+            source=source,
+            batch_size=batch_size,
+            requested_by=requested_by,
+            force=force,
+            created_at=datetime.now().isoformat()
+        )
+        self._queue.put_nowait(job)
+        self._jobs[job.id] = job
+        self._trim_history()
+        logger.info(f"📝 健康检测任务已排队: {job.id} (source={source}, batch_size={batch_size}, force={force})")
+        return job, True
+
+    def get(self, job_id: str) -> Optional[HealthCheckJob]:
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[HealthCheckJob]:
+        """取消任务：排队中直接标记，执行中取消其协程"""
+        job = self._jobs.get(job_id)
+        if job is None or not job.active:
+            return job
+
+        if job.status == JobStatus.QUEUED:
+            job.status = JobStatus.CANCELLED
+            job.finished_at = datetime.now().isoformat()
+        elif job.task is not None:
+            job.task.cancel()
+        logger.info(f"🛑 健康检测任务已取消: {job.id}")
+        return job
+
+    async def shutdown(self):
+        """停止所有 worker 和执行中的任务"""
+        self._closing = True
+        for job in self._jobs.values():
+            if job.active:
+                self.cancel(job.id)
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._closing = False
+
+    def _trim_history(self):
+        finished = [job_id for job_id, job in self._jobs.items() if not job.active]
+        for job_id in finished[:max(0, len(finished) - self.max_history)]:
+            del self._jobs[job_id]
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            if job.status != JobStatus.QUEUED:
+                # 排队期间已被取消
+                continue
+            task = asyncio.create_task(self._run(job))
+            job.task = task
+            try:
+                await asyncio.shield(task)
+            except asyncio.CancelledError:
+                # worker 自身被取消（应用关闭）；任务与 worker 同时被取消时任务可能已结束，
+                # 仅凭 task.done() 会把 worker 的取消当作任务的取消吞掉，关闭时一直等待
+                if self._closing or not task.done():
+                    if not task.done():
+                        task.cancel()
+                    raise
+            finally:
+                self._trim_history()
+
+    async def _run(self, job: HealthCheckJob):
+        if job.status != JobStatus.QUEUED:
+            return
+        job.status = JobStatus.RUNNING
+        job.started_at = datetime.now().isoformat()
+
+        def on_progress(stats):
+            job.stats = stats
+
+        try:
+            result = await self.node_service.health_check_source(
+                job.source,
+                job.batch_size,
+                on_progress=on_progress,
+                force=job.force
+            )
+            if result.get("status") == "error":
+                job.status = JobStatus.FAILED
+                job.error = result.get("message")
+            else:
+                job.status = JobStatus.COMPLETED
+            job.result = result
+        except asyncio.CancelledError:
+            job.status = JobStatus.CANCELLED
+        except Exception as e:
+            logger.error(f"❌ 健康检测任务失败: {job.id} ({e})")
+            job.status = JobStatus.FAILED
+            job.error = str(e)
+        finally:
+            job.finished_at = datetime.now().isoformat()
+            job.task = None
+
+
+# ==================== 全局任务管理器 ====================
+
+health_jobs = HealthCheckJobManager(
+    max_running=config.HEALTH_JOB_MAX_RUNNING,
+    max_queued=config.HEALTH_JOB_MAX_QUEUED,
+    max_history=config.HEALTH_JOB_HISTORY
+)
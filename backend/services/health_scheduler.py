@@ -0,0 +1,188 @@
+"""
+滚动健康检测调度 - 按陈旧度优先、限速地持续检测全部节点
+"""
+
+import heapq
+import itertools
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from ..config import config
+from ..core.logger import logger
+from .node_service import NodeService
+from .health_checker import parse_check_time
+from .health_history import health_history
+
+# 数据源 → 写回的表
+SOURCE_TABLES = {
+    "overseas": "nodes",
+    "china": "telegram_nodes"
+}
+
+
+class RollingHealthScheduler:
+    """
+    滚动健康检测调度器
+
+    - 优先队列（小顶堆）按有效检测时间排序：越久未检测越靠前，
+      suspect 节点的检测时间再提前 suspect_boost 秒，优先复查但不会饿死其他节点
+    - 每次 tick 按 probes_per_second * tick_seconds 取出一片节点检测，控制探测速率
+    - 只有得到新检测结果的节点按结果重新排队；被批次截止时间跳过或没有结果的节点
+      保留原检测时间和状态，下次 tick 仍排在前面
+    - 目录每 refresh_minutes 从 Supabase 分页重新加载一次（两张表的全部节点，不受 max-rows 截断）
+    - 目录规模 / 速率 超过 SLA 时输出告警，提示需要的速率
+    """
+
+    def __init__(
+        self,
+        node_service: Optional[NodeService] = None,
+        probes_per_second: float = 2.0,
+        tick_seconds: int = 30,
+        sla_minutes: int = 120,
+        refresh_minutes: int = 12
+    ):
+        self.node_service = node_service or NodeService()
+        self.probes_per_second = probes_per_second
+        self.tick_seconds = tick_seconds
+        self.sla_seconds = sla_minutes * 60
+        self.refresh_seconds = refresh_minutes * 60
+        self.suspect_boost = self.sla_seconds / 2
+
+        # (优先级, 序号, 数据源, 节点, 检测时间, 状态)
+        self._heap: List[Tuple[float, int, str, Dict, float, str]] = []
+        self._counter = itertools.count()
+        self._refreshed_at = 0.0
+
+        self.ticks = 0
+        self.checked_total = 0
+        self.last_tick_at: Optional[str] = None
+        self.last_tick_result: Dict = {}
+
+    @property
+    def slice_size(self) -> int:
+        """每次 tick 检测的节点数"""
+        return max(1, int(self.probes_per_second * self.tick_seconds))
+
+    def _priority(self, checked_ts: float, status: str) -> float:
+        if status == "suspect":
+            return checked_ts - self.suspect_boost
+        return checked_ts
+
+    def _push(self, source: str, node: Dict, checked_ts: float, status: str):
+        heapq.heappush(
+            self._heap,
+            (self._priority(checked_ts, status), next(self._counter), source, node, checked_ts, status)
+        )
+
+    async def refresh_catalogue(self):
+        """从 Supabase 分页重新加载两张表的全部节点，重建优先队列；加载失败时沿用旧队列"""
+        try:
+            overseas = await self.node_service.fetch_all_nodes()
+            china = await self.node_service.fetch_all_telegram_nodes()
+        except Exception as e:
+            logger.error(f"❌ 滚动健康检测目录刷新失败，沿用当前 {len(self._heap)} 个节点: {e}")
+            return
+
+        self._heap = []
+        for source, nodes in (("overseas", overseas), ("china", china)):
+            for node in nodes:
+                if not node.get("id"):
+                    continue
+                self._push(
+                    source,
+                    node,
+                    parse_check_time(node.get("last_health_check")),
+                    node.get("status", "unknown")
+                )
+        self._refreshed_at = time.monotonic()
+
+        size = len(self._heap)
+        cycle_seconds = size / self.probes_per_second if self.probes_per_second > 0 else float("inf")
+        logger.info(f"🗂️  滚动健康检测目录已刷新: {size} 个节点，完整一轮约 {cycle_seconds / 60:.1f} 分钟")
+        if cycle_seconds > self.sla_seconds:
+            needed = size / self.sla_seconds
+            logger.warning(
+                f"⚠️  按当前速率 {self.probes_per_second}/s 无法在 {self.sla_seconds // 60} 分钟内复查全部节点，"
+                f"需要约 {needed:.1f}/s"
+            )
+
+    def _take_slice(self) -> Dict[str, List[Tuple[Dict, float, str]]]:
+        """取出最陈旧的一片节点，按数据源分组：(节点, 检测时间, 状态)"""
+        picked: Dict[str, List[Tuple[Dict, float, str]]] = {}
+        for _ in range(min(self.slice_size, len(self._heap))):
+            _, _, source, node, checked_ts, status = heapq.heappop(self._heap)
+            picked.setdefault(source, []).append((node, checked_ts, status))
+        return picked
+
+    async def tick(self):
+        """调度器定时调用：检测一片节点并放回队列"""
+        try:
+            if not self._heap or time.monotonic() - self._refreshed_at > self.refresh_seconds:
+                await self.refresh_catalogue()
+            if not self._heap:
+                return
+
+            picked = self._take_slice()
+            summary = {}
+
+            for source, entries in picked.items():
+                nodes = [node for node, _, _ in entries]
+                try:
+                    result = await self.node_service.health_check_nodes(
+                        nodes,
+                        table=SOURCE_TABLES[source]
+                    )
+                finally:
+                    # 检测结果由流水线写入健康历史；没有更新的结果时保留原检测时间和状态
+                    for node, checked_ts, status in entries:
+                        latest = health_history.latest(str(node.get("id")))
+                        if latest and latest[0] > checked_ts:
+                            checked_ts, _, status = latest
+                        self._push(source, node, checked_ts, status)
+
+                summary[source] = {
+                    "checked": len(nodes),
+                    "online": result.get("online", 0),
+                    "offline": result.get("offline", 0),
+                    "suspect": result.get("suspect", 0)
+                }
+                self.checked_total += len(nodes)
+
+            self.ticks += 1
+            self.last_tick_at = datetime.now().isoformat()
+            self.last_tick_result = summary
+            logger.info(f"🔄 滚动健康检测: {summary}")
+
+        except Exception as e:
+            logger.warning(f"⚠️  滚动健康检测失败: {e}")
+
+    def snapshot(self) -> Dict:
+        """调度状态"""
+        # 队首节点的有效陈旧度（从未检测过的节点为 None）
+        next_staleness = None
+        if self._heap and self._heap[0][0] > 0:
+            next_staleness = int(time.time() - self._heap[0][0])
+        size = len(self._heap)
+        return {
+            "catalogue_size": size,
+            "probes_per_second": self.probes_per_second,
+            "slice_size": self.slice_size,
+            "cycle_minutes": round(size / self.probes_per_second / 60, 1) if self.probes_per_second > 0 else None,
+            "sla_minutes": self.sla_seconds // 60,
+            "next_staleness_seconds": next_staleness,
+            "ticks": self.ticks,
+            "checked_total": self.checked_total,
+            "last_tick_at": self.last_tick_at,
+            "last_tick_result": self.last_tick_result
+        }
+
+
+# ==================== 全局调度器 ====================
+
+health_scheduler = RollingHealthScheduler(
+    probes_per_second=config.HEALTH_SCHEDULER_PROBES_PER_SECOND,
+    tick_seconds=config.HEALTH_SCHEDULER_TICK_SECONDS,
+    sla_minutes=config.HEALTH_SCHEDULER_SLA_MINUTES,
+    refresh_minutes=config.SUPABASE_PULL_INTERVAL_MINUTES
+)
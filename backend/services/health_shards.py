@@ -0,0 +1,229 @@
+"""
+分片健康检测 - 按一致性哈希把节点分配到多个进程并行检测，合并后统一写入
+
+命令行用法（在 API 进程之外运行）:
+    python -m backend.services.health_shards --source overseas --shards 4
+"""
+
+import argparse
+import asyncio
+import bisect
+import hashlib
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import aiohttp
+
+from ..config import config
+from ..core.logger import logger
+from ..core.loop_monitor import install_event_loop_policy
+from .health_checker import (
+    HealthCheckResult,
+    HealthCheckStats,
+    SupabaseHealthUpdater,
+    ProbeErrorKind
+)
+
+
+# ==================== 一致性哈希 ====================
+
+class HashRing:
+    """
+    一致性哈希环（带虚拟节点）
+
+    以 host:port 作为键，同一端点的节点总是落在同一分片，
+    分片内的端点去重依然有效；分片数变化时只有少量节点迁移。
+    """
+
+    def __init__(self, shards: int, replicas: int = 64):
+        self.shards = shards
+        self._ring: List[Tuple[int, int]] = sorted(
+            (self._hash(f"shard-{shard}-{replica}"), shard)
+            for shard in range(shards)
+            for replica in range(replicas)
+        )
+        self._keys = [h for h, _ in self._ring]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+    def shard_for(self, key: str) -> int:
+        pos = bisect.bisect(self._keys, self._hash(key)) % len(self._ring)
+        return self._ring[pos][1]
+
+    def partition(self, nodes: List[Dict]) -> List[List[Dict]]:
+        """把节点分配到各分片"""
+        parts: List[List[Dict]] = [[] for _ in range(self.shards)]
+        for node in nodes:
+            key = f"{node.get('host', '')}:{node.get('port', 0)}"
+            parts[self.shard_for(key)].append(node)
+        return parts
+
+
+# ==================== 分片进程 ====================
+
+def _check_shard(shard: int, nodes: List[Dict], batch_deadline: Optional[float]) -> Tuple[int, List[HealthCheckResult], HealthCheckStats]:
+    """
+    在子进程中运行：独立事件循环 + 独立限流器检测一个分片
+
+    Returns:
+        (分片编号, 检测结果, 分片统计（探测数、去重节省数、限流器快照）)
+    """
+    from .health_checker import LightweightHealthChecker, RetryPolicy
+    from .concurrency import AdaptiveLimiter
+
+    async def run() -> Tuple[List[HealthCheckResult], HealthCheckStats]:
+        limiter = AdaptiveLimiter(
+            initial=config.HEALTH_CHECK_INITIAL_CONCURRENCY,
+            min_limit=config.HEALTH_CHECK_MIN_CONCURRENCY,
+            max_limit=config.HEALTH_CHECK_MAX_CONCURRENCY
+        )
+        checker = LightweightHealthChecker(
+            tcp_timeout=5.0,
+            http_timeout=8.0,
+            limiter=limiter,
+            retry_policy=RetryPolicy(
+                max_retries=config.HEALTH_CHECK_MAX_RETRIES,
+                node_deadline=config.HEALTH_CHECK_NODE_DEADLINE_SECONDS
+            ),
+            batch_deadline=batch_deadline,
+            tcp_engine=config.HEALTH_CHECK_TCP_ENGINE
+        )
+        stats = HealthCheckStats(total=len(nodes))
+        async with checker:
+            results = await checker.check_nodes_batch(nodes, stats=stats)
+        stats.concurrency = limiter.snapshot()
+        return results, stats
+
+    install_event_loop_policy()
+    results, stats = asyncio.run(run())
+    return shard, results, stats
+
+
+class ShardedHealthRunner:
+    """
+    多进程分片健康检测
+
+    - 节点按 host:port 一致性哈希分到 shards 个子进程
+    - 每个子进程运行自己的事件循环和 LightweightHealthChecker，互不争抢 socket 和 CPU
+    - 结果回到父进程合并统计，再统一批量写回 Supabase（dry_run 时跳过写入）
+    """
+
+    def __init__(
+        self,
+        shards: Optional[int] = None,
+        table: str = "nodes",
+        batch_deadline: Optional[float] = None,
+        write_batch_size: int = 200,
+        dry_run: bool = False
+    ):
+        self.shards = max(1, shards or config.HEALTH_SHARD_COUNT or os.cpu_count() or 1)
+        self.table = table
+        self.batch_deadline = batch_deadline
+        self.write_batch_size = write_batch_size
+        self.dry_run = dry_run
+
+    async def run(self, nodes: List[Dict]) -> Tuple[List[HealthCheckResult], HealthCheckStats]:
+        """检测全部节点，返回 (结果, 合并后的统计)"""
+        stats = HealthCheckStats(total=len(nodes))
+        parts = [part for part in enumerate(HashRing(self.shards).partition(nodes)) if part[1]]
+        logger.info(f"🧩 分片健康检测: {len(nodes)} 个节点 → {len(parts)} 个进程 {[len(p) for _, p in parts]}")
+
+        loop = asyncio.get_event_loop()
+        # spawn：子进程不继承父进程的事件循环和连接
+        context = multiprocessing.get_context("spawn")
+        results: List[HealthCheckResult] = []
+        with ProcessPoolExecutor(max_workers=len(parts) or 1, mp_context=context) as pool:
+            futures = [
+                loop.run_in_executor(pool, _check_shard, shard, part, self.batch_deadline)
+                for shard, part in parts
+            ]
+            shard_concurrency = {}
+            for future in asyncio.as_completed(futures):
+                shard, shard_results, shard_stats = await future
+                shard_concurrency[shard] = shard_stats.concurrency
+                stats.probes += shard_stats.probes
+                stats.probes_saved += shard_stats.probes_saved
+                results.extend(shard_results)
+                logger.info(f"✅ 分片 {shard} 完成: {len(shard_results)} 个节点")
+
+        for result in results:
+            stats.record(result)
+        stats.concurrency = {"shards": shard_concurrency}
+
+        if not self.dry_run:
+            await self._write(results, stats)
+        return results, stats
+
+    async def _write(self, results: List[HealthCheckResult], stats: HealthCheckStats):
+        """合并后统一写回（跳过未实际探测的节点）"""
+        updater = SupabaseHealthUpdater(
+            supabase_url=config.SUPABASE_URL,
+            supabase_key=config.SUPABASE_KEY,
+            table=self.table,
+            persist_timings=config.HEALTH_PERSIST_TIMINGS
+        )
+        to_write = [r for r in results if r.error_kind != ProbeErrorKind.DEADLINE]
+        async with aiohttp.ClientSession() as session:
+            for i in range(0, len(to_write), self.write_batch_size):
+                success, fail = await updater.update_node_status(
+                    to_write[i:i + self.write_batch_size],
+                    session
+                )
+                stats.update_success += success
+                stats.update_fail += fail
+
+
+# ==================== 命令行入口 ====================
+
+async def _main(args: argparse.Namespace):
+    from .node_service import NodeService
+
+    node_service = NodeService()
+    # 分页读取整张表（get_nodes 的 limit 会被 PostgREST max-rows 截断），--limit 在分页之后截取
+    if args.source == "china":
+        nodes = await node_service.fetch_all_telegram_nodes()
+        table = "telegram_nodes"
+    else:
+        nodes = await node_service.fetch_all_nodes()
+        table = "nodes"
+    if args.limit > 0:
+        nodes = nodes[:args.limit]
+
+    if not nodes:
+        logger.warning("⚠️  没有可检测的节点")
+        return
+
+    runner = ShardedHealthRunner(
+        shards=args.shards,
+        table=table,
+        batch_deadline=args.deadline,
+        dry_run=args.dry_run
+    )
+    start = time.monotonic()
+    _, stats = await runner.run(nodes)
+    elapsed = time.monotonic() - start
+
+    logger.info(f"📊 检测结果: 在线={stats.online}, 离线={stats.offline}, 可疑={stats.suspect}, 未检测={stats.unknown}")
+    logger.info(f"⏱️  分阶段耗时: {stats.timing_summary()}")
+    logger.info(f"✅ 数据库更新: 成功={stats.update_success}, 失败={stats.update_fail}")
+    logger.info(f"⏱️  总耗时 {elapsed:.1f}s（{stats.total / elapsed if elapsed else 0:.0f} 节点/秒）")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="viper-node-store 分片健康检测")
+    parser.add_argument("--source", choices=["overseas", "china"], default="overseas", help="数据源")
+    parser.add_argument("--limit", type=int, default=0, help="最多检测的节点数量（0 表示全部）")
+    parser.add_argument("--shards", type=int, default=None, help="进程数（默认 CPU 核数）")
+    parser.add_argument("--deadline", type=float, default=config.HEALTH_CHECK_BATCH_DEADLINE_SECONDS, help="每个分片的时间预算（秒）")
+    parser.add_argument("--dry-run", action="store_true", help="只检测不写回数据库")
+    install_event_loop_policy()
+    asyncio.run(_main(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+Webhook 入库队列 - 有界队列、worker 池、背压与指标
+"""
+
+import asyncio
+import math
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from ..config import config
+from ..core.logger import logger
+from .node_ingest import NodeIngestor, node_ingestor
+
+
+class IngestQueueFullError(Exception):
+    """入库队列已满"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@dataclass
+class IngestItem:
+    """一次排队中的推送"""
+    nodes: List[Any] = field(repr=False)
+    enqueued_at: float = 0.0
+    snapshot_ts: Optional[float] = None
+    on_failed: Optional[Callable[[], None]] = field(default=None, repr=False)
+
+
+class IngestQueue:
+    """
+    Webhook 推送入库队列
+
+    - 有界：排队推送数不超过 max_queued，排队节点总数不超过 max_nodes（限制内存）；
+      超出时抛出 IngestQueueFullError，接收端返回 429 + Retry-After
+    - workers 个 worker 依次取出推送交给 NodeIngestor（写入失败的重试在 NodeIngestor 内完成）；
+      NodeIngestor 对全量快照串行入库并丢弃乱序的旧快照，默认 1 个 worker 即可
+    - 入库抛出异常或有节点写入失败时调用推送的 on_failed（接收端借此撤销重放记录，让重试能重新入库）
+    - 指标：队列深度、排队节点数、最近 window 次推送的排队等待与处理耗时 p50/p95
+    """
+
+    def __init__(
+        self,
+        ingestor: Optional[NodeIngestor] = None,
+        max_queued: int = 20,
+        max_nodes: int = 200000,
+        workers: int = 2,
+        window: int = 100
+    ):
+        self.ingestor = ingestor or node_ingestor
+        self.max_queued = max_queued
+        self.max_nodes = max_nodes
+        self.workers = max(1, workers)
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._queued_nodes = 0
+        self._busy = 0
+        self._wait_ms: Deque[float] = deque(maxlen=window)
+        self._process_ms: Deque[float] = deque(maxlen=window)
+
+        self.accepted = 0
+        self.rejected = 0
+        self.processed = 0
+        self.errors = 0
+        self.nodes_written = 0
+        self.nodes_failed = 0
+        self.retries = 0
+        self.stale_dropped = 0
+        self.last_result: Dict = {}
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def _ensure_workers(self):
+        """首次提交时启动 worker（需要运行中的事件循环）"""
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queued)
+        self._workers = [w for w in self._workers if not w.done()]
+        while len(self._workers) < self.workers:
+            self._workers.append(asyncio.create_task(self._worker()))
+
+    def retry_after(self) -> int:
+        """按最近的平均处理耗时估算队列腾出空位所需秒数"""
+        avg_ms = sum(self._process_ms) / len(self._process_ms) if self._process_ms else 1000.0
+        pending = self.depth + self._busy
+        return max(1, math.ceil(pending * avg_ms / 1000 / self.workers))
+
+    def submit(
+        self,
+        nodes: List[Any],
+        snapshot_ts: Optional[float] = None,
+        on_failed: Optional[Callable[[], None]] = None
+    ):
+        """
+        提交一次推送（snapshot_ts 为快照生成时间，用于丢弃乱序到达的旧快照；
+        on_failed 在这次推送入库失败时调用）
+
+        Raises:
+            IngestQueueFullError: 排队推送数或排队节点总数已达上限
+        """
+        self._ensure_workers()
+        if self._queued_nodes + len(nodes) > self.max_nodes and self._queued_nodes > 0:
+            self.rejected += 1
+            raise IngestQueueFullError(
+                f"入库队列节点数已达上限（{self._queued_nodes}/{self.max_nodes}）",
+                self.retry_after()
+            )
+        try:
+            self._queue.put_nowait(IngestItem(
+                nodes=nodes,
+                enqueued_at=time.monotonic(),
+                snapshot_ts=snapshot_ts,
+                on_failed=on_failed
+            ))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise IngestQueueFullError(f"入库队列已满（{self.max_queued}）", self.retry_after())
+        self._queued_nodes += len(nodes)
+        self.accepted += 1
+
+    async def shutdown(self):
+        """停止所有 worker（排队中的推送丢弃，SpiderFlow 会在下次推送时补齐）"""
+        if self.depth:
+            logger.warning(f"⚠️  入库队列关闭，丢弃 {self.depth} 个排队中的推送")
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def _worker(self):
+        while True:
+            item = await self._queue.get()
+            self._queued_nodes -= len(item.nodes)
+            self._busy += 1
+            started = time.monotonic()
+            self._wait_ms.append((started - item.enqueued_at) * 1000)
+            try:
+                stats = await self.ingestor.ingest(item.nodes, snapshot_ts=item.snapshot_ts)
+                self.processed += 1
+                if stats.stale:
+                    self.stale_dropped += 1
+                    continue
+                self.nodes_written += stats.written
+                self.nodes_failed += stats.failed
+                self.retries += stats.retries
+                self.last_result = stats.to_dict()
+                if stats.failed:
+                    self._notify_failed(item)
+                logger.info(
+                    f"✅ Webhook 入库完成: 有效={stats.valid}, 无效={stats.invalid}, 重复={stats.duplicates}, "
+                    f"新增={stats.inserted}, 变化={stats.changed}, 未变化={stats.unchanged}, 墓碑={stats.tombstoned}, "
+                    f"写入={stats.written}, 失败={stats.failed}, 重试={stats.retries}, 耗时={stats.elapsed_ms}ms"
+                )
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"❌ Webhook 入库失败: {e}")
+                self._notify_failed(item)
+            finally:
+                self._process_ms.append((time.monotonic() - started) * 1000)
+                self._busy -= 1
+                self._queue.task_done()
+
+    @staticmethod
+    def _notify_failed(item: IngestItem):
+        if item.on_failed is None:
+            return
+        try:
+            item.on_failed()
+        except Exception as e:
+            logger.error(f"❌ 入库失败回调出错: {e}")
+
+    @staticmethod
+    def _percentiles(samples: Deque[float]) -> Dict:
+        ordered = sorted(samples)
+        if not ordered:
+            return {"p50_ms": None, "p95_ms": None}
+        return {
+            "p50_ms": round(ordered[int(0.5 * (len(ordered) - 1))], 1),
+            "p95_ms": round(ordered[int(round(0.95 * (len(ordered) - 1)))], 1)
+        }
+
+    def snapshot(self) -> Dict:
+        return {
+            "depth": self.depth,
+            "max_queued": self.max_queued,
+            "queued_nodes": self._queued_nodes,
+            "max_nodes": self.max_nodes,
+            "busy_workers": self._busy,
+            "workers": self.workers,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "processed": self.processed,
+            "errors": self.errors,
+            "nodes_written": self.nodes_written,
+            "nodes_failed": self.nodes_failed,
+            "retries": self.retries,
+            "stale_dropped": self.stale_dropped,
+            "wait": self._percentiles(self._wait_ms),
+            "process": self._percentiles(self._process_ms),
+            "last_result": self.last_result
+        }
+
+
+# ==================== 全局实例 ====================
+
+ingest_queue = IngestQueue(
+    max_queued=config.WEBHOOK_QUEUE_SIZE,
+    max_nodes=config.WEBHOOK_QUEUE_MAX_NODES,
+    workers=config.WEBHOOK_WORKERS
+)
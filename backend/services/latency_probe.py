@@ -0,0 +1,333 @@
+"""
+延迟测试服务 - 复用连接的多次采样、抖动统计与短时缓存
+"""
+
+import asyncio
+import ipaddress
+import statistics
+import time
+from datetime import datetime
+from types import SimpleNamespace
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from ..config import config
+from ..core.logger import logger
+from .dns_cache import CachedResolver, dns_cache
+from .speed_test import SpeedTestGovernor
+
+
+class LatencyTargetError(Exception):
+    """目标不允许测试（非 http/https，或解析到内网 / 本机 / 保留地址）"""
+
+
+def _trace_config() -> aiohttp.TraceConfig:
+    """记录单个请求的 DNS / 建连 / 首字节时间点（写入 trace_request_ctx）"""
+    trace = aiohttp.TraceConfig()
+
+    async def on_request_start(session, ctx, params):
+        ctx.trace_request_ctx.start = time.perf_counter()
+
+    async def on_dns_start(session, ctx, params):
+        ctx.trace_request_ctx.dns_start = time.perf_counter()
+
+    async def on_dns_end(session, ctx, params):
+        ctx.trace_request_ctx.dns_ms = (time.perf_counter() - ctx.trace_request_ctx.dns_start) * 1000
+
+    async def on_connect_start(session, ctx, params):
+        ctx.trace_request_ctx.connect_start = time.perf_counter()
+
+    async def on_connect_end(session, ctx, params):
+        ctx.trace_request_ctx.connect_ms = (time.perf_counter() - ctx.trace_request_ctx.connect_start) * 1000
+
+    async def on_reuse(session, ctx, params):
+        ctx.trace_request_ctx.reused = True
+
+    async def on_request_end(session, ctx, params):
+        ctx.trace_request_ctx.total_ms = (time.perf_counter() - ctx.trace_request_ctx.start) * 1000
+
+    trace.on_request_start.append(on_request_start)
+    trace.on_dns_resolvehost_start.append(on_dns_start)
+    trace.on_dns_resolvehost_end.append(on_dns_end)
+    trace.on_connection_create_start.append(on_connect_start)
+    trace.on_connection_create_end.append(on_connect_end)
+    trace.on_connection_reuseconn.append(on_reuse)
+    trace.on_request_end.append(on_request_end)
+    return trace
+
+
+def _new_timing() -> SimpleNamespace:
+    return SimpleNamespace(start=0.0, dns_ms=0.0, connect_ms=0.0, total_ms=None, reused=False)
+
+
+class LatencyProber:
+    """
+    多次采样延迟测试
+
+    - 共享一个 keep-alive 连接池（也是批量测试使用的探测客户端）：先发一次预热请求（冷连接，得到 DNS / 建连 / 首字节的分阶段耗时），
+      随后 samples 次采样复用同一条已建立的连接，测得的是纯往返 + 服务端处理时间
+    - 输出 min / avg / p90 / max / 抖动（相邻样本差的均值）
+    - 同一目标的结果缓存 cache_ttl 秒，并发的相同请求只测一次，重复点击不产生新的出站流量
+    - 只测试 http/https 目标；allow_private=False 时拒绝解析到内网、本机、链路本地等非公网地址的目标，
+      避免接口被用来探测服务端所在的内网（SSRF）。连接池与这里使用同一个 DNS 缓存，解析结果一致
+    """
+
+    def __init__(
+        self,
+        samples: int = 5,
+        max_samples: int = 20,
+        timeout: float = 10.0,
+        cache_ttl: float = 30.0,
+        max_connections: int = 100,
+        verify_ssl: bool = True,
+        allow_private: bool = False
+    ):
+        self.samples = samples
+        self.max_samples = max_samples
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+        self.max_connections = max_connections
+        self.verify_ssl = verify_ssl
+        self.allow_private = allow_private
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._cache: Dict[Tuple[str, int], Tuple[float, Dict]] = {}
+        self._inflight: Dict[Tuple[str, int], asyncio.Future] = {}
+
+        self.cache_hits = 0
+        self.probes = 0
+        self.rejected = 0
+
+    # ==================== 会话 ====================
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                resolver=CachedResolver(dns_cache),
+                use_dns_cache=False,
+                keepalive_timeout=30,
+                # 默认校验证书（与原单次 HEAD 测试一致）；自签名证书的目标可通过 LATENCY_TEST_VERIFY_SSL 关闭
+                ssl=self.verify_ssl
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                trace_configs=[_trace_config()]
+            )
+        return self._session
+
+    async def close(self):
+        """关闭连接池（应用关闭时调用）"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    # ==================== 测试入口 ====================
+
+    async def measure(self, url: str, samples: Optional[int] = None) -> Dict:
+        """测试 url 的延迟，命中缓存时直接返回（cached=True）；不允许的目标返回 status=rejected"""
+        samples = self.effective_samples(samples)
+        key = (url, samples)
+
+        try:
+            await self.check_target(url)
+        except LatencyTargetError as e:
+            self.rejected += 1
+            logger.warning(f"⚠️  拒绝延迟测试目标 {url}: {e}")
+            return {"status": "rejected", "latency": 9999, "message": str(e), "timestamp": datetime.now().isoformat()}
+
+        cached = self._cache.get(key)
+        if cached and cached[0] > time.monotonic():
+            self.cache_hits += 1
+            return {**cached[1], "cached": True}
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            result = await asyncio.shield(pending)
+            if result is not None:
+                self.cache_hits += 1
+                return {**result, "cached": True}
+
+        future = asyncio.get_event_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await self._probe(url, samples)
+            if result["status"] == "success":
+                self._store(key, result)
+            future.set_result(result)
+            return result
+        finally:
+            # 发起方被取消时通知等待方自行测试
+            if not future.done():
+                future.set_result(None)
+            self._inflight.pop(key, None)
+
+    def effective_samples(self, samples: Optional[int]) -> int:
+        """实际采样次数（默认 samples，最多 max_samples）"""
+        return max(1, min(samples or self.samples, self.max_samples))
+
+    async def check_target(self, url: str):
+        """
+        检查目标是否允许测试
+
+        Raises:
+            LatencyTargetError: 不是 http/https URL，或主机解析到非公网地址（allow_private=False 时）
+        """
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise LatencyTargetError("只支持 http/https URL")
+        if self.allow_private:
+            return
+        entry = await dns_cache.resolve(parts.hostname)
+        if not entry.ok:
+            raise LatencyTargetError(f"无法解析 {parts.hostname}")
+        for address in entry.addresses:
+            if not ipaddress.ip_address(address.split("%")[0]).is_global:
+                raise LatencyTargetError(f"{parts.hostname} 解析到非公网地址 {address}")
+
+    def _store(self, key: Tuple[str, int], result: Dict):
+        now = time.monotonic()
+        if len(self._cache) >= 1000:
+            self._cache = {k: v for k, v in self._cache.items() if v[0] > now}
+        self._cache[key] = (now + self.cache_ttl, result)
+
+    # ==================== 采样 ====================
+
+    async def _request(self, url: str) -> SimpleNamespace:
+        """
+        发送一次采样请求，延迟取到响应头为止
+
+        用 GET + Range: bytes=0-0 而不是 HEAD：aiohttp 不会把 HEAD 响应的连接放回连接池，
+        无法复用；Range 让响应体只有 1 字节，读完后连接即可复用（超过 64KB 的响应直接丢弃连接）
+        """
+        timing = _new_timing()
+        async with self._get_session().get(
+            url,
+            headers={"Range": "bytes=0-0"},
+            allow_redirects=False,
+            trace_request_ctx=timing
+        ) as resp:
+            if resp.content_length is not None and resp.content_length <= 65536:
+                await resp.read()
+        return timing
+
+    async def _probe(self, url: str, samples: int) -> Dict:
+        self.probes += 1
+        timestamp = datetime.now().isoformat()
+        try:
+            warmup = await self._request(url)
+        except asyncio.TimeoutError:
+            return {"status": "timeout", "latency": 9999, "message": "延迟测试超时", "timestamp": timestamp}
+        except Exception as e:
+            logger.warning(f"延迟测试失败: {e}")
+            return {"status": "error", "latency": 9999, "message": str(e) or type(e).__name__, "timestamp": timestamp}
+
+        latencies: List[float] = []
+        reused = lost = 0
+        for _ in range(samples):
+            try:
+                timing = await self._request(url)
+            except (asyncio.TimeoutError, aiohttp.ClientError, OSError):
+                lost += 1
+                continue
+            latencies.append(timing.total_ms)
+            reused += timing.reused
+
+        if not latencies:
+            return {"status": "error", "latency": 9999, "message": "全部采样失败", "timestamp": timestamp}
+
+        ordered = sorted(latencies)
+        avg = statistics.mean(latencies)
+        jitter = statistics.mean(abs(a - b) for a, b in zip(latencies, latencies[1:])) if len(latencies) > 1 else 0.0
+        return {
+            "status": "success",
+            "latency": round(avg),
+            "latency_ms": round(avg),
+            "samples": samples,
+            "lost": lost,
+            "reused": reused,
+            "stats": {
+                "min_ms": round(ordered[0], 1),
+                "avg_ms": round(avg, 1),
+                "p90_ms": round(ordered[int(round(0.9 * (len(ordered) - 1)))], 1),
+                "max_ms": round(ordered[-1], 1),
+                "jitter_ms": round(jitter, 1)
+            },
+            # 预热请求（冷连接）的分阶段耗时：aiohttp 的建连事件包含 DNS 解析，
+            # 建连 = 建连事件 - DNS（含 TCP + TLS），首字节 = 总耗时 - 建连事件
+            "phases": {
+                "dns_ms": round(warmup.dns_ms, 1),
+                "connect_ms": round(max(0.0, warmup.connect_ms - warmup.dns_ms), 1),
+                "ttfb_ms": round(warmup.total_ms - warmup.connect_ms, 1),
+                "total_ms": round(warmup.total_ms, 1),
+                "reused": warmup.reused
+            },
+            "cached": False,
+            "timestamp": timestamp
+        }
+
+    # ==================== 批量测试 ====================
+
+    async def measure_many(
+        self,
+        targets: List[Tuple[Optional[str], str]],
+        samples: Optional[int] = None,
+        concurrency: int = 20
+    ) -> AsyncIterator[Tuple[Optional[str], str, Dict]]:
+        """
+        并发测试多个目标，按完成顺序产出 (id, url, 结果)
+
+        共用同一个连接池与缓存，同一批次中重复的 url 只测一次；
+        生成器提前关闭（客户端断开）时取消尚未完成的测试
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def run(target_id: Optional[str], url: str) -> Tuple[Optional[str], str, Dict]:
+            async with semaphore:
+                try:
+                    return target_id, url, await self.measure(url, samples)
+                except Exception as e:
+                    return target_id, url, {
+                        "status": "error",
+                        "latency": 9999,
+                        "message": str(e) or type(e).__name__,
+                        "timestamp": datetime.now().isoformat()
+                    }
+
+        tasks = [asyncio.ensure_future(run(target_id, url)) for target_id, url in targets]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def snapshot(self) -> Dict:
+        return {
+            "probes": self.probes,
+            "cache_hits": self.cache_hits,
+            "rejected": self.rejected,
+            "cached_targets": len(self._cache)
+        }
+
+
+# ==================== 全局实例 ====================
+
+latency_prober = LatencyProber(
+    samples=config.LATENCY_TEST_SAMPLES,
+    max_samples=config.LATENCY_TEST_MAX_SAMPLES,
+    timeout=config.LATENCY_TEST_TIMEOUT,
+    cache_ttl=config.LATENCY_TEST_CACHE_TTL,
+    verify_ssl=config.LATENCY_TEST_VERIFY_SSL,
+    allow_private=config.LATENCY_TEST_ALLOW_PRIVATE
+)
+
+# 批量延迟测试的准入控制：不排队，同时进行的批量测试数用完直接拒绝（429）
+latency_batch_governor = SpeedTestGovernor(
+    max_concurrent=config.LATENCY_TEST_BATCH_MAX_CONCURRENT,
+    max_queue=0
+)
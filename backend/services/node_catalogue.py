@@ -0,0 +1,142 @@
+"""
+进程内节点目录 - 定时拉取和 Webhook 推送共同维护的节点缓存
+"""
+
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
+
+from .health_checker import parse_check_time
+
+
+def node_key(protocol: str, host: str, port: int) -> Tuple[str, str, int]:
+    """节点去重键：(协议, 主机, 端口)，协议和主机不区分大小写"""
+    return (protocol or "").strip().lower(), (host or "").strip().lower(), int(port or 0)
+
+
+class NodeCatalogue:
+    """
+    进程内节点目录（nodes 表）
+
+    - 定时拉取时整体替换（replace），Webhook 推送时按节点合并（upsert）
+    - 维护 (协议, 主机, 端口) → 节点 ID 的索引，Webhook 推送的已知节点沿用原 ID
+    - 目录非空时 /api/nodes 直接从内存返回，不再每次请求 Supabase
+    - loaded：至少完成过一次完整（分页读完全表）的加载。Webhook 入库在此之前等待，
+      否则已有节点会因为查不到 ID 被当作新节点写入重复行
+    """
+
+    def __init__(self):
+        self._nodes: Dict[str, Dict] = {}
+        self._keys: Dict[Tuple[str, str, int], str] = {}
+        self.pulled_at: Optional[float] = None
+        self.pushed_at: Optional[float] = None
+        self.loaded = False
+        self._loaded_event: Optional[asyncio.Event] = None
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    @property
+    def ready(self) -> bool:
+        return bool(self._nodes)
+
+    def id_for(self, key: Tuple[str, str, int]) -> Optional[str]:
+        return self._keys.get(key)
+
+    def get(self, node_id: str) -> Optional[Dict]:
+        return self._nodes.get(node_id)
+
+    def replace(self, nodes: List[Dict], complete: bool = False):
+        """
+        用一次拉取的结果替换目录
+
+        complete=True 表示 nodes 是分页读完的全表（可能为空表），目录标记为 loaded
+        """
+        if nodes:
+            self._nodes = {}
+            self._keys = {}
+            for node in nodes:
+                self._put(node)
+            self.pulled_at = time.time()
+        # 拉取失败时 get_nodes 返回空列表，保留现有目录
+        if complete:
+            self.loaded = True
+            if self._loaded_event is not None:
+                self._loaded_event.set()
+
+    async def wait_loaded(self, timeout: float) -> bool:
+        """等待目录完成首次完整加载，超时返回 False"""
+        if self.loaded:
+            return True
+        if self._loaded_event is None:
+            self._loaded_event = asyncio.Event()
+        try:
+            await asyncio.wait_for(self._loaded_event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def upsert(self, nodes: List[Dict]):
+        """合并 Webhook 推送的节点（保留已有的测速、健康状态等字段）"""
+        for node in nodes:
+            existing = self._nodes.get(node["id"])
+            self._put({**existing, **node} if existing else node)
+        if nodes:
+            self.pushed_at = time.time()
+
+    def remove(self, node_ids: List[str]):
+        for node_id in node_ids:
+            node = self._nodes.pop(node_id, None)
+            if node is not None:
+                self._keys.pop(node_key(node.get("protocol"), node.get("host"), node.get("port")), None)
+
+    def mark_status(self, node_ids: List[str], status: str):
+        for node_id in node_ids:
+            node = self._nodes.get(node_id)
+            if node is not None:
+                node["status"] = status
+
+    def _put(self, node: Dict):
+        node_id = str(node.get("id", ""))
+        if not node_id:
+            return
+        self._nodes[node_id] = node
+        self._keys[node_key(node.get("protocol"), node.get("host"), node.get("port"))] = node_id
+
+    def list(self, limit: int, show_free: bool = True, history=None) -> List[Dict]:
+        """
+        返回最多 limit 个节点的副本
+
+        传入 history（HealthHistoryStore）时，用比目录更新的检测结果覆盖 status / health_latency，
+        避免两次拉取之间健康状态停留在旧值
+        """
+        nodes = []
+        for node in self._nodes.values():
+            if not show_free and node.get("is_free"):
+                continue
+            node = dict(node)
+            latest = history.latest(node["id"]) if history is not None else None
+            if latest and latest[0] > parse_check_time(node.get("last_health_check")):
+                checked_ts, latency, status = latest
+                node["status"] = status
+                node["health_latency"] = latency
+            nodes.append(node)
+            if len(nodes) >= limit:
+                break
+        return nodes
+
+    def all(self) -> List[Dict]:
+        return list(self._nodes.values())
+
+    def snapshot(self) -> Dict:
+        return {
+            "nodes": len(self._nodes),
+            "loaded": self.loaded,
+            "pulled_at": self.pulled_at,
+            "pushed_at": self.pushed_at
+        }
+
+
+# ==================== 全局实例 ====================
+
+node_catalogue = NodeCatalogue()
@@ -0,0 +1,138 @@
+"""
+节点内容指纹 - Webhook 推送按内容哈希比对，只写入新增、变化和消失的节点
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+from typing import Dict, Iterable, List, Set, Tuple
+
+from ..config import config
+from ..core.logger import logger
+
+# 参与指纹计算的字段（id、updated_at 等不属于节点内容）
+FINGERPRINT_FIELDS = (
+    "is_free",
+    "mainland_score",
+    "mainland_latency",
+    "overseas_score",
+    "overseas_latency"
+)
+
+# 已写墓碑（标记离线）的节点，重新出现时按变化处理并恢复在线
+TOMBSTONE = ""
+
+
+def fingerprint(row: Dict) -> str:
+    """对规范化后的节点内容计算 16 字节 blake2b 指纹（十六进制）"""
+    content = row.get("content", {})
+    normalized = [
+        (content.get("protocol") or "").strip().lower(),
+        (content.get("host") or "").strip().lower(),
+        int(content.get("port") or 0),
+        (content.get("name") or "").strip(),
+        (content.get("country") or "").strip().upper(),
+        (row.get("link") or "").strip()
+    ] + [row.get(name) for name in FINGERPRINT_FIELDS]
+    encoded = json.dumps(normalized, ensure_ascii=False, separators=(",", ":")).encode()
+    return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+
+class FingerprintStore:
+    """
+    节点 ID → 内容指纹
+
+    - diff：把一次推送分为新增、变化、未变化
+    - missing：本次推送中没有出现的已知节点（墓碑候选）
+    - tombstone：标记离线的节点保留为 TOMBSTONE，重新出现时 revived 为真
+    - 写入成功后才 update / remove，失败的节点下次推送会再次被判为变化
+    - path 非空时持久化到 JSON 文件，重启后第一次推送不会退化为全量写入
+    """
+
+    def __init__(self, path: str = ""):
+        self.path = path
+        self._fingerprints: Dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._fingerprints)
+
+    @property
+    def live(self) -> int:
+        """未被标记离线的节点数"""
+        return sum(1 for digest in self._fingerprints.values() if digest != TOMBSTONE)
+
+    def revived(self, node_id: str) -> bool:
+        return self._fingerprints.get(node_id) == TOMBSTONE
+
+    def diff(self, rows: List[Dict]) -> Tuple[List[Tuple[Dict, str]], List[Tuple[Dict, str]], int]:
+        """
+        Returns:
+            (新增 [(行, 指纹)], 变化 [(行, 指纹)], 未变化数量)
+        """
+        inserts: List[Tuple[Dict, str]] = []
+        changes: List[Tuple[Dict, str]] = []
+        unchanged = 0
+        for row in rows:
+            digest = fingerprint(row)
+            known = self._fingerprints.get(row["id"])
+            if known is None:
+                inserts.append((row, digest))
+            elif known != digest:
+                changes.append((row, digest))
+            else:
+                unchanged += 1
+        return inserts, changes, unchanged
+
+    def missing(self, seen_ids: Set[str]) -> List[str]:
+        return [
+            node_id for node_id, digest in self._fingerprints.items()
+            if digest != TOMBSTONE and node_id not in seen_ids
+        ]
+
+    def update(self, items: Iterable[Tuple[str, str]]):
+        for node_id, digest in items:
+            self._fingerprints[node_id] = digest
+
+    def tombstone(self, node_ids: Iterable[str]):
+        for node_id in node_ids:
+            self._fingerprints[node_id] = TOMBSTONE
+
+    def remove(self, node_ids: Iterable[str]):
+        for node_id in node_ids:
+            self._fingerprints.pop(node_id, None)
+
+    # ==================== 持久化 ====================
+
+    async def save(self):
+        """保存到 path（未配置时跳过）；先复制一份快照，序列化和写文件在线程中执行"""
+        if not self.path:
+            return
+        try:
+            await asyncio.to_thread(self._write, self.path, dict(self._fingerprints))
+            logger.info(f"💾 节点指纹已保存: {len(self._fingerprints)} 个节点")
+        except Exception as e:
+            logger.warning(f"⚠️  保存节点指纹失败: {e}")
+
+    @staticmethod
+    def _write(path: str, data: Dict[str, str]):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    def load(self):
+        """从 path 加载（文件不存在时跳过）"""
+        if not self.path or not os.path.isfile(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                self._fingerprints = json.load(f)
+            logger.info(f"📂 节点指纹已加载: {len(self._fingerprints)} 个节点")
+        except Exception as e:
+            logger.warning(f"⚠️  加载节点指纹失败: {e}")
+
+
+# ==================== 全局实例 ====================
+
+node_fingerprints = FingerprintStore(path=config.WEBHOOK_FINGERPRINT_PATH)
@@ -0,0 +1,368 @@
+"""
+Webhook 节点入库 - 校验、去重、分批 upsert 到 Supabase 并更新进程内目录
+"""
+
+import asyncio
+import hashlib
+import random
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import aiohttp
+from pydantic import ValidationError
+
+from ..config import config
+from ..core.logger import logger
+from ..webhooks.models import NodeData
+from .node_catalogue import NodeCatalogue, node_catalogue, node_key
+from .node_fingerprints import FingerprintStore, node_fingerprints
+
+# 新节点在目录中的默认字段（与 NodeService.get_nodes 缺省值一致）
+NEW_NODE_DEFAULTS = {
+    "speed": 0,
+    "latency": 9999,
+    "status": "online",
+    "last_health_check": None,
+    "health_latency": None,
+    "alive": False
+}
+
+
+class CatalogueNotReadyError(Exception):
+    """节点目录尚未完成首次完整加载，无法确定已有节点的 ID"""
+
+
+@dataclass
+class IngestStats:
+    """单次推送的入库统计"""
+    received: int = 0
+    valid: int = 0
+    invalid: int = 0
+    duplicates: int = 0
+    inserted: int = 0
+    changed: int = 0
+    unchanged: int = 0
+    tombstoned: int = 0
+    written: int = 0
+    failed: int = 0
+    retries: int = 0
+    elapsed_ms: int = 0
+    stale: bool = False
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+class NodeIngestor:
+    """
+    Webhook 节点入库流水线
+
+    1. 校验：逐个用 NodeData 模型校验，单个节点无效不影响整批
+    2. 去重：同一推送内按 (协议, 主机, 端口) 或链接哈希去重，保留第一次出现
+    3. 写入：按 batch_size 分批 upsert（on_conflict=id，merge-duplicates 只覆盖推送的列，
+       测速与健康状态等列保持不变）；已知节点沿用目录中的 ID，新节点使用基于去重键的 uuid5。
+       网络错误、429 和 5xx 按指数退避（带抖动）重试 max_retries 次，其他 4xx 不重试
+    4. 差量：按内容指纹与上次推送比对，只写入新增和变化的节点；推送中消失的节点写墓碑
+    5. 目录：写入成功的批次立即合并到进程内目录，/api/nodes 无需等待下一次定时拉取
+
+    每次推送是全量快照，差量和墓碑依赖共享的指纹表，因此 ingest 串行执行；
+    快照时间早于已应用快照的推送（乱序到达的重试）直接丢弃，不回滚较新的状态
+    """
+
+    def __init__(
+        self,
+        supabase_url: str,
+        supabase_key: str,
+        table: str = "nodes",
+        batch_size: int = 500,
+        catalogue: Optional[NodeCatalogue] = None,
+        max_retries: int = 3,
+        retry_backoff: float = 1.0,
+        fingerprints: Optional[FingerprintStore] = None,
+        tombstone_mode: str = "offline",
+        tombstone_min_ratio: float = 0.5,
+        tombstone_batch_size: int = 100,
+        catalogue_wait: float = 120.0
+    ):
+        self.supabase_url = supabase_url
+        self.supabase_key = supabase_key
+        self.table = table
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.catalogue = catalogue if catalogue is not None else node_catalogue
+        self.fingerprints = fingerprints if fingerprints is not None else node_fingerprints
+        self.tombstone_mode = tombstone_mode
+        self.tombstone_min_ratio = tombstone_min_ratio
+        self.tombstone_batch_size = tombstone_batch_size
+        self.catalogue_wait = catalogue_wait
+        self.last_snapshot_ts: Optional[float] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self.headers = {
+            "apikey": supabase_key,
+            "Authorization": f"Bearer {supabase_key}",
+            "Content-Type": "application/json",
+            "Prefer": "resolution=merge-duplicates,return=minimal"
+        }
+
+    # ==================== 校验与去重 ====================
+
+    @staticmethod
+    def validate(raw_nodes: List[Any]) -> Tuple[List[NodeData], int]:
+        """返回 (有效节点, 无效数量)"""
+        valid: List[NodeData] = []
+        invalid = 0
+        for item in raw_nodes:
+            try:
+                valid.append(NodeData.model_validate(item))
+            except ValidationError:
+                invalid += 1
+        if invalid:
+            logger.warning(f"⚠️  Webhook 推送中有 {invalid} 个节点未通过校验")
+        return valid, invalid
+
+    @staticmethod
+    def link_hash(link: Optional[str]) -> Optional[str]:
+        link = (link or "").strip()
+        return hashlib.sha1(link.encode()).hexdigest() if link else None
+
+    @classmethod
+    def dedupe(cls, nodes: List[NodeData]) -> Tuple[List[NodeData], int]:
+        """返回 (去重后的节点, 重复数量)"""
+        seen_keys = set()
+        seen_links = set()
+        unique: List[NodeData] = []
+        for node in nodes:
+            key = node_key(node.protocol, node.host, node.port)
+            link = cls.link_hash(node.link)
+            if key in seen_keys or (link is not None and link in seen_links):
+                continue
+            seen_keys.add(key)
+            if link is not None:
+                seen_links.add(link)
+            unique.append(node)
+        return unique, len(nodes) - len(unique)
+
+    # ==================== 行转换 ====================
+
+    def node_id(self, node: NodeData) -> str:
+        key = node_key(node.protocol, node.host, node.port)
+        existing = self.catalogue.id_for(key)
+        if existing:
+            return existing
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, "{}://{}:{}".format(*key)))
+
+    def to_row(self, node: NodeData, updated_at: str) -> Dict:
+        """转换为 nodes 表的一行（content 为 JSONB 节点详情）"""
+        return {
+            "id": self.node_id(node),
+            "link": node.link or "",
+            "content": {
+                "protocol": node.protocol,
+                "host": node.host,
+                "port": node.port,
+                "name": node.name,
+                "country": node.country,
+                "link": node.link or ""
+            },
+            "is_free": bool(node.is_free),
+            "mainland_score": node.mainland_score or 0,
+            "mainland_latency": node.mainland_latency if node.mainland_latency is not None else 9999,
+            "overseas_score": node.overseas_score or 0,
+            "overseas_latency": node.overseas_latency if node.overseas_latency is not None else 9999,
+            "updated_at": updated_at
+        }
+
+    def to_catalogue(self, row: Dict) -> Dict:
+        """转换为目录中的节点格式（与 NodeService.get_nodes 一致）"""
+        content = row["content"]
+        node = {
+            "id": row["id"],
+            "protocol": content["protocol"],
+            "host": content["host"],
+            "port": content["port"],
+            "name": content["name"],
+            "country": content["country"],
+            "link": row["link"],
+            "is_free": row["is_free"],
+            "updated_at": row["updated_at"],
+            "mainland_score": row["mainland_score"],
+            "mainland_latency": row["mainland_latency"],
+            "overseas_score": row["overseas_score"],
+            "overseas_latency": row["overseas_latency"]
+        }
+        if "status" in row:
+            node["status"] = row["status"]
+        if self.catalogue.get(row["id"]) is None:
+            node = {**NEW_NODE_DEFAULTS, **node}
+        return node
+
+    # ==================== 入库 ====================
+
+    async def ingest(self, raw_nodes: List[Any], snapshot_ts: Optional[float] = None) -> IngestStats:
+        """
+        处理一次推送的节点列表（串行）
+
+        Args:
+            raw_nodes: 推送的节点
+            snapshot_ts: 快照生成时间（X-Webhook-Timestamp），早于已应用的快照时丢弃（stats.stale）
+
+        Raises:
+            CatalogueNotReadyError: 等待 catalogue_wait 秒后目录仍未完成首次完整加载
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if snapshot_ts is not None and self.last_snapshot_ts is not None and snapshot_ts < self.last_snapshot_ts:
+                logger.warning(f"⚠️  推送快照早于已应用的快照（{snapshot_ts:.0f} < {self.last_snapshot_ts:.0f}），已丢弃")
+                return IngestStats(received=len(raw_nodes), stale=True)
+            stats = await self._ingest(raw_nodes)
+            if snapshot_ts is not None:
+                self.last_snapshot_ts = max(snapshot_ts, self.last_snapshot_ts or snapshot_ts)
+            return stats
+
+    async def _ingest(self, raw_nodes: List[Any]) -> IngestStats:
+        start = time.monotonic()
+        # 已有节点的 ID 来自目录，目录不完整时会为已有节点生成新 ID、写入重复行
+        if not await self.catalogue.wait_loaded(self.catalogue_wait):
+            raise CatalogueNotReadyError(f"节点目录 {self.catalogue_wait:g}s 内未完成加载，本次推送未入库")
+        stats = IngestStats(received=len(raw_nodes))
+
+        nodes, stats.invalid = self.validate(raw_nodes)
+        nodes, stats.duplicates = self.dedupe(nodes)
+        stats.valid = len(nodes)
+
+        updated_at = datetime.utcnow().isoformat()
+        rows = [self.to_row(node, updated_at) for node in nodes]
+        for row in rows:
+            if self.fingerprints.revived(row["id"]):
+                # 之前被标记离线的节点重新出现
+                row["status"] = "online"
+
+        # 按内容指纹比对，只写入新增和变化的节点
+        inserts, changes, stats.unchanged = self.fingerprints.diff(rows)
+        stats.inserted, stats.changed = len(inserts), len(changes)
+        # PostgREST 批量 upsert 要求同一批的行字段一致，恢复在线的行（多一个 status）单独成批
+        pending = inserts + changes
+        plain = [item for item in pending if "status" not in item[0]]
+        revived = [item for item in pending if "status" in item[0]]
+
+        async with aiohttp.ClientSession() as session:
+            for batch in (plain, revived):
+                await self._write_rows(session, batch, stats)
+            await self._write_tombstones(session, {row["id"] for row in rows}, stats)
+
+        stats.elapsed_ms = int((time.monotonic() - start) * 1000)
+        return stats
+
+    async def _write_rows(self, session: aiohttp.ClientSession, items: List[Tuple[Dict, str]], stats: IngestStats):
+        """分批 upsert (行, 指纹)，成功的批次同步到目录和指纹表"""
+        for i in range(0, len(items), self.batch_size):
+            chunk = items[i:i + self.batch_size]
+            rows = [row for row, _ in chunk]
+            if await self._send_with_retry(session, "POST", "on_conflict=id", rows, stats):
+                stats.written += len(chunk)
+                self.catalogue.upsert([self.to_catalogue(row) for row in rows])
+                self.fingerprints.update((row["id"], digest) for row, digest in chunk)
+            else:
+                stats.failed += len(chunk)
+
+    async def _write_tombstones(self, session: aiohttp.ClientSession, seen_ids: Set[str], stats: IngestStats):
+        """
+        处理本次推送中消失的节点（SpiderFlow 每次推送全量节点）
+
+        - "offline"：标记 status=offline（默认，可恢复）
+        - "delete"：删除行
+        - "off"：不处理
+        推送数量不足已知节点的 tombstone_min_ratio 时视为不完整推送，跳过，避免误删
+        """
+        if self.tombstone_mode == "off":
+            return
+        missing = self.fingerprints.missing(seen_ids)
+        if not missing:
+            return
+        known = self.fingerprints.live
+        if len(seen_ids) < known * self.tombstone_min_ratio:
+            logger.warning(
+                f"⚠️  本次推送 {len(seen_ids)} 个节点，不足已知 {known} 个的 "
+                f"{self.tombstone_min_ratio:.0%}，跳过 {len(missing)} 个墓碑"
+            )
+            return
+
+        # ID 放在 URL 中（id=in.(...)），按 tombstone_batch_size 分批，避免超出代理/PostgREST 的 URL 长度限制
+        for i in range(0, len(missing), self.tombstone_batch_size):
+            chunk = missing[i:i + self.tombstone_batch_size]
+            query = f"id=in.({','.join(chunk)})"
+            if self.tombstone_mode == "delete":
+                ok = await self._send_with_retry(session, "DELETE", query, None, stats)
+            else:
+                ok = await self._send_with_retry(session, "PATCH", query, {"status": "offline"}, stats)
+            if not ok:
+                stats.failed += len(chunk)
+                continue
+            stats.tombstoned += len(chunk)
+            if self.tombstone_mode == "delete":
+                self.fingerprints.remove(chunk)
+                self.catalogue.remove(chunk)
+            else:
+                self.fingerprints.tombstone(chunk)
+                self.catalogue.mark_status(chunk, "offline")
+
+    async def _send_with_retry(
+        self,
+        session: aiohttp.ClientSession,
+        method: str,
+        query: str,
+        payload: Any,
+        stats: IngestStats
+    ) -> bool:
+        for attempt in range(self.max_retries + 1):
+            ok, retryable = await self._send(session, method, query, payload)
+            if ok:
+                return True
+            if not retryable or attempt == self.max_retries:
+                return False
+            stats.retries += 1
+            delay = self.retry_backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+            logger.info(f"🔁 节点 {method} 第 {attempt + 1} 次重试（{delay:.1f}s 后）")
+            await asyncio.sleep(delay)
+        return False
+
+    async def _send(self, session: aiohttp.ClientSession, method: str, query: str, payload: Any) -> Tuple[bool, bool]:
+        """返回 (是否成功, 失败时是否值得重试)"""
+        if not self.supabase_url or not self.supabase_key:
+            return False, False
+        try:
+            async with session.request(
+                method,
+                f"{self.supabase_url}/rest/v1/{self.table}?{query}",
+                json=payload,
+                headers=self.headers,
+                timeout=aiohttp.ClientTimeout(total=30)
+            ) as resp:
+                if resp.status in (200, 201, 204):
+                    return True, False
+                detail = (await resp.text())[:200]
+                logger.warning(f"⚠️  节点 {method} 失败: HTTP {resp.status} {detail}")
+                return False, resp.status == 429 or resp.status >= 500
+        except (asyncio.TimeoutError, aiohttp.ClientError, OSError) as e:
+            logger.warning(f"⚠️  节点 {method} 异常: {str(e) or type(e).__name__}")
+            return False, True
+
+
+# ==================== 全局实例 ====================
+
+node_ingestor = NodeIngestor(
+    supabase_url=config.SUPABASE_URL,
+    supabase_key=config.SUPABASE_KEY,
+    batch_size=config.WEBHOOK_UPSERT_BATCH_SIZE,
+    max_retries=config.WEBHOOK_UPSERT_MAX_RETRIES,
+    retry_backoff=config.WEBHOOK_UPSERT_RETRY_BACKOFF,
+    tombstone_mode=config.WEBHOOK_TOMBSTONE_MODE,
+    tombstone_min_ratio=config.WEBHOOK_TOMBSTONE_MIN_RATIO,
+    tombstone_batch_size=config.WEBHOOK_TOMBSTONE_BATCH_SIZE,
+    catalogue_wait=config.WEBHOOK_CATALOGUE_WAIT_SECONDS
+)
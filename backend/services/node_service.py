@@ -4,7 +4,8 @@
 
 import aiohttp
 import json
-from typing import List, Dict, Optional
+import time
+from typing import List, Dict, Optional, Callable, Tuple
 from datetime import datetime
 
 from ..config import config
@@ -16,6 +17,131 @@ from ..core.database import db_client
 class NodeService:
     """节点管理业务逻辑"""
     
+    @staticmethod
+    def row_to_node(row: Dict) -> Dict:
+        """把 nodes 表的一行转换为节点对象"""
+        # content 字段是 JSONB，包含完整的节点信息
+        node_content = row.get("content", {})
+        if isinstance(node_content, str):
+            node_content = json.loads(node_content)
+        elif node_content is None:
+            node_content = {}
+
+        # 组装节点对象
+        latency = row.get("latency") or 9999
+        node = {
+            "id": row.get("id", ""),
+            "protocol": node_content.get("protocol", ""),
+            "host": node_content.get("host", ""),
+            "port": node_content.get("port", 0),
+            "name": node_content.get("name", f"{node_content.get('host')}:{node_content.get('port')}"),
+            "country": node_content.get("country", "UNK"),
+            "link": row.get("link", "") or node_content.get("link", ""),
+            "is_free": row.get("is_free", False),
+            "speed": row.get("speed", 0),
+            "latency": latency,
+            "updated_at": row.get("updated_at"),
+            "mainland_score": row.get("mainland_score", 0),
+            "mainland_latency": row.get("mainland_latency", 9999),
+            "overseas_score": row.get("overseas_score", 0),
+            "overseas_latency": row.get("overseas_latency", 9999),
+            "status": row.get("status", "online"),
+            "last_health_check": row.get("last_health_check"),
+            "health_latency": row.get("health_latency"),
+            "alive": latency < 9999
+        }
+        return node
+    
+    @staticmethod
+    def telegram_row_to_node(row: Dict) -> Dict:
+        """把 telegram_nodes 表的一行转换为节点对象（与海外节点格式一致）"""
+        # content 字段是 JSONB，包含完整的节点信息
+        node_content = row.get("content", {})
+        if isinstance(node_content, str):
+            node_content = json.loads(node_content)
+        elif node_content is None:
+            node_content = {}
+
+        latency = row.get("latency") or 9999
+        node = {
+            "id": row.get("id", ""),
+            "protocol": node_content.get("protocol", ""),
+            "host": node_content.get("host", ""),
+            "port": node_content.get("port", 0),
+            "name": node_content.get("name", f"{node_content.get('host')}:{node_content.get('port')}"),
+            "country": row.get("country") or node_content.get("country", "UNK"),
+            "link": row.get("link", "") or node_content.get("link", ""),
+            "is_free": row.get("is_free", True),
+            "speed": row.get("speed", 0),
+            "latency": latency,
+            "updated_at": row.get("updated_at"),
+            "status": row.get("status", "online"),
+            "last_health_check": row.get("last_health_check"),
+            "quality_score": row.get("quality_score", 50),
+            "source_channel": row.get("source_channel"),
+            "alive": latency < 9999
+        }
+        return node
+    
+    async def fetch_all_nodes(self, page_size: int = 1000) -> List[Dict]:
+        """
+        分页读取 nodes 表的全部节点（按 id 排序，直到返回空页）
+        
+        不受 PostgREST max-rows 截断影响；任一页失败时抛出异常，
+        调用方不会把不完整的结果当作完整目录
+        
+        Raises:
+            RuntimeError: Supabase 返回非 200
+        """
+        return await self._fetch_all_rows("nodes", self.row_to_node, page_size)
+    
+    async def fetch_all_telegram_nodes(self, page_size: int = 1000) -> List[Dict]:
+        """
+        分页读取 telegram_nodes 表的全部节点，行为同 fetch_all_nodes
+        
+        Raises:
+            RuntimeError: Supabase 返回非 200
+        """
+        return await self._fetch_all_rows("telegram_nodes", self.telegram_row_to_node, page_size)
+    
+    async def _fetch_all_rows(
+        self,
+        table: str,
+        row_to_node: Callable[[Dict], Dict],
+        page_size: int
+    ) -> List[Dict]:
+        headers = {
+            "apikey": config.SUPABASE_KEY,
+            "Authorization": f"Bearer {config.SUPABASE_KEY}",
+            "Content-Type": "application/json"
+        }
+        nodes: List[Dict] = []
+        offset = 0
+        async with aiohttp.ClientSession() as session:
+            while True:
+                url = (
+                    f"{config.SUPABASE_URL}/rest/v1/{table}?select=*"
+                    f"&order=id.asc&limit={page_size}&offset={offset}"
+                )
+                async with session.get(
+                    url,
+                    headers=headers,
+                    timeout=aiohttp.ClientTimeout(total=30)
+                ) as resp:
+                    if resp.status != 200:
+                        raise RuntimeError(f"Supabase 返回错误: {resp.status}")
+                    rows = await resp.json()
+                if not rows:
+                    break
+                for row in rows:
+                    try:
+                        nodes.append(row_to_node(row))
+                    except Exception as e:
+                        logger.warning(f"解析 {table} 节点数据失败: {e}")
+                offset += len(rows)
+        logger.info(f"✅ 从 Supabase 分页读取 {table} 全部 {len(nodes)} 个节点")
+        return nodes
+    
     async def get_nodes(
         self,
         limit: int = 500,
@@ -69,36 +195,7 @@ class NodeService:
                                     logger.debug(f"第 {idx} 行数据无效: {type(row)}")
                                     continue
                                 
-                                # content 字段是 JSONB，包含完整的节点信息
-                                node_content = row.get("content", {})
-                                if isinstance(node_content, str):
-                                    node_content = json.loads(node_content)
-                                elif node_content is None:
-                                    node_content = {}
-                                
-                                # 组装节点对象
-                                latency = row.get("latency") or 9999
-                                node = {
-                                    "id": row.get("id", ""),
-                                    "protocol": node_content.get("protocol", ""),
-                                    "host": node_content.get("host", ""),
-                                    "port": node_content.get("port", 0),
-                                    "name": node_content.get("name", f"{node_content.get('host')}:{node_content.get('port')}"),
-                                    "country": node_content.get("country", "UNK"),
-                                    "link": row.get("link", "") or node_content.get("link", ""),
-                                    "is_free": row.get("is_free", False),
-                                    "speed": row.get("speed", 0),
-                                    "latency": latency,
-                                    "updated_at": row.get("updated_at"),
-                                    "mainland_score": row.get("mainland_score", 0),
-                                    "mainland_latency": row.get("mainland_latency", 9999),
-                                    "overseas_score": row.get("overseas_score", 0),
-                                    "overseas_latency": row.get("overseas_latency", 9999),
-                                    "status": row.get("status", "online"),
-                                    "last_health_check": row.get("last_health_check"),
-                                    "health_latency": row.get("health_latency"),
-                                    "alive": latency < 9999
-                                }
+                                node = self.row_to_node(row)
                                 nodes.append(node)
                             except Exception as e:
                                 logger.warning(f"解析第 {idx} 行节点数据失败: {e}, 数据类型: {type(row)}")
@@ -165,33 +262,7 @@ class NodeService:
                                     logger.debug(f"第 {idx} 行 telegram 数据无效: {type(row)}")
                                     continue
                                 
-                                # content 字段是 JSONB，包含完整的节点信息
-                                node_content = row.get("content", {})
-                                if isinstance(node_content, str):
-                                    node_content = json.loads(node_content)
-                                elif node_content is None:
-                                    node_content = {}
-                                
-                                # 组装节点对象（与海外节点格式一致）
-                                latency = row.get("latency") or 9999
-                                node = {
-                                    "id": row.get("id", ""),
-                                    "protocol": node_content.get("protocol", ""),
-                                    "host": node_content.get("host", ""),
-                                    "port": node_content.get("port", 0),
-                                    "name": node_content.get("name", f"{node_content.get('host')}:{node_content.get('port')}"),
-                                    "country": row.get("country") or node_content.get("country", "UNK"),
-                                    "link": row.get("link", "") or node_content.get("link", ""),
-                                    "is_free": row.get("is_free", True),
-                                    "speed": row.get("speed", 0),
-                                    "latency": latency,
-                                    "updated_at": row.get("updated_at"),
-                                    "status": row.get("status", "online"),
-                                    "last_health_check": row.get("last_health_check"),
-                                    "quality_score": row.get("quality_score", 50),
-                                    "source_channel": row.get("source_channel"),
-                                    "alive": latency < 9999
-                                }
+                                node = self.telegram_row_to_node(row)
                                 nodes.append(node)
                             except Exception as e:
                                 logger.warning(f"解析第 {idx} 行 telegram 节点数据失败: {e}, 数据类型: {type(row)}")
@@ -277,26 +348,104 @@ class NodeService:
                 "error": str(e)
             }
     
-    async def health_check_nodes(self, nodes: List[Dict]) -> Dict:
+    async def health_check_source(
+        self,
+        source: str,
+        batch_size: int,
+        on_progress: Optional[Callable] = None,
+        force: bool = False
+    ) -> Dict:
+        """
+        按数据源获取一批节点并执行健康检测
+        
+        Args:
+            source: "overseas"（nodes 表）或 "china"（telegram_nodes 表）
+            batch_size: 检测的节点数量
+            on_progress: 进度回调
+            force: 忽略新鲜度窗口，全部重新探测
+        
+        Returns:
+            检测结果统计
+        """
+        if source == "china":
+            nodes = await self.get_telegram_nodes(limit=batch_size)
+            table = "telegram_nodes"
+        else:
+            nodes = await self.get_nodes(limit=batch_size)
+            table = "nodes"
+        
+        logger.info(f"✅ 获取到 {len(nodes)} 个节点")
+        
+        if not nodes:
+            return {
+                "status": "no_nodes",
+                "total": 0,
+                "online": 0,
+                "offline": 0,
+                "suspect": 0,
+                "problem_nodes": []
+            }
+        
+        return await self.health_check_nodes(nodes, on_progress=on_progress, table=table, force=force)
+    
+    async def health_check_nodes(
+        self,
+        nodes: List[Dict],
+        on_progress: Optional[Callable] = None,
+        table: str = "nodes",
+        force: bool = False
+    ) -> Dict:
         """
         执行节点健康检测
         
         Args:
             nodes: 要检测的节点列表
+            on_progress: 进度回调，参数为实时更新的 HealthCheckStats
+            table: 写回状态的表（nodes 或 telegram_nodes）
+            force: 忽略新鲜度窗口，全部重新探测
         
         Returns:
             检测结果统计
         """
         try:
-            from .health_checker import LightweightHealthChecker, SupabaseHealthUpdater
-            from .health_checker import NodeStatus
+            from .health_checker import (
+                LightweightHealthChecker,
+                SupabaseHealthUpdater,
+                HealthCheckPipeline,
+                RetryPolicy,
+                FreshnessPolicy
+            )
+            from .concurrency import AdaptiveLimiter
+            from .health_history import health_history
+            
+            # 新鲜度窗口内检测过的节点直接复用上次结果
+            cached_results = []
+            if not force:
+                freshness = FreshnessPolicy(windows={
+                    "online": config.HEALTH_FRESHNESS_ONLINE_SECONDS,
+                    "offline": config.HEALTH_FRESHNESS_OFFLINE_SECONDS,
+                    "suspect": config.HEALTH_FRESHNESS_SUSPECT_SECONDS
+                })
+                nodes, cached_results = self._split_fresh(nodes, freshness, health_history)
+                if cached_results:
+                    logger.info(f"⏭️  跳过 {len(cached_results)} 个近期已检测的节点")
             
             logger.info("🏥 开始检测节点...")
+            limiter = AdaptiveLimiter(
+                initial=config.HEALTH_CHECK_INITIAL_CONCURRENCY,
+                min_limit=config.HEALTH_CHECK_MIN_CONCURRENCY,
+                max_limit=config.HEALTH_CHECK_MAX_CONCURRENCY
+            )
             checker = LightweightHealthChecker(
                 tcp_timeout=5.0,
                 http_timeout=8.0,
-                max_retries=2,
-                max_concurrent=20
+                limiter=limiter,
+                retry_policy=RetryPolicy(
+                    max_retries=config.HEALTH_CHECK_MAX_RETRIES,
+                    node_deadline=config.HEALTH_CHECK_NODE_DEADLINE_SECONDS
+                ),
+                batch_deadline=config.HEALTH_CHECK_BATCH_DEADLINE_SECONDS,
+                tcp_engine=config.HEALTH_CHECK_TCP_ENGINE
             )
             
             # 将节点数据转换为检测格式
@@ -307,49 +456,47 @@ class NodeService:
                     "host": node.get("host", ""),
                     "port": node.get("port", 0),
                     "protocol": node.get("protocol", "unknown"),
-                    "name": node.get("name", "")
+                    "name": node.get("name", ""),
+                    "link": node.get("link", "")
                 })
             
-            # 执行批量检测
-            results = await checker.check_nodes_batch(check_nodes)
-            
-            # 统计结果
-            online_count = sum(1 for r in results if r.status == NodeStatus.ONLINE)
-            offline_count = sum(1 for r in results if r.status == NodeStatus.OFFLINE)
-            suspect_count = sum(1 for r in results if r.status == NodeStatus.SUSPECT)
-            
-            logger.info(f"📊 检测结果: 在线={online_count}, 离线={offline_count}, 可疑={suspect_count}")
-            
-            # 更新数据库
-            logger.info("💾 更新数据库...")
             updater = SupabaseHealthUpdater(
                 supabase_url=config.SUPABASE_URL,
-                supabase_key=config.SUPABASE_KEY
+                supabase_key=config.SUPABASE_KEY,
+                table=table,
+                persist_timings=config.HEALTH_PERSIST_TIMINGS
             )
-            success, fail = await updater.update_node_status(results)
-            logger.info(f"✅ 数据库更新: 成功={success}, 失败={fail}")
             
-            # 获取问题节点列表
-            problem_nodes = [
-                {
-                    "id": r.node_id,
-                    "name": r.host,
-                    "host": r.host,
-                    "port": r.port,
-                    "status": r.status.value
-                }
-                for r in results if r.status in [NodeStatus.OFFLINE, NodeStatus.SUSPECT]
-            ]
+            # 流水线执行：检测结果边产出边写入数据库
+            pipeline = HealthCheckPipeline(checker, updater, history=health_history)
+            async with checker:
+                stats = await pipeline.run(
+                    check_nodes,
+                    on_progress=on_progress,
+                    cached_results=cached_results
+                )
+            
+            logger.info(f"📊 检测结果: 在线={stats.online}, 离线={stats.offline}, 可疑={stats.suspect}")
+            logger.info(f"🔁 端点去重: 探测 {stats.probes} 次，节省 {stats.probes_saved} 次")
+            logger.info(f"⚙️  并发控制: 当前={limiter.limit}, 峰值={limiter.peak_limit}, 上限={limiter.max_limit}")
+            logger.info(f"⏱️  分阶段耗时: {stats.timing_summary()}")
+            logger.info(f"✅ 数据库更新: 成功={stats.update_success}, 失败={stats.update_fail}")
             
             return {
                 "status": "completed",
-                "total": len(results),
-                "online": online_count,
-                "offline": offline_count,
-                "suspect": suspect_count,
-                "problem_nodes": problem_nodes,
-                "update_success": success,
-                "update_fail": fail
+                "total": stats.total,
+                "online": stats.online,
+                "offline": stats.offline,
+                "suspect": stats.suspect,
+                "problem_nodes": stats.problem_nodes,
+                "probes": stats.probes,
+                "probes_saved": stats.probes_saved,
+                "deadline_skipped": stats.deadline_skipped,
+                "fresh_skipped": stats.fresh_skipped,
+                "update_success": stats.update_success,
+                "update_fail": stats.update_fail,
+                "concurrency": limiter.snapshot(),
+                "timings": stats.timing_summary()
             }
             
         except ImportError as e:
@@ -367,6 +514,48 @@ class NodeService:
                 "message": str(e)
             }
     
+    @staticmethod
+    def _split_fresh(nodes: List[Dict], freshness, history) -> Tuple[List[Dict], List]:
+        """
+        按新鲜度拆分节点
+        
+        上次检测时间取内存健康历史与数据库 last_health_check 中较新的一个
+        
+        Returns:
+            (需要探测的节点, 跳过节点的上次结果)
+        """
+        from .health_checker import HealthCheckResult, NodeStatus, parse_check_time
+        
+        now = time.time()
+        stale: List[Dict] = []
+        cached = []
+        for node in nodes:
+            node_id = str(node.get("id", ""))
+            checked_ts = parse_check_time(node.get("last_health_check"))
+            status = node.get("status", "unknown")
+            latency = node.get("health_latency")
+            
+            latest = history.latest(node_id) if node_id else None
+            if latest and latest[0] >= checked_ts:
+                checked_ts, latency, status = latest
+            
+            if not node_id or not freshness.is_fresh(status, checked_ts, now):
+                stale.append(node)
+                continue
+            
+            cached.append(HealthCheckResult(
+                node_id=node_id,
+                host=node.get("host", ""),
+                port=node.get("port", 0),
+                status=NodeStatus(status),
+                tcp_ok=status != NodeStatus.OFFLINE.value,
+                http_ok=status == NodeStatus.ONLINE.value,
+                latency_ms=latency,
+                checked_at=datetime.utcfromtimestamp(checked_ts).isoformat(),
+                from_cache=True
+            ))
+        return stale, cached
+    
     async def get_health_check_stats(self) -> Dict:
         """
         获取健康检测统计数据
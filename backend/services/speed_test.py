@@ -0,0 +1,316 @@
+"""
+精确测速服务 - 全局准入控制、带宽预算与实时进度
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from datetime import datetime
+from typing import AsyncIterator, Deque, Dict, Optional
+
+import aiohttp
+
+from ..config import config
+from ..core.logger import logger
+
+MB = 1024 * 1024
+
+
+class SpeedTestBusyError(Exception):
+    """测速排队已满"""
+
+
+# ==================== 带宽预算 ====================
+
+class BandwidthBucket:
+    """
+    令牌桶：所有正在进行的测速共享一个字节速率预算
+
+    读取方先扣减令牌，余额为负时按欠额休眠。下载方暂停读取后 TCP 接收窗口
+    被填满，服务端随之降速，总带宽被限制在 rate 附近。rate 为 0 表示不限速。
+    """
+
+    def __init__(self, rate_bytes: float, burst_bytes: Optional[float] = None):
+        self.rate = rate_bytes
+        self.burst = burst_bytes if burst_bytes is not None else rate_bytes
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+
+    async def consume(self, amount: int) -> float:
+        """扣减 amount 字节，返回因限速而等待的秒数"""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= amount
+        if self._tokens >= 0:
+            return 0.0
+        delay = -self._tokens / self.rate
+        await asyncio.sleep(delay)
+        return delay
+
+
+# ==================== 准入控制 ====================
+
+class SpeedTestGovernor:
+    """
+    精确测速准入控制器
+
+    - 同时最多 max_concurrent 个测速，其余按 FIFO 排队，可查询排队位置
+    - 排队数超过 max_queue 时直接拒绝（SpeedTestBusyError）
+    - 所有测速共享 bandwidth 令牌桶，避免多个大文件下载占满实例带宽
+    """
+
+    def __init__(self, max_concurrent: int = 2, max_queue: int = 20, bandwidth_mb: float = 0.0):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max_queue
+        self.bandwidth = BandwidthBucket(bandwidth_mb * MB)
+        self._active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+        self.completed = 0
+        self.rejected = 0
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def enter(self) -> Optional[asyncio.Future]:
+        """
+        申请测速名额
+
+        Returns:
+            None 表示立即获得名额；否则返回排队 future，完成时即获得名额
+        """
+        if self._active < self.max_concurrent and not self._waiters:
+            self._active += 1
+            return None
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            raise SpeedTestBusyError(f"测速排队已满（{len(self._waiters)} 个等待中）")
+        waiter = asyncio.get_event_loop().create_future()
+        self._waiters.append(waiter)
+        return waiter
+
+    def position(self, waiter: asyncio.Future) -> int:
+        """排队位置（从 1 开始，已获得名额时为 0）"""
+        try:
+            return self._waiters.index(waiter) + 1
+        except ValueError:
+            return 0
+
+    def leave(self, waiter: Optional[asyncio.Future]):
+        """测速结束或客户端断开：已获得名额则归还，仍在排队则移出队列"""
+        if waiter is None or (waiter.done() and not waiter.cancelled()):
+            self._active = max(0, self._active - 1)
+            self.completed += 1
+            self._wake_waiters()
+            return
+        waiter.cancel()
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def _wake_waiters(self):
+        while self._waiters and self._active < self.max_concurrent:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self._active += 1
+                waiter.set_result(None)
+
+    def snapshot(self) -> Dict:
+        return {
+            "active": self._active,
+            "queued": len(self._waiters),
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "bandwidth_mb": round(self.bandwidth.rate / MB, 1),
+            "completed": self.completed,
+            "rejected": self.rejected
+        }
+
+
+# ==================== 测速执行 ====================
+
+def _event(name: str, **data) -> Dict:
+    return {"event": name, "data": data}
+
+
+def _result(status: str, message: str, **data) -> Dict:
+    return _event("result", status=status, message=message, timestamp=datetime.now().isoformat(), **data)
+
+
+async def precision_test_events(
+    test_file_size: int,
+    governor: Optional["SpeedTestGovernor"] = None
+) -> AsyncIterator[Dict]:
+    """
+    执行一次精确测速，依次产出事件：
+
+    - queued：排队中（position 变化时推送）
+    - started：获得名额，开始下载
+    - progress：已下载字节、瞬时/平均速度（MB/s）、首字节时间
+    - result：最终结果（字段与 /nodes/precision-test 的返回一致）
+
+    生成器被关闭（客户端断开）时自动归还名额或移出队列。
+    """
+    governor = governor or speed_governor
+    test_file_size = max(1, min(test_file_size, config.PRECISION_TEST_MAX_FILE_MB))
+
+    try:
+        waiter = governor.enter()
+    except SpeedTestBusyError as e:
+        yield _result("busy", f"{e}，请稍后重试", speed_mbps=0, retry_after=5)
+        return
+
+    try:
+        if waiter is not None:
+            last_position = None
+            while not waiter.done():
+                position = governor.position(waiter)
+                if position != last_position:
+                    last_position = position
+                    yield _event("queued", position=position, active=governor.active)
+                await asyncio.wait({waiter}, timeout=1.0)
+
+        yield _event("started", test_file_size_requested_mb=test_file_size)
+        async for event in _download(test_file_size, governor.bandwidth):
+            yield event
+    finally:
+        governor.leave(waiter)
+
+
+async def _download(test_file_size: int, bandwidth: BandwidthBucket) -> AsyncIterator[Dict]:
+    """下载测试文件，只统计长度不保留内容"""
+    test_file_url = config.PRECISION_TEST_URL.replace("{bytes}", str(test_file_size * MB))
+    chunk_size = config.PRECISION_TEST_CHUNK_SIZE
+    interval = config.PRECISION_TEST_PROGRESS_INTERVAL
+
+    start = time.monotonic()
+    bytes_downloaded = 0
+    ttfb_ms = None
+    throttled = 0.0
+    last_emit, last_bytes = start, 0
+
+    def summary() -> Dict:
+        elapsed = max(time.monotonic() - start, 0.001)
+        return {
+            "speed_mbps": round(bytes_downloaded / MB / elapsed, 2),
+            "download_time_seconds": round(elapsed, 2),
+            "traffic_consumed_mb": round(bytes_downloaded / MB, 2),
+            "bytes_downloaded": bytes_downloaded,
+            "test_file_size_requested_mb": test_file_size,
+            "ttfb_ms": ttfb_ms,
+            "throttled_seconds": round(throttled, 2)
+        }
+
+    try:
+        # 读缓冲与块大小一致：每次唤醒处理一大块，减少 Python 层循环次数；关闭解压避免额外拷贝
+        async with aiohttp.ClientSession(read_bufsize=chunk_size, auto_decompress=False) as session:
+            async with session.get(
+                test_file_url,
+                timeout=aiohttp.ClientTimeout(total=120, connect=10, sock_read=30),
+                ssl=False
+            ) as resp:
+                ttfb_ms = round((time.monotonic() - start) * 1000)
+                if resp.status != 200:
+                    logger.error(f"HTTP {resp.status} from {test_file_url}")
+                    raise Exception(f"HTTP {resp.status}")
+
+                async for chunk in resp.content.iter_chunked(chunk_size):
+                    size = len(chunk)
+                    bytes_downloaded += size
+                    throttled += await bandwidth.consume(size)
+
+                    now = time.monotonic()
+                    if now - last_emit >= interval:
+                        yield _event(
+                            "progress",
+                            bytes_downloaded=bytes_downloaded,
+                            total_bytes=test_file_size * MB,
+                            percent=round(min(100.0, bytes_downloaded / (test_file_size * MB) * 100), 1),
+                            instant_mbps=round((bytes_downloaded - last_bytes) / MB / (now - last_emit), 2),
+                            avg_mbps=round(bytes_downloaded / MB / (now - start), 2),
+                            ttfb_ms=ttfb_ms
+                        )
+                        last_emit, last_bytes = now, bytes_downloaded
+
+        data = summary()
+        logger.info(
+            f"✅ 精确测速完成 | 大小: {data['traffic_consumed_mb']:.1f}MB | "
+            f"时间: {data['download_time_seconds']:.1f}s | 速度: {data['speed_mbps']:.1f}MB/s"
+        )
+        yield _result("success", f"精确测速完成: {data['speed_mbps']:.1f} MB/s", **data)
+
+    except asyncio.TimeoutError:
+        logger.error(f"精确测速超时 (> 120秒)")
+        yield _result("timeout", "测速超时，请稍后重试", speed_mbps=0)
+
+    except Exception as e:
+        logger.error(f"精确测速下载失败: {e}")
+        if bytes_downloaded > 0:
+            data = summary()
+            yield _result("partial_success", f"部分测试: {data['speed_mbps']:.1f} MB/s", **data)
+        else:
+            yield _result("error", "测速失败: 无法连接到测速服务器", speed_mbps=0, latency=9999)
+
+
+# ==================== 自托管测速文件 ====================
+
+class SpeedTestPayload:
+    """
+    测速下载数据源
+
+    启动时预分配一个随机数据块（随机内容避免被代理或网关压缩），
+    每个请求只输出该块的 memoryview 切片，不拷贝、不按请求分配内存。
+    """
+
+    def __init__(self, block_size: int = 256 * 1024):
+        self._block = memoryview(os.urandom(block_size))
+        self.block_size = block_size
+
+    async def chunks(self, total: int) -> AsyncIterator[memoryview]:
+        """输出 total 字节"""
+        remaining = total
+        while remaining > 0:
+            size = min(remaining, self.block_size)
+            yield self._block if size == self.block_size else self._block[:size]
+            remaining -= size
+
+
+async def governed_chunks(payload: SpeedTestPayload, total: int, governor: SpeedTestGovernor) -> AsyncIterator[memoryview]:
+    """
+    按 governor 的带宽预算输出 total 字节
+
+    不负责归还名额：客户端在开始读取响应体之前断开时生成器根本不会运行，
+    名额须由响应对象（见 routes.GovernedStreamingResponse）在结束时归还
+    """
+    async for chunk in payload.chunks(total):
+        await governor.bandwidth.consume(len(chunk))
+        yield chunk
+
+
+# ==================== 全局实例 ====================
+
+speed_governor = SpeedTestGovernor(
+    max_concurrent=config.PRECISION_TEST_MAX_CONCURRENT,
+    max_queue=config.PRECISION_TEST_MAX_QUEUE,
+    bandwidth_mb=config.PRECISION_TEST_BANDWIDTH_MB
+)
+
+speed_payload = SpeedTestPayload(config.SPEEDTEST_BLOCK_SIZE)
+
+# 自托管测速文件的准入控制：不排队，名额用完直接拒绝（与精确测速分开，
+# PRECISION_TEST_URL 指向本服务时，精确测速占用的名额不会阻塞它自己的下载）
+speedtest_governor = SpeedTestGovernor(
+    max_concurrent=config.SPEEDTEST_MAX_CONCURRENT,
+    max_queue=0,
+    bandwidth_mb=config.SPEEDTEST_BANDWIDTH_MB
+)
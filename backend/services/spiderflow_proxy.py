@@ -0,0 +1,194 @@
+"""
+SpiderFlow 代理 - 共享连接池、短时缓存、请求合并与 stale-if-error
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import aiohttp
+
+from ..config import config
+from ..core.logger import logger
+from .dns_cache import CachedResolver, dns_cache
+
+
+class SpiderFlowUnavailableError(Exception):
+    """SpiderFlow 不可用且没有可用的过期缓存"""
+
+
+@dataclass
+class ProxyResponse:
+    """上游响应（原始字节，不解析 JSON）"""
+    status: int
+    body: bytes
+    content_type: str
+    fetched_at: float
+    cache: str = "MISS"  # HIT / MISS / STALE
+
+    @property
+    def age_seconds(self) -> float:
+        return time.monotonic() - self.fetched_at
+
+    @property
+    def age(self) -> int:
+        """Age 响应头（整秒）"""
+        return int(self.age_seconds)
+
+
+class SpiderFlowProxy:
+    """
+    SpiderFlow 代理客户端
+
+    - 共享一个 keep-alive 连接池，不再每次请求新建会话
+    - 上游响应体原样转发（字节 + Content-Type），不做 JSON 解码再编码
+    - 同一路径 + 参数的 200 响应缓存 cache_ttl 秒；并发的相同请求只向上游发一次
+    - 上游超时、网络错误或 5xx 时，返回 stale_ttl 秒内的过期缓存（cache=STALE），没有缓存才报错
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        cache_ttl: float = 10.0,
+        stale_ttl: float = 300.0,
+        timeout: float = 10.0,
+        max_entries: int = 256,
+        max_connections: int = 20
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.cache_ttl = cache_ttl
+        self.stale_ttl = stale_ttl
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self.max_connections = max_connections
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._cache: "OrderedDict[Tuple, ProxyResponse]" = OrderedDict()
+        self._inflight: Dict[Tuple, asyncio.Future] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.stale_served = 0
+        self.errors = 0
+
+    # ==================== 会话 ====================
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                resolver=CachedResolver(dns_cache),
+                use_dns_cache=False,
+                keepalive_timeout=30
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self._session
+
+    async def close(self):
+        """关闭连接池（应用关闭时调用）"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    # ==================== 代理入口 ====================
+
+    async def fetch(self, path: str, params: Optional[Dict[str, str]] = None) -> ProxyResponse:
+        """
+        获取 SpiderFlow 的 path
+
+        Raises:
+            SpiderFlowUnavailableError: 上游失败且没有 stale_ttl 内的缓存
+        """
+        key = (path, tuple(sorted((params or {}).items())))
+
+        cached = self._cache.get(key)
+        if cached is not None and cached.age_seconds < self.cache_ttl:
+            self.hits += 1
+            return ProxyResponse(cached.status, cached.body, cached.content_type, cached.fetched_at, "HIT")
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            result = await asyncio.shield(pending)
+            if result is not None:
+                self.hits += 1
+                return result
+
+        future = asyncio.get_event_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await self._fetch_or_stale(key, path, params)
+            future.set_result(result)
+            return result
+        except SpiderFlowUnavailableError as e:
+            # 等待方同样拿不到结果，直接收到同一错误，不再各自请求上游
+            future.set_exception(e)
+            future.exception()
+            raise
+        finally:
+            # 发起方被取消时通知等待方自行请求
+            if not future.done():
+                future.set_result(None)
+            self._inflight.pop(key, None)
+
+    async def _fetch_or_stale(self, key: Tuple, path: str, params: Optional[Dict[str, str]]) -> ProxyResponse:
+        self.misses += 1
+        try:
+            result = await self._request(path, params)
+        except Exception as e:
+            self.errors += 1
+            stale = self._cache.get(key)
+            if stale is not None and stale.age_seconds < self.stale_ttl:
+                self.stale_served += 1
+                logger.warning(f"⚠️  SpiderFlow {path} 不可用（{e}），返回 {stale.age}s 前的缓存")
+                return ProxyResponse(stale.status, stale.body, stale.content_type, stale.fetched_at, "STALE")
+            raise SpiderFlowUnavailableError(str(e) or type(e).__name__) from e
+
+        if result.status == 200:
+            self._store(key, result)
+        return result
+
+    async def _request(self, path: str, params: Optional[Dict[str, str]]) -> ProxyResponse:
+        async with self._get_session().get(f"{self.base_url}{path}", params=params) as resp:
+            body = await resp.read()
+            if resp.status >= 500:
+                raise aiohttp.ClientResponseError(
+                    resp.request_info, resp.history, status=resp.status, message=f"HTTP {resp.status}"
+                )
+            return ProxyResponse(
+                status=resp.status,
+                body=body,
+                content_type=resp.headers.get("Content-Type", "application/json"),
+                fetched_at=time.monotonic()
+            )
+
+    def _store(self, key: Tuple, result: ProxyResponse):
+        self._cache[key] = result
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    def snapshot(self) -> Dict:
+        return {
+            "cached": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale_served": self.stale_served,
+            "errors": self.errors,
+            "cache_ttl": self.cache_ttl,
+            "stale_ttl": self.stale_ttl
+        }
+
+
+# ==================== 全局实例 ====================
+
+spiderflow_proxy = SpiderFlowProxy(
+    base_url=config.SPIDERFLOW_API_URL,
+    cache_ttl=config.SPIDERFLOW_PROXY_CACHE_TTL,
+    stale_ttl=config.SPIDERFLOW_PROXY_STALE_TTL,
+    timeout=config.SPIDERFLOW_PROXY_TIMEOUT
+)
@@ -0,0 +1,340 @@
+"""
+Webhook 请求体读取 - 有界分步解压、增量 HMAC，验证签名后再增量解析 nodes 数组
+"""
+
+import asyncio
+import codecs
+import hmac
+import json
+import re
+import zlib
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:  # 未安装时不支持 zstd 压缩的推送
+    zstandard = None
+
+
+class WebhookBodyError(Exception):
+    """请求体无法读取（不支持的编码、超出大小限制、格式错误）"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+# ==================== 解压 ====================
+
+DECOMPRESS_STEP = 64 * 1024  # 每步解压输出上限（字节）
+
+
+class _DecodedSink:
+    """
+    解压输出：写入前检查累计大小，再更新 HMAC 并追加到缓冲区
+
+    缓冲区最多 max_bytes，超出时抛出 413；解压器据 remaining 决定下一步最多输出多少。
+    """
+
+    def __init__(self, mac: Optional["hmac.HMAC"], max_bytes: int):
+        self.mac = mac
+        self.max_bytes = max_bytes
+        self.buffer = bytearray()
+
+    @property
+    def remaining(self) -> int:
+        return self.max_bytes - len(self.buffer)
+
+    def write(self, data: bytes) -> int:
+        if len(data) > self.remaining:
+            raise WebhookBodyError(f"请求体解压后超过 {self.max_bytes // (1024 * 1024)}MB", status_code=413)
+        if data:
+            if self.mac is not None:
+                self.mac.update(data)
+            self.buffer += data
+        return len(data)
+
+
+class _Identity:
+    def __init__(self, sink: _DecodedSink):
+        self._sink = sink
+
+    def write(self, data: bytes):
+        self._sink.write(data)
+
+    def close(self):
+        pass
+
+
+class _Inflate:
+    """gzip / deflate：decompress(data, max_length) 分步解压，剩余输入在 unconsumed_tail 中继续"""
+
+    def __init__(self, sink: _DecodedSink, wbits: int, step: int = DECOMPRESS_STEP):
+        self._sink = sink
+        self._obj = zlib.decompressobj(wbits)
+        self.step = step
+
+    def write(self, data: bytes):
+        while True:
+            # 多要 1 字节：超出预算时由 sink 报 413，而不是继续分配
+            size = min(self.step, self._sink.remaining + 1)
+            out = self._obj.decompress(data, size)
+            data = self._obj.unconsumed_tail
+            self._sink.write(out)
+            if not data and len(out) < size:
+                return
+
+    def close(self):
+        self.write(b"")
+        self._sink.write(self._obj.flush())
+
+
+class _Zstd:
+    """zstd：stream_writer 每次最多向 sink 写 step 字节，sink 超出预算时中止解压"""
+
+    def __init__(self, sink: _DecodedSink, step: int = DECOMPRESS_STEP):
+        self._writer = zstandard.ZstdDecompressor().stream_writer(sink, write_size=step, closefd=False)
+
+    def write(self, data: bytes):
+        self._writer.write(data)
+
+    def close(self):
+        pass
+
+
+def make_decompressor(content_encoding: str, sink: _DecodedSink, step: int = DECOMPRESS_STEP):
+    """按 Content-Encoding 返回分步解压器（write / close），输出写入 sink"""
+    encoding = (content_encoding or "identity").strip().lower()
+    if encoding == "identity":
+        return _Identity(sink)
+    if encoding in ("gzip", "x-gzip"):
+        return _Inflate(sink, 16 + zlib.MAX_WBITS, step)
+    if encoding == "deflate":
+        return _Inflate(sink, zlib.MAX_WBITS, step)
+    if encoding == "zstd":
+        if zstandard is None:
+            raise WebhookBodyError("服务端未安装 zstandard，不支持 zstd 压缩", status_code=415)
+        return _Zstd(sink, step)
+    raise WebhookBodyError(f"不支持的 Content-Encoding: {content_encoding}", status_code=415)
+
+
+# ==================== 增量解析 ====================
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_NUMBER_TAIL = re.compile(r"[0-9.eE+\-]*")
+_INCOMPLETE = object()
+
+
+class NodesStreamParser:
+    """
+    增量解析 {"nodes": [...], ...} 形式的推送
+
+    按块 feed 文本，每解析出一个完整的 nodes 元素就返回；已解析的文本随即丢弃，
+    缓冲区只保留尚未完整的尾部。其他顶层字段放在 meta 中。
+    单个值用 json.JSONDecoder.raw_decode（C 实现）解码。
+    """
+
+    def __init__(self, key: str = "nodes"):
+        self.key = key
+        self.meta: Dict[str, Any] = {}
+        self._decoder = json.JSONDecoder()
+        self._buf = ""
+        self._pos = 0
+        self._state = "start"
+        self._current_key: Optional[str] = None
+
+    @property
+    def done(self) -> bool:
+        return self._state == "done"
+
+    def feed(self, text: str, eof: bool = False) -> List[Any]:
+        """追加文本，返回本次新解析出的 nodes 元素"""
+        self._buf = self._buf[self._pos:] + text
+        self._pos = 0
+        items: List[Any] = []
+        while self._step(items, eof):
+            pass
+        return items
+
+    def close(self) -> List[Any]:
+        """输入结束：解析剩余内容并确认 JSON 完整"""
+        items = self.feed("", eof=True)
+        if not self.done:
+            raise WebhookBodyError("请求体 JSON 不完整")
+        return items
+
+    def _decode(self, eof: bool) -> Any:
+        try:
+            value, end = self._decoder.raw_decode(self._buf, self._pos)
+        except json.JSONDecodeError as e:
+            if eof:
+                raise WebhookBodyError(f"请求体 JSON 格式错误: {e}")
+            return _INCOMPLETE
+        # 数字可能在下一块继续：块在 "4" 或 "4." 之后切开时 raw_decode 只读到 4
+        is_number = isinstance(value, (int, float)) and not isinstance(value, bool)
+        if not eof and is_number and _NUMBER_TAIL.fullmatch(self._buf, end):
+            return _INCOMPLETE
+        self._pos = end
+        return value
+
+    def _expect(self, char: str):
+        raise WebhookBodyError(f"请求体 JSON 格式错误: 位置 {self._pos} 处应为 {char!r}")
+
+    def _trailing_comma(self):
+        raise WebhookBodyError(f"请求体 JSON 格式错误: 位置 {self._pos} 前有多余的逗号")
+
+    def _step(self, items: List[Any], eof: bool) -> bool:
+        """推进一步，缓冲区不足以继续时返回 False"""
+        self._pos = _WHITESPACE.match(self._buf, self._pos).end()
+        if self._pos >= len(self._buf):
+            return False
+        char = self._buf[self._pos]
+        state = self._state
+
+        if state == "start":
+            if char != "{":
+                self._expect("{")
+            self._pos += 1
+            self._state = "key"
+        elif state in ("key", "next_key"):
+            if char == "}":
+                if state == "next_key":
+                    self._trailing_comma()
+                self._pos += 1
+                self._state = "done"
+                return True
+            if char != '"':
+                self._expect('"')
+            key = self._decode(eof)
+            if key is _INCOMPLETE:
+                return False
+            self._current_key = key
+            self._state = "colon"
+        elif state == "colon":
+            if char != ":":
+                self._expect(":")
+            self._pos += 1
+            self._state = "array" if self._current_key == self.key else "value"
+        elif state == "array":
+            if char != "[":
+                self._expect("[")
+            self._pos += 1
+            self._state = "item"
+        elif state in ("item", "next_item"):
+            if char == "]" and state == "item":
+                self._pos += 1
+                self._state = "after_value"
+                return True
+            if char == "]":
+                self._trailing_comma()
+            item = self._decode(eof)
+            if item is _INCOMPLETE:
+                return False
+            items.append(item)
+            self._state = "item_sep"
+        elif state == "item_sep":
+            if char == ",":
+                self._state = "next_item"
+            elif char == "]":
+                self._state = "after_value"
+            else:
+                self._expect(",")
+            self._pos += 1
+        elif state == "value":
+            value = self._decode(eof)
+            if value is _INCOMPLETE:
+                return False
+            self.meta[self._current_key] = value
+            self._state = "after_value"
+        elif state == "after_value":
+            if char == ",":
+                self._state = "next_key"
+            elif char == "}":
+                self._state = "done"
+            else:
+                self._expect(",")
+            self._pos += 1
+        else:
+            raise WebhookBodyError("请求体 JSON 末尾有多余内容")
+        return True
+
+
+# ==================== 读取 ====================
+
+@dataclass
+class WebhookBody:
+    """一次推送的读取结果（解压后的原始字节，尚未解析）"""
+    payload: bytearray = field(repr=False)
+    raw_bytes: int
+
+    @property
+    def decoded_bytes(self) -> int:
+        return len(self.payload)
+
+
+async def read_webhook_body(
+    chunks: AsyncIterator[bytes],
+    content_encoding: str = "",
+    mac: Optional["hmac.HMAC"] = None,
+    max_bytes: int = 64 * 1024 * 1024
+) -> WebhookBody:
+    """
+    流式读取推送：边接收边分步解压、边更新 HMAC，解压结果写入最多 max_bytes 的缓冲区
+
+    HMAC 在解压后的原始字节上增量计算（与 SpiderFlow 对 JSON 文本签名一致）。
+    每步解压输出不超过 DECOMPRESS_STEP，且在分配下一步之前检查累计大小，
+    压缩炸弹最多解压到 max_bytes 就会被拒绝（413）。
+    此处不解析 JSON：调用方验证签名后再用 parse_webhook_nodes 解析。
+
+    Raises:
+        WebhookBodyError: 编码不支持（415）、超出大小（413）或解压失败（400）
+    """
+    sink = _DecodedSink(mac, max_bytes)
+    decompressor = make_decompressor(content_encoding, sink)
+    raw_bytes = 0
+
+    try:
+        async for chunk in chunks:
+            if not chunk:
+                continue
+            raw_bytes += len(chunk)
+            if raw_bytes > max_bytes:
+                raise WebhookBodyError(f"请求体超过 {max_bytes // (1024 * 1024)}MB", status_code=413)
+            decompressor.write(chunk)
+        decompressor.close()
+    except zlib.error as e:
+        raise WebhookBodyError(f"请求体解压失败: {e}")
+    except Exception as e:
+        if zstandard is not None and isinstance(e, zstandard.ZstdError):
+            raise WebhookBodyError(f"请求体解压失败: {e}")
+        raise
+
+    return WebhookBody(payload=sink.buffer, raw_bytes=raw_bytes)
+
+
+async def parse_webhook_nodes(
+    payload: bytes,
+    chunk_size: int = 1024 * 1024
+) -> Tuple[List[Any], Dict[str, Any]]:
+    """
+    解析已验证签名的推送，返回 (nodes, 其他顶层字段)
+
+    按 chunk_size 分片增量解码，不生成完整的 JSON 字符串；分片之间让出事件循环。
+
+    Raises:
+        WebhookBodyError: 不是有效的 UTF-8 或 JSON 格式错误（400）
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    parser = NodesStreamParser()
+    nodes: List[Any] = []
+    view = memoryview(payload)
+    try:
+        for i in range(0, len(view), chunk_size):
+            nodes.extend(parser.feed(decoder.decode(view[i:i + chunk_size])))
+            await asyncio.sleep(0)
+        nodes.extend(parser.feed(decoder.decode(b"", final=True)))
+    except UnicodeDecodeError as e:
+        raise WebhookBodyError(f"请求体不是有效的 UTF-8: {e}")
+    nodes.extend(parser.close())
+    return nodes, parser.meta
@@ -0,0 +1,35 @@
+"""
+Webhook 数据模型定义
+"""
+
+from pydantic import BaseModel
+from typing import List, Optional
+
+# ==================== 数据模型 ====================
+
+class NodeData(BaseModel):
+    """节点数据模型"""
+    protocol: str
+    host: str
+    port: int
+    name: str
+    country: str
+    mainland_score: Optional[int] = 0
+    mainland_latency: Optional[int] = 9999
+    overseas_score: Optional[int] = 0
+    overseas_latency: Optional[int] = 9999
+    link: Optional[str] = ""
+    is_free: Optional[bool] = False
+
+
+class WebhookPayload(BaseModel):
+    """Webhook 负载模型"""
+    nodes: List[NodeData]
+    timestamp: str
+
+
+class WebhookSignature(BaseModel):
+    """Webhook 签名模型"""
+    payload_str: str
+    timestamp: str
+    signature: str
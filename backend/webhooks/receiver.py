@@ -2,9 +2,8 @@
 Webhook 接收和处理 - 复制自 webhook_receiver.py
 """
 
-from fastapi import APIRouter, Request, HTTPException, BackgroundTasks
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from fastapi import APIRouter, Request, HTTPException
+from typing import List, Optional, Dict, Any, Union
 import json
 import hashlib
 import hmac
@@ -14,127 +13,175 @@ import aiohttp
 from datetime import datetime
 import os
 
-logger = logging.getLogger(__name__)
-
-# ==================== 数据模型 ====================
-
-class NodeData(BaseModel):
-    """节点数据模型"""
-    protocol: str
-    host: str
-    port: int
-    name: str
-    country: str
-    mainland_score: Optional[int] = 0
-    mainland_latency: Optional[int] = 9999
-    overseas_score: Optional[int] = 0
-    overseas_latency: Optional[int] = 9999
-    link: Optional[str] = ""
-    is_free: Optional[bool] = False
+from .body import WebhookBodyError, parse_webhook_nodes, read_webhook_body
+from .models import NodeData, WebhookPayload, WebhookSignature
+from .replay import is_fresh_timestamp, parse_webhook_timestamp, replay_cache
+from ..config import config
+from ..services.ingest_queue import ingest_queue, IngestQueueFullError
 
+logger = logging.getLogger(__name__)
 
-class WebhookPayload(BaseModel):
-    """Webhook 负载模型"""
-    nodes: List[NodeData]
-    timestamp: str
+# ==================== 工具函数 ====================
 
+def webhook_signer() -> Optional["hmac.HMAC"]:
+    """
+    创建增量 HMAC-SHA256 对象（WEBHOOK_SECRET 未配置时返回 None）
 
-class WebhookSignature(BaseModel):
-    """Webhook 签名模型"""
-    payload_str: str
-    timestamp: str
-    signature: str
+    读取请求体时逐块 update，避免为签名保留完整的请求体
+    """
+    webhook_secret = os.environ.get("WEBHOOK_SECRET", "")
+    if not webhook_secret:
+        return None
+    return hmac.new(webhook_secret.encode(), digestmod=hashlib.sha256)
 
 
-# ==================== 工具函数 ====================
-
-def verify_webhook_signature(payload_str: str, timestamp: str, signature: str) -> bool:
+def verify_webhook_signature(
+    payload: Union[bytes, "hmac.HMAC", None],
+    timestamp: str,
+    signature: str,
+    tolerance: Optional[float] = None
+) -> bool:
     """
     验证 Webhook 签名
     
-    使用 HMAC-SHA256 验证，防止伪造请求
+    使用 HMAC-SHA256 验证，防止伪造请求。待签名内容为 payload + timestamp；
+    payload 可以是完整的请求体字节，也可以是已逐块 update 过请求体的 webhook_signer()。
+    timestamp 与当前时间相差超过 tolerance 秒（默认 WEBHOOK_TIMESTAMP_TOLERANCE）时拒绝，防止重放旧推送
     """
-    webhook_secret = os.environ.get("WEBHOOK_SECRET", "")
+    if not is_fresh_timestamp(timestamp, config.WEBHOOK_TIMESTAMP_TOLERANCE if tolerance is None else tolerance):
+        return False
     
-    if not webhook_secret:
+    if isinstance(payload, (bytes, bytearray)):
+        mac = webhook_signer()
+        if mac is not None:
+            mac.update(payload)
+    else:
+        mac = payload
+    
+    if mac is None:
         logger.warning("⚠️ WEBHOOK_SECRET 未配置，无法验证签名")
         return False
     
-    # 构造待签名的字符串：payload + timestamp
-    message = f"{payload_str}{timestamp}".encode()
-    
-    # 计算签名
-    expected_signature = hmac.new(
-        webhook_secret.encode(),
-        message,
-        hashlib.sha256
-    ).hexdigest()
+    # 追加 timestamp 后计算签名
+    mac.update(timestamp.encode())
+    expected_signature = mac.hexdigest()
     
     # 比对签名（使用恒定时间比较防止时间攻击）
     return hmac.compare_digest(signature, expected_signature)
 
 
+def duplicate_response() -> Dict[str, Any]:
+    """重复推送的确认（200，不再处理）"""
+    logger.info("♻️  重复的 Webhook 推送，已忽略")
+    return {
+        "status": "duplicate",
+        "message": "重复推送，已忽略",
+        "timestamp": datetime.now().isoformat()
+    }
+
+
 # ==================== Webhook 路由 ====================
 
 router = APIRouter(prefix="/webhooks")
 
 
 @router.post("/nodes")
-async def webhook_nodes(request: Request, background_tasks: BackgroundTasks):
+async def webhook_nodes(request: Request):
     """
     接收节点数据 Webhook
     
-    来自 SpiderFlow 的 Webhook，推送最新节点数据
+    来自 SpiderFlow 的 Webhook，推送最新节点数据。支持 Content-Encoding: gzip / zstd，
+    请求体边接收边分步解压、计算签名，解压结果最多缓冲 WEBHOOK_MAX_BODY_BYTES；签名验证通过后才解析 JSON。
+    验证签名后放入有界入库队列立即返回；队列已满时返回 429 和 Retry-After。
+    时间戳超出容忍窗口返回 401；同一签名或 X-Webhook-Delivery 的重复推送返回 200（status=duplicate），不再处理
     """
     try:
-        # 读取请求体
-        body = await request.body()
-        payload_str = body.decode('utf-8')
-        
         # 获取签名头
         timestamp = request.headers.get("X-Webhook-Timestamp", "")
         signature = request.headers.get("X-Webhook-Signature", "")
         
+        content_length = request.headers.get("Content-Length", "")
+        if content_length.isdigit() and int(content_length) > config.WEBHOOK_MAX_BODY_BYTES:
+            raise HTTPException(status_code=413, detail="Payload too large")
+        
+        delivery_id = request.headers.get("X-Webhook-Delivery", "")
+        replay_keys = (signature, delivery_id)
+        
+        # 过期的时间戳直接拒绝，不读取请求体
+        if not is_fresh_timestamp(timestamp, config.WEBHOOK_TIMESTAMP_TOLERANCE):
+            replay_cache.stale += 1
+            logger.warning(f"❌ Webhook 时间戳已过期或无效: {timestamp!r}")
+            raise HTTPException(status_code=401, detail="Stale or invalid timestamp")
+        
+        # 已接受过的推送（SpiderFlow 超时重试）直接确认，不读取请求体
+        if replay_cache.seen(replay_keys):
+            return duplicate_response()
+        
+        # 未配置密钥时无法验证签名，不读取请求体
+        mac = webhook_signer()
+        if mac is None:
+            logger.warning("⚠️ WEBHOOK_SECRET 未配置，无法验证签名")
+            raise HTTPException(status_code=401, detail="Invalid signature")
+        
+        # 流式读取：边接收边解压（gzip / zstd）、边计算签名，此时不解析
+        try:
+            body = await read_webhook_body(
+                request.stream(),
+                content_encoding=request.headers.get("Content-Encoding", ""),
+                mac=mac,
+                max_bytes=config.WEBHOOK_MAX_BODY_BYTES
+            )
+        except WebhookBodyError as e:
+            logger.warning(f"❌ Webhook 请求体读取失败: {e}")
+            raise HTTPException(status_code=e.status_code, detail=str(e))
+        
         # 验证签名
-        if not verify_webhook_signature(payload_str, timestamp, signature):
+        if not verify_webhook_signature(mac, timestamp, signature):
             logger.warning("❌ Webhook 签名验证失败")
             raise HTTPException(status_code=401, detail="Invalid signature")
         
-        # 解析 JSON
-        payload = json.loads(payload_str)
-        nodes_data = payload.get("nodes", [])
+        # 读取请求体期间同一推送的并发重试可能已入队
+        if replay_cache.seen(replay_keys):
+            return duplicate_response()
         
-        logger.info(f"✅ 收到 Webhook 推送: {len(nodes_data)} 个节点")
+        # 签名验证通过后才解析 JSON
+        try:
+            nodes_data, _ = await parse_webhook_nodes(body.payload)
+        except WebhookBodyError as e:
+            logger.warning(f"❌ Webhook 请求体解析失败: {e}")
+            raise HTTPException(status_code=e.status_code, detail=str(e))
         
-        # 异步后台处理
-        background_tasks.add_task(process_webhook_nodes, nodes_data)
+        logger.info(
+            f"✅ 收到 Webhook 推送: {len(nodes_data)} 个节点 "
+            f"({body.raw_bytes / 1024:.0f}KB → {body.decoded_bytes / 1024:.0f}KB)"
+        )
+        
+        # 放入入库队列，由 worker 异步处理
+        try:
+            ingest_queue.submit(
+                nodes_data,
+                snapshot_ts=parse_webhook_timestamp(timestamp),
+                on_failed=lambda: replay_cache.discard(replay_keys)
+            )
+        except IngestQueueFullError as e:
+            logger.warning(f"⚠️  {e}，要求 {e.retry_after}s 后重试")
+            raise HTTPException(
+                status_code=429,
+                detail=str(e),
+                headers={"Retry-After": str(e.retry_after)}
+            )
+        # 入队即记录（处理期间的重试直接确认）；入库失败时 on_failed 撤销记录
+        replay_cache.add(replay_keys)
         
         return {
             "status": "received",
             "message": f"已接收 {len(nodes_data)} 个节点",
+            "queue_depth": ingest_queue.depth,
             "timestamp": datetime.now().isoformat()
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"❌ Webhook 处理失败: {e}")
         raise HTTPException(status_code=400, detail=str(e))
-
-
-async def process_webhook_nodes(nodes_data: List[Dict]):
-    """
-    后台处理 Webhook 节点数据
-    
-    将节点数据同步到 Supabase
-    """
-    try:
-        logger.info(f"🔄 开始处理 {len(nodes_data)} 个节点...")
-        
-        # TODO: 实现数据同步逻辑
-        # - 去重
-        # - 数据验证
-        # - 更新 Supabase
-        
-        logger.info(f"✅ 处理完成")
-        
-    except Exception as e:
-        logger.error(f"❌ 处理节点数据失败: {e}")
@@ -0,0 +1,111 @@
+"""
+Webhook 重放保护 - 时间戳新鲜度检查与最近推送的幂等缓存
+"""
+
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional
+
+from ..config import config
+
+
+def parse_webhook_timestamp(timestamp: str) -> Optional[float]:
+    """解析 X-Webhook-Timestamp：Unix 秒 / 毫秒，或 ISO 8601（无时区按 UTC）；无法解析时返回 None"""
+    value = (timestamp or "").strip()
+    if not value:
+        return None
+    try:
+        ts = float(value)
+        return ts / 1000 if ts > 1e12 else ts
+    except ValueError:
+        pass
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def is_fresh_timestamp(timestamp: str, tolerance: float, now: Optional[float] = None) -> bool:
+    """时间戳与当前时间相差不超过 tolerance 秒（tolerance <= 0 表示不检查）"""
+    if tolerance <= 0:
+        return True
+    ts = parse_webhook_timestamp(timestamp)
+    if ts is None:
+        return False
+    return abs((now if now is not None else time.time()) - ts) <= tolerance
+
+
+class ReplayCache:
+    """
+    最近接受的推送（有界 LRU + TTL，按接受时间淘汰）
+
+    键为签名和投递 ID（X-Webhook-Delivery），任一命中即视为重复推送。
+    只有签名验证通过且成功入队的推送才会记录，验证失败或 429 的推送重试时仍会正常处理；
+    入库失败时接收端调用 discard 撤销记录，SpiderFlow 重试同一推送时会重新入库。
+    ttl 取时间戳容忍窗口的两倍（时间戳允许前后偏差）：更早的重放已被时间戳检查拒绝，无需继续保留。
+    """
+
+    def __init__(self, max_entries: int = 4096, ttl: float = 300.0):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+
+        self.hits = 0
+        self.stale = 0
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def _expire(self, now: float):
+        if self.ttl <= 0:
+            return
+        while self._seen:
+            key, seen_at = next(iter(self._seen.items()))
+            if now - seen_at <= self.ttl:
+                break
+            self._seen.popitem(last=False)
+
+    def seen(self, keys: Iterable[Optional[str]]) -> bool:
+        now = time.monotonic()
+        self._expire(now)
+        for key in keys:
+            if key and key in self._seen:
+                self.hits += 1
+                return True
+        return False
+
+    def add(self, keys: Iterable[Optional[str]]):
+        now = time.monotonic()
+        for key in keys:
+            if not key:
+                continue
+            self._seen[key] = now
+            self._seen.move_to_end(key)
+        while len(self._seen) > self.max_entries:
+            self._seen.popitem(last=False)
+
+    def discard(self, keys: Iterable[Optional[str]]):
+        for key in keys:
+            if key:
+                self._seen.pop(key, None)
+
+    def snapshot(self) -> Dict:
+        return {
+            "entries": len(self._seen),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "duplicates": self.hits,
+            "stale": self.stale
+        }
+
+
+# ==================== 全局实例 ====================
+
+replay_cache = ReplayCache(
+    max_entries=config.WEBHOOK_REPLAY_CACHE_SIZE,
+    ttl=2 * config.WEBHOOK_TIMESTAMP_TOLERANCE
+)
@@ -57,7 +57,9 @@ export const nodeApi = {
         is_free: node.is_free !== false,
         status: node.status || 'online',  // 健康状态：online/suspect/offline
         last_health_check: node.last_health_check || null,
-        health_latency: node.health_latency || null
+        health_latency: node.health_latency || null,
+        health_metrics: node.health_metrics || null,  // 可用率、p50/p95 延迟、抖动
+        health_score: node.health_score ?? null
       }))
       
       return nodes
@@ -104,7 +106,9 @@ export const nodeApi = {
         status: node.status || 'online',
         last_health_check: node.last_health_check || null,
         quality_score: node.quality_score || 50,
-        source_channel: node.source_channel || null
+        source_channel: node.source_channel || null,
+        health_metrics: node.health_metrics || null,
+        health_score: node.health_score ?? null
       }))
       
       return nodes
@@ -150,8 +154,58 @@ export const nodeApi = {
 
   /**
    * 精确测速 - 用户发起的测速
+   *
+   * 浏览器支持 EventSource 时走 SSE 接口，通过 onProgress 推送实时进度：
+   *   { event: 'queued', position } / { event: 'started' } /
+   *   { event: 'progress', percent, bytes_downloaded, instant_mbps, avg_mbps, ttfb_ms }
+   * signal 触发 abort 时关闭连接，后端随即释放测速名额
    */
-  async precisionSpeedTest(node, fileSizeMs = 50) {
+  async precisionSpeedTest(node, fileSizeMs = 50, { onProgress, signal } = {}) {
+    if (typeof EventSource === 'undefined') {
+      return await this.precisionSpeedTestOnce(node, fileSizeMs)
+    }
+
+    return await new Promise((resolve) => {
+      const source = new EventSource(
+        `${VIPER_API_BASE}/nodes/precision-test/stream?test_file_size=${fileSizeMs}`
+      )
+      let settled = false
+
+      const finish = (result) => {
+        if (settled) return
+        settled = true
+        source.close()
+        resolve(result)
+      }
+
+      for (const name of ['queued', 'started', 'progress']) {
+        source.addEventListener(name, (e) => {
+          if (onProgress) onProgress({ event: name, ...JSON.parse(e.data) })
+        })
+      }
+      source.addEventListener('result', (e) => finish(JSON.parse(e.data)))
+
+      // 连接失败或中途断开（EventSource 默认会自动重连，这里直接结束）
+      source.onerror = () => finish({
+        status: 'error',
+        speed_mbps: 0,
+        message: '测速失败: 与服务器的连接中断'
+      })
+
+      if (signal) {
+        signal.addEventListener('abort', () => finish({
+          status: 'cancelled',
+          speed_mbps: 0,
+          message: '测速已取消'
+        }))
+      }
+    })
+  },
+
+  /**
+   * 精确测速（一次性返回结果，不推送进度）
+   */
+  async precisionSpeedTestOnce(node, fileSizeMs = 50) {
     try {
       // 构建代理URL：优先使用link，否则基于host:port生成
       let proxyUrl = node.link
@@ -183,14 +237,14 @@ export const nodeApi = {
   },
 
   /**
-   * 延迟测试
+   * 延迟测试（后端复用连接多次采样，返回 stats: min/avg/p90/jitter 与 phases 分阶段耗时）
    */
-  async latencyTest(proxyUrl) {
+  async latencyTest(proxyUrl, samples = null) {
     try {
       const response = await fetch(`${VIPER_API_BASE}/nodes/latency-test`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ proxy_url: proxyUrl })
+        body: JSON.stringify({ proxy_url: proxyUrl, samples })
       })
 
       if (!response.ok) throw new Error(`HTTP ${response.status}`)
@@ -199,6 +253,48 @@ export const nodeApi = {
       console.error('❌ 延迟测试失败:', error)
       return { status: 'error', latency: 9999 }
     }
+  },
+
+  /**
+   * 批量延迟测试 - 一次请求测试多个节点，结果按完成顺序逐行（NDJSON）返回
+   * targets: [{ id, proxy_url }]，每完成一个调用 onResult(result)
+   * 返回全部结果数组
+   */
+  async latencyTestBatch(targets, { samples = null, onResult } = {}) {
+    const results = []
+    try {
+      const response = await fetch(`${VIPER_API_BASE}/nodes/latency-test/batch`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ targets, samples })
+      })
+      if (!response.ok) throw new Error(`HTTP ${response.status}`)
+
+      const reader = response.body.getReader()
+      const decoder = new TextDecoder()
+      let buffer = ''
+
+      const handleLine = (line) => {
+        if (!line.trim()) return
+        const item = JSON.parse(line)
+        if (item.done) return
+        results.push(item)
+        if (onResult) onResult(item)
+      }
+
+      while (true) {
+        const { done, value } = await reader.read()
+        if (done) break
+        buffer += decoder.decode(value, { stream: true })
+        const lines = buffer.split('\n')
+        buffer = lines.pop()
+        lines.forEach(handleLine)
+      }
+      handleLine(buffer)
+    } catch (error) {
+      console.error('❌ 批量延迟测试失败:', error)
+    }
+    return results
   }
 }
 
@@ -207,10 +303,12 @@ export const nodeApi = {
  */
 export const healthCheckApi = {
   /**
-   * 检测所有节点的健康状态（仅限管理员）
+   * 提交健康检测任务（仅限管理员）
+   * 后端立即返回任务信息，需通过 getJob 轮询进度
    * @param {string} source - 数据源: 'overseas' 或 'china'
+   * @param {boolean} force - 是否忽略新鲜度窗口，全部重新探测
    */
-  async checkAll(source = 'overseas') {
+  async checkAll(source = 'overseas', force = false) {
     try {
       const userId = getUserId()
       const headers = {
@@ -227,19 +325,20 @@ export const healthCheckApi = {
         headers,
         body: JSON.stringify({ 
           check_all: true,
-          source: source
+          source: source,
+          force: force  // true 时忽略新鲜度窗口，全部重新探测
         })
       })
 
       if (!response.ok) throw new Error(`HTTP ${response.status}`)
       const result = await response.json()
       
-      // 统一返回格式
+      // 统一返回格式（data 为任务信息，含 job_id）
       if (result.status === 'success' && result.data) {
         return {
           status: 'success',
           data: result.data,
-          message: '检测成功'
+          message: result.deduplicated ? '已有进行中的检测任务' : '任务已提交'
         }
       } else {
         return {
@@ -256,6 +355,47 @@ export const healthCheckApi = {
     }
   },
 
+  /**
+   * 查询健康检测任务进度（仅限管理员）
+   * @param {string} jobId - 任务ID
+   */
+  async getJob(jobId) {
+    try {
+      const userId = getUserId()
+      const headers = userId ? { 'X-User-ID': userId } : {}
+      
+      const response = await fetch(`${VIPER_API_BASE}/health-check/jobs/${jobId}`, { headers })
+      if (!response.ok) throw new Error(`HTTP ${response.status}`)
+      const result = await response.json()
+      return { status: 'success', data: result.data }
+    } catch (error) {
+      console.error('❌ 查询健康检测任务失败:', error)
+      return { status: 'error', message: error.message }
+    }
+  },
+
+  /**
+   * 取消健康检测任务（仅限管理员）
+   * @param {string} jobId - 任务ID
+   */
+  async cancelJob(jobId) {
+    try {
+      const userId = getUserId()
+      const headers = userId ? { 'X-User-ID': userId } : {}
+      
+      const response = await fetch(`${VIPER_API_BASE}/health-check/jobs/${jobId}`, {
+        method: 'DELETE',
+        headers
+      })
+      if (!response.ok) throw new Error(`HTTP ${response.status}`)
+      const result = await response.json()
+      return { status: 'success', data: result.data }
+    } catch (error) {
+      console.error('❌ 取消健康检测任务失败:', error)
+      return { status: 'error', message: error.message }
+    }
+  },
+
   /**
    * 获取健康检测统计信息
    */
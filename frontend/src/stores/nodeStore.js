@@ -177,8 +177,28 @@ export const useNodeStore = defineStore('nodes', () => {
   /**
    * 精确测速
    */
-  async function precisionTest(node, fileSizeMs = 50) {
-    return await nodeApi.precisionSpeedTest(node, fileSizeMs)
+  async function precisionTest(node, fileSizeMs = 50, options = {}) {
+    return await nodeApi.precisionSpeedTest(node, fileSizeMs, options)
+  }
+
+  /**
+   * 批量延迟测试：一次请求测试多个节点，每返回一个结果就更新对应节点的延迟
+   */
+  async function latencyTestBatch(targetNodes, samples = null) {
+    const targets = targetNodes.map(n => ({
+      id: n.id,
+      proxy_url: n.link || `${n.protocol || 'socks5'}://${n.host}:${n.port}`
+    }))
+    return await nodeApi.latencyTestBatch(targets, {
+      samples,
+      onResult: (result) => {
+        if (result.status !== 'success') return
+        for (const list of [nodes.value, allNodesBackup.value]) {
+          const node = list.find(n => n.id === result.id)
+          if (node) node.latency = result.latency
+        }
+      }
+    })
   }
 
   /**
@@ -217,6 +237,7 @@ export const useNodeStore = defineStore('nodes', () => {
     updateNodeSpeed,
     getNode,
     precisionTest,
+    latencyTestBatch,
     clearFilters
   }
 })
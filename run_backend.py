@@ -16,6 +16,7 @@ if root_dir not in sys.path:
 if __name__ == "__main__":
     # 启动后端（使用模块导入方式）
     from backend.main import app, config, logger
+    from backend.core.loop_monitor import select_event_loop
     import uvicorn
     
     logger.info("=" * 60)
@@ -28,5 +29,6 @@ if __name__ == "__main__":
         host=config.HOST,
         port=config.PORT,
         reload=config.RELOAD,
+        loop=select_event_loop(),
         log_level=config.LOG_LEVEL.lower()
     )
@@ -0,0 +1,18 @@
+-- 为节点表添加分阶段健康检测耗时字段
+-- 健康检测写入格式: {"dns": 12, "tcp": 85, "tls": 170, "ttfb": null}（毫秒，未测量的阶段为 null）
+-- 执行此脚本后设置环境变量 HEALTH_PERSIST_TIMINGS=true 开启写入
+
+-- 1. 海外节点表
+ALTER TABLE public.nodes
+ADD COLUMN IF NOT EXISTS health_timings JSONB;
+
+-- 2. 大陆节点表
+ALTER TABLE public.telegram_nodes
+ADD COLUMN IF NOT EXISTS health_timings JSONB;
+
+-- 3. 查看 TLS 握手最慢的节点
+-- SELECT id, health_latency, health_timings
+-- FROM public.nodes
+-- WHERE health_timings->>'tls' IS NOT NULL
+-- ORDER BY (health_timings->>'tls')::int DESC
+-- LIMIT 20;
@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+健康检测基准测试：本地模拟节点 + LightweightHealthChecker.check_nodes_batch
+
+模拟节点在独立子进程中运行（不占用检测进程的 CPU 和 fd），行为类型：
+    tcp        - 内核完成握手，不做任何应用层响应（vmess 等）       期望 online
+    refused    - 端口只绑定不监听，立即拒绝                             期望 offline
+    blackhole  - 监听队列已满，SYN 被丢弃，连接超时                 期望 offline
+    http       - HTTP 节点，立即返回 204                           期望 online
+    slow_http  - HTTP 节点，延迟 --http-delay 毫秒后返回            期望 online
+    tls        - trojan 节点，立即完成 TLS 握手                    期望 online
+    slow_tls   - trojan 节点，延迟 --tls-delay 毫秒后开始 TLS 握手  期望 online
+    tls_fail   - trojan 节点，端口上不是 TLS 服务                   期望 suspect
+
+报告吞吐（节点/秒、探测/秒）、总耗时、检测进程 fd 峰值、状态判定准确率，并写入 JSON，
+便于在不同改动之间对比。
+
+用法:
+    python scripts/bench_health_checker.py --nodes 2000
+    python scripts/bench_health_checker.py --nodes 5000 --mix tcp=0.5,refused=0.2,blackhole=0.1,tls=0.2 --output before.json
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import ssl
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if root_dir not in sys.path:
+    sys.path.insert(0, root_dir)
+
+from backend.config import config
+from backend.core.loop_monitor import LoopLagMonitor, install_event_loop_policy
+from backend.services.concurrency import AdaptiveLimiter
+from backend.services.health_checker import (
+    LightweightHealthChecker,
+    HealthCheckStats,
+    RetryPolicy
+)
+
+DEFAULT_MIX = "tcp=0.35,refused=0.15,blackhole=0.05,http=0.1,slow_http=0.1,tls=0.1,slow_tls=0.1,tls_fail=0.05"
+
+# 类型 → (协议, 是否 TLS 链接, 期望状态)
+CATEGORIES = {
+    "tcp": ("vmess", False, "online"),
+    "refused": ("vmess", False, "offline"),
+    "blackhole": ("vmess", False, "offline"),
+    "http": ("http", False, "online"),
+    "slow_http": ("http", False, "online"),
+    "tls": ("trojan", True, "online"),
+    "slow_tls": ("trojan", True, "online"),
+    "tls_fail": ("trojan", True, "suspect")
+}
+
+
+# ==================== 模拟节点（子进程） ====================
+
+def _make_tls_context() -> ssl.SSLContext:
+    """生成临时自签证书（需要 openssl 命令）"""
+    workdir = tempfile.mkdtemp(prefix="bench-tls-")
+    cert, key = os.path.join(workdir, "cert.pem"), os.path.join(workdir, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-keyout", key,
+         "-out", cert, "-days", "1", "-subj", "/CN=bench.local"],
+        check=True, capture_output=True
+    )
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    return context
+
+
+def _listen(backlog: int = 4096) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(backlog)
+    sock.setblocking(False)
+    return sock
+
+
+class FakeEndpoints:
+    """在一个事件循环里运行全部模拟节点"""
+
+    def __init__(self, http_delay: float, tls_delay: float):
+        self.http_delay = http_delay
+        self.tls_delay = tls_delay
+        self.tls_context = None
+        self.keep = []
+
+    async def create(self, category: str) -> int:
+        if category == "tcp":
+            sock = _listen()
+            self.keep.append(sock)
+            return sock.getsockname()[1]
+
+        if category == "refused":
+            # 只绑定不监听：端口被占住（不会被其他模拟节点复用），连接被内核拒绝
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.bind(("127.0.0.1", 0))
+            self.keep.append(sock)
+            return sock.getsockname()[1]
+
+        if category == "blackhole":
+            # backlog 为 0 并预先占满，之后的 SYN 都会被丢弃
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.bind(("127.0.0.1", 0))
+            sock.listen(0)
+            port = sock.getsockname()[1]
+            self.keep.append(sock)
+            for _ in range(8):
+                filler = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                filler.setblocking(False)
+                try:
+                    filler.connect(("127.0.0.1", port))
+                except BlockingIOError:
+                    pass
+                self.keep.append(filler)
+            return port
+
+        if category in ("http", "slow_http"):
+            delay = self.http_delay if category == "slow_http" else 0.0
+
+            async def handle_http(reader, writer):
+                try:
+                    await reader.readuntil(b"\r\n\r\n")
+                    if delay:
+                        await asyncio.sleep(delay)
+                    writer.write(b"HTTP/1.1 204 No Content\r\nConnection: close\r\n\r\n")
+                    await writer.drain()
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    pass
+                finally:
+                    writer.close()
+
+            server = await asyncio.start_server(handle_http, "127.0.0.1", 0, backlog=4096)
+            self.keep.append(server)
+            return server.sockets[0].getsockname()[1]
+
+        if category in ("tls", "slow_tls"):
+            if self.tls_context is None:
+                self.tls_context = _make_tls_context()
+            delay = self.tls_delay if category == "slow_tls" else 0.0
+            sock = _listen()
+            self.keep.append(sock)
+            self.keep.append(asyncio.create_task(self._tls_accept_loop(sock, delay)))
+            return sock.getsockname()[1]
+
+        if category == "tls_fail":
+            async def handle_close(reader, writer):
+                writer.close()
+
+            server = await asyncio.start_server(handle_close, "127.0.0.1", 0, backlog=4096)
+            self.keep.append(server)
+            return server.sockets[0].getsockname()[1]
+
+        raise ValueError(f"未知的节点类型: {category}")
+
+    async def _tls_accept_loop(self, listener: socket.socket, delay: float):
+        loop = asyncio.get_event_loop()
+        while True:
+            conn, _ = await loop.sock_accept(listener)
+            asyncio.create_task(self._tls_handshake(conn, delay))
+
+    async def _tls_handshake(self, conn: socket.socket, delay: float):
+        """延迟 delay 秒后在已接受的连接上完成服务端 TLS 握手"""
+        loop = asyncio.get_event_loop()
+        if delay:
+            await asyncio.sleep(delay)
+        try:
+            transport, _ = await loop.connect_accepted_socket(
+                asyncio.Protocol, conn, ssl=self.tls_context
+            )
+            await asyncio.sleep(1.0)
+            transport.close()
+        except (ssl.SSLError, ConnectionError, OSError):
+            conn.close()
+
+
+def _serve_endpoints(plan: List[Tuple[str, int]], http_delay: float, tls_delay: float, pipe):
+    """子进程入口：创建模拟节点，把 (类型, 端口) 列表发回父进程，等待结束信号"""
+    async def run():
+        endpoints = FakeEndpoints(http_delay, tls_delay)
+        created = []
+        for category, count in plan:
+            for _ in range(count):
+                created.append((category, await endpoints.create(category)))
+        pipe.send(created)
+        await asyncio.get_event_loop().run_in_executor(None, pipe.recv)
+
+    asyncio.run(run())
+
+
+# ==================== 检测端 ====================
+
+def _count_fds() -> int:
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return 0
+
+
+def _build_nodes(endpoints: List[Tuple[str, int]]) -> List[Dict]:
+    nodes = []
+    for i, (category, port) in enumerate(endpoints):
+        protocol, tls, _ = CATEGORIES[category]
+        link = f"trojan://bench@127.0.0.1:{port}?sni=bench.local" if tls else ""
+        nodes.append({
+            "id": f"{category}-{i}",
+            "host": "127.0.0.1",
+            "port": port,
+            "protocol": protocol,
+            "link": link,
+            "category": category
+        })
+    return nodes
+
+
+async def _run_checker(nodes: List[Dict], args) -> Dict:
+    limiter = AdaptiveLimiter(
+        initial=config.HEALTH_CHECK_INITIAL_CONCURRENCY,
+        min_limit=config.HEALTH_CHECK_MIN_CONCURRENCY,
+        max_limit=args.max_concurrency
+    )
+    checker = LightweightHealthChecker(
+        tcp_timeout=args.tcp_timeout,
+        http_timeout=args.http_timeout,
+        limiter=limiter,
+        retry_policy=RetryPolicy(
+            max_retries=args.retries,
+            node_deadline=config.HEALTH_CHECK_NODE_DEADLINE_SECONDS
+        ),
+        tcp_engine=args.engine
+    )
+    stats = HealthCheckStats(total=len(nodes))
+
+    baseline_fds = _count_fds()
+    peak_fds = baseline_fds
+
+    async def sample_fds():
+        nonlocal peak_fds
+        while True:
+            peak_fds = max(peak_fds, _count_fds())
+            await asyncio.sleep(0.02)
+
+    lag_monitor = LoopLagMonitor(interval=0.05, log_stalls=False)
+    lag_monitor.start()
+    sampler = asyncio.create_task(sample_fds())
+
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    async with checker:
+        results = await checker.check_nodes_batch(nodes, stats=stats)
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    sampler.cancel()
+    await asyncio.gather(sampler, return_exceptions=True)
+    await lag_monitor.stop()
+
+    for result in results:
+        stats.record(result)
+
+    # 状态判定准确率
+    by_category: Dict[str, Dict] = {}
+    for node, result in zip(nodes, results):
+        category = node["category"]
+        expected = CATEGORIES[category][2]
+        entry = by_category.setdefault(category, {
+            "expected": expected, "total": 0, "correct": 0, "actual": {}, "examples": []
+        })
+        entry["total"] += 1
+        actual = result.status.value
+        entry["actual"][actual] = entry["actual"].get(actual, 0) + 1
+        if actual == expected:
+            entry["correct"] += 1
+        elif len(entry["examples"]) < 3:
+            entry["examples"].append({"status": actual, "error": result.error_message})
+    correct = sum(e["correct"] for e in by_category.values())
+    for entry in by_category.values():
+        entry["accuracy"] = round(entry["correct"] / entry["total"] * 100, 2)
+
+    return {
+        "wall_seconds": round(wall, 3),
+        "cpu_seconds": round(cpu, 3),
+        "nodes_per_second": round(len(nodes) / wall, 1) if wall else None,
+        "probes_per_second": round(stats.probes / wall, 1) if wall else None,
+        "probes": stats.probes,
+        "fd_baseline": baseline_fds,
+        "fd_peak": peak_fds,
+        "accuracy": round(correct / len(nodes) * 100, 2) if nodes else None,
+        "categories": by_category,
+        "timings": stats.timing_summary(),
+        "concurrency": limiter.snapshot(),
+        "loop_lag": lag_monitor.snapshot()
+    }
+
+
+def _parse_mix(mix: str, total: int) -> List[Tuple[str, int]]:
+    weights = {}
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in CATEGORIES:
+            raise SystemExit(f"未知的节点类型: {name}（可选: {', '.join(CATEGORIES)}）")
+        weights[name] = float(weight or 1)
+    scale = sum(weights.values())
+    return [(name, max(1, round(total * weight / scale))) for name, weight in weights.items()]
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=root_dir, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="健康检测基准测试")
+    parser.add_argument("--nodes", type=int, default=2000, help="模拟节点总数")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="节点类型比例，如 tcp=0.5,refused=0.5")
+    parser.add_argument("--http-delay", type=float, default=200, help="slow_http 响应延迟（毫秒）")
+    parser.add_argument("--tls-delay", type=float, default=200, help="slow_tls 握手延迟（毫秒）")
+    parser.add_argument("--tcp-timeout", type=float, default=1.0, help="TCP 超时（秒）")
+    parser.add_argument("--http-timeout", type=float, default=2.0, help="HTTP 超时（秒）")
+    parser.add_argument("--retries", type=int, default=config.HEALTH_CHECK_MAX_RETRIES, help="最大重试次数")
+    parser.add_argument("--max-concurrency", type=int, default=config.HEALTH_CHECK_MAX_CONCURRENCY, help="并发上限")
+    parser.add_argument("--engine", default=config.HEALTH_CHECK_TCP_ENGINE, help="TCP 探测引擎: stream / socket / auto")
+    parser.add_argument("--output", default=None, help="结果 JSON 路径（默认 health_bench_<时间>.json）")
+    args = parser.parse_args()
+
+    plan = _parse_mix(args.mix, args.nodes)
+    loop_name = install_event_loop_policy()
+
+    context = multiprocessing.get_context("spawn")
+    parent_pipe, child_pipe = context.Pipe()
+    server = context.Process(
+        target=_serve_endpoints,
+        args=(plan, args.http_delay / 1000, args.tls_delay / 1000, child_pipe),
+        daemon=True
+    )
+    server.start()
+    try:
+        endpoints = parent_pipe.recv()
+        nodes = _build_nodes(endpoints)
+        print(f"🧪 {len(nodes)} 个模拟节点: {dict(plan)}（事件循环: {loop_name}，引擎: {args.engine}）")
+        result = asyncio.run(_run_checker(nodes, args))
+    finally:
+        parent_pipe.send("stop")
+        server.join(timeout=5)
+        if server.is_alive():
+            server.terminate()
+
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "revision": _git_revision(),
+        "params": {
+            "nodes": len(nodes),
+            "mix": dict(plan),
+            "http_delay_ms": args.http_delay,
+            "tls_delay_ms": args.tls_delay,
+            "tcp_timeout": args.tcp_timeout,
+            "http_timeout": args.http_timeout,
+            "retries": args.retries,
+            "max_concurrency": args.max_concurrency,
+            "engine": args.engine,
+            "event_loop": loop_name
+        },
+        **result
+    }
+
+    output = args.output or f"health_bench_{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    with open(output, "w") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(
+        f"⏱️  {result['wall_seconds']}s, {result['nodes_per_second']} 节点/秒, "
+        f"{result['probes_per_second']} 探测/秒, fd 峰值 {result['fd_peak']}（基线 {result['fd_baseline']}）"
+    )
+    print(f"🎯 判定准确率 {result['accuracy']}%")
+    for category, entry in result["categories"].items():
+        print(f"   {category:>10}: {entry['accuracy']:>6}%  {entry['actual']}")
+    print(f"📄 结果已写入 {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Webhook 请求体读取基准测试：整体读取（decode + json.loads）vs 流式读取（read_webhook_body + parse_webhook_nodes）
+
+生成 --nodes 个节点的推送，按 --chunk 字节分块模拟请求体到达，
+分别测量未压缩、gzip、zstd（已安装 zstandard 时）三种编码下的耗时和内存峰值（tracemalloc）。
+
+用法:
+    python scripts/bench_webhook_body.py --nodes 50000 --chunk 65536 --rounds 3
+"""
+
+import argparse
+import asyncio
+import gzip
+import hashlib
+import hmac
+import json
+import os
+import sys
+import time
+import tracemalloc
+import zlib
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if root_dir not in sys.path:
+    sys.path.insert(0, root_dir)
+
+from backend.webhooks.body import parse_webhook_nodes, read_webhook_body, zstandard
+
+SECRET = b"bench-secret"
+TIMESTAMP = "1700000000"
+
+
+def build_payload(count: int) -> bytes:
+    nodes = [
+        {
+            "protocol": "vmess",
+            "host": f"node-{i}.example.com",
+            "port": 10000 + i % 50000,
+            "name": f"🇺🇸 美国节点 {i}",
+            "country": "US",
+            "link": f"vmess://{hashlib.sha1(str(i).encode()).hexdigest() * 4}",
+            "is_free": i % 3 == 0,
+            "mainland_score": i % 100,
+            "mainland_latency": 100 + i % 400,
+            "overseas_score": (i * 7) % 100,
+            "overseas_latency": 50 + i % 300
+        }
+        for i in range(count)
+    ]
+    return json.dumps({"source": "spiderflow", "count": count, "nodes": nodes}, ensure_ascii=False).encode()
+
+
+def encode(payload: bytes, encoding: str) -> bytes:
+    if encoding == "gzip":
+        return gzip.compress(payload, compresslevel=6)
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(payload)
+    return payload
+
+
+def legacy_read(body: bytes, encoding: str) -> int:
+    """原实现：完整请求体 → 解压 → 解码为 str → 拼接签名串 → json.loads"""
+    if encoding == "gzip":
+        body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+    elif encoding == "zstd":
+        body = zstandard.ZstdDecompressor().decompress(body)
+    payload_str = body.decode("utf-8")
+    message = f"{payload_str}{TIMESTAMP}".encode()
+    hmac.new(SECRET, message, hashlib.sha256).hexdigest()
+    return len(json.loads(payload_str).get("nodes", []))
+
+
+async def stream_read(body: bytes, encoding: str, chunk: int) -> int:
+    """新实现：按块到达，分步解压、增量 HMAC，验证签名后增量解析"""
+    async def chunks():
+        view = memoryview(body)
+        for i in range(0, len(body), chunk):
+            yield bytes(view[i:i + chunk])
+
+    mac = hmac.new(SECRET, digestmod=hashlib.sha256)
+    result = await read_webhook_body(chunks(), encoding, mac=mac, max_bytes=1 << 30)
+    mac.update(TIMESTAMP.encode())
+    mac.hexdigest()
+    nodes, _ = await parse_webhook_nodes(result.payload)
+    return len(nodes)
+
+
+def measure(fn, rounds: int):
+    """返回 (最佳耗时秒, 内存峰值 MB, 节点数)；计时与内存分开测，避免 tracemalloc 影响耗时"""
+    best = float("inf")
+    count = 0
+    for _ in range(rounds):
+        start = time.perf_counter()
+        count = fn()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak / 1024 / 1024, count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Webhook 请求体读取基准测试")
+    parser.add_argument("--nodes", type=int, default=50000, help="节点数")
+    parser.add_argument("--chunk", type=int, default=64 * 1024, help="请求体分块大小（字节）")
+    parser.add_argument("--rounds", type=int, default=3, help="每项测试轮数（取最快一次）")
+    args = parser.parse_args()
+
+    payload = build_payload(args.nodes)
+    print(f"📦 推送: {args.nodes} 个节点, JSON {len(payload) / 1024 / 1024:.1f}MB, 分块 {args.chunk // 1024}KB")
+
+    encodings = ["identity", "gzip"] + (["zstd"] if zstandard is not None else [])
+    if zstandard is None:
+        print("ℹ️  未安装 zstandard，跳过 zstd")
+
+    loop = asyncio.new_event_loop()
+    try:
+        for encoding in encodings:
+            body = encode(payload, encoding)
+            print(f"\n{encoding}: 请求体 {len(body) / 1024 / 1024:.1f}MB")
+            results = {
+                "legacy": measure(lambda: legacy_read(body, encoding), args.rounds),
+                "stream": measure(lambda: loop.run_until_complete(stream_read(body, encoding, args.chunk)), args.rounds)
+            }
+            for name, (elapsed, peak_mb, count) in results.items():
+                print(f"  {name:>6}: {elapsed * 1000:7.1f}ms, 内存峰值 {peak_mb:7.1f}MB, 节点 {count}")
+    finally:
+        loop.close()
+
+
+if __name__ == "__main__":
+    main()
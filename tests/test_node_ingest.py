@@ -0,0 +1,197 @@
+"""
+Webhook 入库：指纹差量、墓碑分批与比例保护、乱序快照丢弃
+"""
+
+import asyncio
+from typing import Any, List, Optional, Tuple
+from urllib.parse import quote
+
+import pytest
+
+from backend.services.node_catalogue import NodeCatalogue
+from backend.services.node_fingerprints import FingerprintStore
+from backend.services.node_ingest import CatalogueNotReadyError, NodeIngestor
+
+
+class RecordingIngestor(NodeIngestor):
+    """不访问 Supabase：记录每次请求，按 fail 返回失败"""
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("catalogue", _loaded_catalogue())
+        kwargs.setdefault("fingerprints", FingerprintStore())
+        kwargs.setdefault("retry_backoff", 0)
+        super().__init__("http://supabase.test", "key", **kwargs)
+        self.requests: List[Tuple[str, str, Any]] = []
+        self.fail = False
+
+    async def _send(self, session, method: str, query: str, payload: Any) -> Tuple[bool, bool]:
+        self.requests.append((method, query, payload))
+        return (False, False) if self.fail else (True, False)
+
+    def take(self, method: Optional[str] = None) -> List[Tuple[str, str, Any]]:
+        requests = [r for r in self.requests if method is None or r[0] == method]
+        self.requests = []
+        return requests
+
+
+def _loaded_catalogue() -> NodeCatalogue:
+    catalogue = NodeCatalogue()
+    catalogue.replace([], complete=True)
+    return catalogue
+
+
+def _node(i: int, **overrides) -> dict:
+    node = {
+        "protocol": "vmess",
+        "host": f"h{i}.example.com",
+        "port": 443,
+        "name": f"node {i}",
+        "country": "US",
+        "link": f"vmess://{i}",
+        "mainland_score": 50
+    }
+    node.update(overrides)
+    return node
+
+
+def _ingested_id(ingestor: NodeIngestor, i: int) -> str:
+    return ingestor.node_id(NodeIngestor.validate([_node(i)])[0][0])
+
+
+def _ingest(ingestor: NodeIngestor, nodes: List[dict], snapshot_ts: Optional[float] = None):
+    return asyncio.run(ingestor.ingest(nodes, snapshot_ts=snapshot_ts))
+
+
+# ==================== 差量 ====================
+
+def test_only_new_and_changed_nodes_are_written():
+    ingestor = RecordingIngestor(batch_size=2)
+    nodes = [_node(i) for i in range(5)]
+
+    stats = _ingest(ingestor, nodes)
+    posts = ingestor.take("POST")
+    assert (stats.inserted, stats.changed, stats.unchanged, stats.written) == (5, 0, 0, 5)
+    assert [len(payload) for _, _, payload in posts] == [2, 2, 1]
+
+    stats = _ingest(ingestor, nodes)
+    assert (stats.inserted, stats.changed, stats.unchanged, stats.written) == (0, 0, 5, 0)
+    assert ingestor.take() == []
+
+    nodes[3] = _node(3, mainland_score=90)
+    stats = _ingest(ingestor, nodes)
+    posts = ingestor.take("POST")
+    assert (stats.changed, stats.unchanged, stats.written) == (1, 4, 1)
+    assert [row["mainland_score"] for _, _, payload in posts for row in payload] == [90]
+
+
+def test_failed_write_is_retried_on_next_push():
+    ingestor = RecordingIngestor(max_retries=0)
+    ingestor.fail = True
+    stats = _ingest(ingestor, [_node(1)])
+    assert (stats.failed, stats.written) == (1, 0)
+
+    ingestor.fail = False
+    ingestor.take()
+    stats = _ingest(ingestor, [_node(1)])
+    assert (stats.inserted, stats.written) == (1, 1)
+
+
+def test_invalid_and_duplicate_nodes_are_not_written():
+    ingestor = RecordingIngestor()
+    stats = _ingest(ingestor, [_node(1), _node(1), {"host": "missing-fields"}])
+    assert (stats.valid, stats.duplicates, stats.invalid, stats.written) == (1, 1, 1, 1)
+
+
+# ==================== 墓碑 ====================
+
+def test_tombstones_are_sent_in_small_batches():
+    ingestor = RecordingIngestor(tombstone_min_ratio=0, tombstone_batch_size=100)
+    _ingest(ingestor, [_node(i) for i in range(251)])
+    ingestor.take()
+
+    stats = _ingest(ingestor, [_node(0)])
+    patches = ingestor.take("PATCH")
+    assert stats.tombstoned == 250
+    assert len(patches) == 3
+    for _, query, payload in patches:
+        assert payload == {"status": "offline"}
+        ids = query[len("id=in.("):-1].split(",")
+        assert len(ids) <= 100
+        # 100 个 UUID 的 URL 远小于常见的 8KB 限制
+        assert len(quote(query, safe="=(),.")) < 8 * 1024
+    assert ingestor.catalogue.get(_ingested_id(ingestor, 5))["status"] == "offline"
+
+
+def test_tombstone_skipped_when_push_is_too_small():
+    ingestor = RecordingIngestor(tombstone_min_ratio=0.5)
+    _ingest(ingestor, [_node(i) for i in range(10)])
+    ingestor.take()
+
+    stats = _ingest(ingestor, [_node(i) for i in range(4)])
+    assert stats.tombstoned == 0
+    assert ingestor.take("PATCH") == []
+
+    stats = _ingest(ingestor, [_node(i) for i in range(5)])
+    assert stats.tombstoned == 5
+    assert len(ingestor.take("PATCH")) == 1
+
+
+def test_tombstoned_node_is_revived():
+    ingestor = RecordingIngestor(tombstone_min_ratio=0)
+    _ingest(ingestor, [_node(1), _node(2)])
+    _ingest(ingestor, [_node(1)])
+    ingestor.take()
+
+    stats = _ingest(ingestor, [_node(1), _node(2)])
+    posts = ingestor.take("POST")
+    assert stats.changed == 1
+    assert [row.get("status") for _, _, payload in posts for row in payload] == ["online"]
+
+
+def test_delete_mode_removes_rows():
+    ingestor = RecordingIngestor(tombstone_min_ratio=0, tombstone_mode="delete")
+    _ingest(ingestor, [_node(1), _node(2)])
+    ingestor.take()
+
+    stats = _ingest(ingestor, [_node(1)])
+    assert stats.tombstoned == 1
+    assert [method for method, _, _ in ingestor.take()] == ["DELETE"]
+    assert len(ingestor.fingerprints) == 1
+
+
+# ==================== 快照顺序与目录 ====================
+
+def test_out_of_order_snapshot_is_dropped():
+    ingestor = RecordingIngestor(tombstone_min_ratio=0)
+    _ingest(ingestor, [_node(1), _node(2)], snapshot_ts=200)
+    ingestor.take()
+
+    stats = _ingest(ingestor, [_node(1)], snapshot_ts=100)
+    assert stats.stale
+    assert ingestor.take() == []
+    assert ingestor.fingerprints.live == 2
+
+    stats = _ingest(ingestor, [_node(1)], snapshot_ts=300)
+    assert not stats.stale and stats.tombstoned == 1
+    assert ingestor.last_snapshot_ts == 300
+
+
+def test_concurrent_snapshots_are_serialised():
+    ingestor = RecordingIngestor(tombstone_min_ratio=0)
+
+    async def run():
+        return await asyncio.gather(
+            ingestor.ingest([_node(i) for i in range(3)], snapshot_ts=10),
+            ingestor.ingest([_node(0)], snapshot_ts=20)
+        )
+
+    first, second = asyncio.run(run())
+    assert (first.inserted, second.tombstoned) == (3, 2)
+    assert ingestor.fingerprints.live == 1
+
+
+def test_ingest_waits_for_catalogue():
+    ingestor = RecordingIngestor(catalogue=NodeCatalogue(), catalogue_wait=0)
+    with pytest.raises(CatalogueNotReadyError):
+        _ingest(ingestor, [_node(1)])
+    assert ingestor.take() == []
@@ -0,0 +1,190 @@
+"""
+Webhook 请求体：分步解压的大小限制、增量 HMAC、nodes 增量解析
+"""
+
+import asyncio
+import gzip
+import hashlib
+import hmac
+import json
+import random
+import zlib
+
+import pytest
+
+from backend.webhooks.body import (
+    NodesStreamParser,
+    WebhookBodyError,
+    parse_webhook_nodes,
+    read_webhook_body
+)
+
+SECRET = b"test-secret"
+LIMIT = 1024 * 1024
+
+
+def _gzip(data: bytes) -> bytes:
+    return gzip.compress(data)
+
+
+def _deflate(data: bytes) -> bytes:
+    return zlib.compress(data)
+
+
+def _zstd(data: bytes) -> bytes:
+    zstandard = pytest.importorskip("zstandard")
+    return zstandard.ZstdCompressor().compress(data)
+
+
+ENCODERS = {
+    "identity": lambda data: data,
+    "gzip": _gzip,
+    "deflate": _deflate,
+    "zstd": _zstd
+}
+
+
+def _payload(count: int = 200) -> bytes:
+    nodes = [
+        {"protocol": "vmess", "host": f"h{i}.example.com", "port": 443, "name": f"节点 {i}", "country": "US"}
+        for i in range(count)
+    ]
+    return json.dumps({"source": "spiderflow", "nodes": nodes}, ensure_ascii=False).encode()
+
+
+def _read(body: bytes, encoding: str, max_bytes: int = LIMIT, chunk: int = 4096, mac=None):
+    async def chunks():
+        for i in range(0, len(body), chunk):
+            yield body[i:i + chunk]
+
+    return asyncio.run(read_webhook_body(chunks(), encoding, mac=mac, max_bytes=max_bytes))
+
+
+def _bomb(encoding: str, size: int = 64 * 1024 * 1024) -> bytes:
+    """size 字节的 0 压缩后的请求体（gzip / deflate 约 64KB，zstd 约 2KB）"""
+    if encoding == "zstd":
+        return _zstd(bytes(size))
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 31 if encoding == "gzip" else zlib.MAX_WBITS)
+    block = bytes(1024 * 1024)
+    return b"".join(compressor.compress(block) for _ in range(size // len(block))) + compressor.flush()
+
+
+# ==================== 解压与 HMAC ====================
+
+@pytest.mark.parametrize("encoding", list(ENCODERS))
+def test_round_trip_and_hmac(encoding):
+    raw = _payload()
+    mac = hmac.new(SECRET, digestmod=hashlib.sha256)
+    body = _read(ENCODERS[encoding](raw), encoding, mac=mac)
+
+    assert bytes(body.payload) == raw
+    assert body.decoded_bytes == len(raw)
+    assert mac.hexdigest() == hmac.new(SECRET, raw, hashlib.sha256).hexdigest()
+
+
+@pytest.mark.parametrize("encoding", list(ENCODERS))
+def test_exact_limit_accepted_and_one_byte_over_rejected(encoding):
+    raw = _payload()
+    encoded = ENCODERS[encoding](raw)
+
+    assert _read(encoded, encoding, max_bytes=len(raw)).decoded_bytes == len(raw)
+    with pytest.raises(WebhookBodyError) as exc:
+        _read(encoded, encoding, max_bytes=len(raw) - 1)
+    assert exc.value.status_code == 413
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "deflate", "zstd"])
+def test_decompression_bomb_stops_at_limit(encoding, monkeypatch):
+    from backend.webhooks import body as body_module
+
+    # 记录写入缓冲区的最大累计量：超出预算后不应再解压下一步
+    largest = []
+    original_write = body_module._DecodedSink.write
+
+    def tracking_write(self, data):
+        written = original_write(self, data)
+        largest.append(len(self.buffer))
+        return written
+
+    monkeypatch.setattr(body_module._DecodedSink, "write", tracking_write)
+    with pytest.raises(WebhookBodyError) as exc:
+        _read(_bomb(encoding), encoding, max_bytes=LIMIT, chunk=65536)
+    assert exc.value.status_code == 413
+    assert max(largest) <= LIMIT
+
+
+def test_compressed_size_is_capped():
+    with pytest.raises(WebhookBodyError) as exc:
+        _read(bytes(LIMIT + 1), "identity", max_bytes=LIMIT)
+    assert exc.value.status_code == 413
+
+
+def test_unsupported_encoding():
+    with pytest.raises(WebhookBodyError) as exc:
+        _read(b"{}", "br")
+    assert exc.value.status_code == 415
+
+
+def test_corrupt_gzip():
+    with pytest.raises(WebhookBodyError) as exc:
+        _read(b"not gzip at all", "gzip")
+    assert exc.value.status_code == 400
+
+
+# ==================== 解析 ====================
+
+def test_parse_matches_json_loads_for_any_chunk_size():
+    raw = _payload(500)
+    expected = json.loads(raw)
+    for chunk_size in (1, 7, 100, 4096, len(raw)):
+        nodes, meta = asyncio.run(parse_webhook_nodes(raw, chunk_size=chunk_size))
+        assert nodes == expected["nodes"]
+        assert meta == {"source": "spiderflow"}
+
+
+def test_parser_split_at_every_position():
+    text = '{"count": 123, "nodes": [{"a": "节点"}, 4.5e1, true, null, "x\\"y"], "tail": [1, {"b": []}]}'
+    expected = json.loads(text)
+    for split in range(len(text) + 1):
+        parser = NodesStreamParser()
+        nodes = parser.feed(text[:split]) + parser.feed(text[split:]) + parser.close()
+        assert nodes == expected["nodes"]
+        assert parser.meta == {"count": 123, "tail": [1, {"b": []}]}
+
+
+def test_parser_random_splits():
+    text = _payload(300).decode()
+    expected = json.loads(text)["nodes"]
+    rng = random.Random(0)
+    for _ in range(20):
+        parser = NodesStreamParser()
+        nodes, pos = [], 0
+        while pos < len(text):
+            step = rng.randint(1, 500)
+            nodes += parser.feed(text[pos:pos + step])
+            pos += step
+        assert nodes + parser.close() == expected
+
+
+@pytest.mark.parametrize("text", [
+    '{"nodes": [1],}',
+    '{"nodes": [1,]}',
+    '{"a": 1,}',
+    '{"nodes": {}}',
+    '{"nodes": [1 2]}',
+    '{"a" 1}',
+    '[1]',
+    '{"nodes": [1]} x',
+    '{"nodes": [1]',
+    '{"nodes": [tru]}'
+])
+def test_parser_rejects_malformed(text):
+    parser = NodesStreamParser()
+    with pytest.raises(WebhookBodyError):
+        parser.feed(text)
+        parser.close()
+
+
+def test_invalid_utf8():
+    with pytest.raises(WebhookBodyError):
+        asyncio.run(parse_webhook_nodes(b'{"nodes": ["\xff"]}'))